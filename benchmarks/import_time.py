@@ -0,0 +1,64 @@
+"""
+Import time budget of the modules used by short lived scripts.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 150 --repeat 5
+
+Run from the repository root. Each module is imported in a fresh interpreter with -X importtime, the
+best of --repeat runs is compared with the budget, and heavy dependencies that were imported eagerly are
+reported. Exits with status 1 when a module is over budget or imports one of them. The test suite runs the
+same check, see tests/test_import_time.py.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+MODULES = ["src.twitter_queries", "src.tweet_data_processor"]
+BUDGET_MS = 150.0
+# Only imported when a query, connection or scheduler needs them
+HEAVY = ["pandas", "numpy", "pymongo", "neo4j", "mysql.connector", "apscheduler", "pyarrow", "yaml"]
+
+
+def measure(module: str) -> Tuple[float, List[str]]:
+    """
+    Function to import a module in a fresh interpreter
+    Args:
+        module: Module to be imported
+    Returns: Cumulative import time in milliseconds and the heavy dependencies it imported
+    """
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                            check=True, env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    total_us = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[2].strip() == module:
+            total_us = int(parts[1])
+    return total_us / 1000, [m for m in result.stdout.strip().split(",") if m]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="maximum import time per module")
+    parser.add_argument("--repeat", type=int, default=3, help="imports per module, the fastest one counts")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args(argv)
+
+    failed = False
+    results: Dict[str, float] = {}
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        results[module] = min(ms for ms, _ in runs)
+        heavy = runs[0][1]
+        over = results[module] > args.budget_ms
+        failed = failed or over or bool(heavy)
+        print(f"{module:<30}{results[module]:>8.1f} ms{'  OVER BUDGET' if over else ''}"
+              f"{'  imports ' + ', '.join(heavy) if heavy else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Load test of the HTTP API, served by `python main.py serve` in a subprocess, against the embedded backend by default
+so that no database is needed.
+
+    python -m benchmarks.load_test --tweets 20000 --clients 32 --duration 30
+    python -m benchmarks.load_test --config benchmarks/config.local.yml  # against the containers
+
+Run from the repository root. The stores are reset and synthetic tweets ingested first (skip with --no-ingest).
+Clients keep their connections open, ask for gzip and send If-None-Match for a share of the requests, as
+dashboards refreshing the same panels do. Users and hashtags are drawn from the Zipf distributions of the data.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+from urllib.parse import quote
+
+from benchmarks.run import BENCHMARK_CONFIG, DATA_DIR, bench_ingest, reset_stores, summarize
+from benchmarks.synthetic import SyntheticTweetGenerator, ZipfSampler
+
+EMBEDDED_CONFIG = os.path.join(os.path.dirname(__file__), "config.embedded.yml")
+
+
+def request_mix(generator: SyntheticTweetGenerator, user_sampler: ZipfSampler,
+                hashtag_sampler: ZipfSampler) -> List[Tuple[str, str]]:
+    """
+    Function to draw one request per endpoint
+    Returns: (endpoint, path) pairs
+    """
+    user = generator.users[user_sampler.sample()[0]]
+    hashtag = quote(generator.hashtags[hashtag_sampler.sample()[0]])
+    first_name = quote(user["name"].split()[0])
+    user_id = user["id_str"]
+    return [
+        ("users_by_name", f"/users?name={quote(user['name'])}"),
+        ("search_users", f"/users/search?term={first_name}&limit=50"),
+        ("user", f"/users/{user_id}"),
+        ("user_tweets", f"/users/{user_id}/tweets?limit=50"),
+        ("relevant_users", f"/users/{user_id}/relevant-users"),
+        ("relevant_tweets", f"/users/{user_id}/relevant-tweets"),
+        ("search_tweets", "/tweets/search?keyword=death&limit=50"),
+        ("popular_tweets", "/tweets/popular"),
+        ("trending_hashtags", "/hashtags/trending"),
+        ("hashtag_tweets", f"/hashtags/{hashtag}/tweets"),
+        ("rollups", "/rollups?group_by=hour"),
+    ]
+
+
+def client(host: str, port: int, generator: SyntheticTweetGenerator, seed: int, deadline: float,
+           revalidate_share: float, results: Dict[str, List], statuses: Counter, lock: threading.Lock) -> None:
+    rng = random.Random(seed)
+    user_sampler = ZipfSampler(len(generator.users), 1.1, rng)
+    hashtag_sampler = ZipfSampler(len(generator.hashtags), 1.1, rng)
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    etags = {}
+    latencies = defaultdict(list)
+    codes = Counter()
+    while time.time() < deadline:
+        endpoint, path = rng.choice(request_mix(generator, user_sampler, hashtag_sampler))
+        headers = {"Accept-Encoding": "gzip"}
+        if path in etags and rng.random() < revalidate_share:
+            headers["If-None-Match"] = etags[path]
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+            codes[(endpoint, "error")] += 1
+            continue
+        latencies[endpoint].append((time.perf_counter() - start) * 1000)
+        codes[(endpoint, response.status)] += 1
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    conn.close()
+    with lock:
+        for endpoint, samples in latencies.items():
+            results[endpoint].extend(samples)
+        statuses.update(codes)
+
+
+def wait_until_up(host: str, port: int, server: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start in {timeout}s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tweets", type=int, default=20000, help="number of synthetic tweets to ingest")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--config", default=EMBEDDED_CONFIG, help=f"config of the stores, e.g. {BENCHMARK_CONFIG}")
+    parser.add_argument("--no-ingest", action="store_true", help="serve the stores as they are")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent connections")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--revalidate-share", type=float, default=0.5,
+                        help="share of repeated requests sent with If-None-Match")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="server processes")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    os.environ["TWEETPRIME_CONFIG"] = args.config
+    os.makedirs(DATA_DIR, exist_ok=True)
+    generator = SyntheticTweetGenerator(seed=args.seed)
+    if not args.no_ingest:
+        file_path = os.path.join(DATA_DIR, f"tweets-{args.seed}-{args.tweets}.json")
+        generator.write(file_path, args.tweets)
+        reset_stores()
+        ingest = bench_ingest(file_path, args.tweets)
+        print(f"Ingested {args.tweets} tweets at {ingest['tweets_per_second']:.1f} tweets/s")
+
+    host = "127.0.0.1"
+    server = subprocess.Popen([sys.executable, "main.py", "serve", "--host", host, "--port", str(args.port),
+                               "--workers", str(args.workers)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(host, args.port, server)
+        results, statuses, lock = defaultdict(list), Counter(), threading.Lock()
+        deadline = time.time() + args.duration
+        threads = [threading.Thread(target=client, args=(host, args.port, generator, args.seed + i, deadline,
+                                                         args.revalidate_share, results, statuses, lock))
+                   for i in range(args.clients)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(len(samples) for samples in results.values())
+    summary = {"meta": {"clients": args.clients, "workers": args.workers, "duration": elapsed, "tweets": args.tweets, "seed": args.seed},
+               "requests_per_second": total / elapsed,
+               "endpoints": {endpoint: dict(summarize(samples),
+                                            statuses={str(status): count for (name, status), count in statuses.items()
+                                                      if name == endpoint})
+                             for endpoint, samples in sorted(results.items())}}
+    print(f"{total} requests in {elapsed:.1f}s, {summary['requests_per_second']:.1f} requests/s")
+    for endpoint, stats in summary["endpoints"].items():
+        print(f"{endpoint:<20} n {stats['n']:>6}  p50 {stats['p50']:7.1f}  p95 {stats['p95']:7.1f}  "
+              f"p99 {stats['p99']:7.1f} ms  {stats['statuses']}")
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(summary, fp, indent=2)
+    return 0 if not any(status == "error" or str(status).startswith("5") for _, status in statuses) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
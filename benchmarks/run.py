@@ -0,0 +1,202 @@
+"""
+Reproducible benchmark of ingest and queries against local stand-ins of the stores.
+
+    docker compose -f benchmarks/docker-compose.yml up -d
+    python -m benchmarks.run --tweets 20000 --output benchmarks/baseline.json
+    python -m benchmarks.run --tweets 20000 --baseline benchmarks/baseline.json
+    python -m benchmarks.run --tweets 20000 --config benchmarks/config.embedded.yml  # no containers needed
+
+Run from the repository root. Every run resets the stores, ingests the same synthetic tweets and then
+times each TwitterQueries method with cold (cleared) and warm caches.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.synthetic import SyntheticTweetGenerator
+
+BENCHMARK_CONFIG = os.path.join(os.path.dirname(__file__), "config.local.yml")
+DATA_DIR = os.path.join(os.path.dirname(__file__), ".data")
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Function to summarize latencies
+    Args:
+        samples: Latencies in milliseconds
+    Returns: Dictionary with mean, p50, p95 and p99
+    """
+    if len(samples) > 1:
+        q = statistics.quantiles(samples, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = samples[0]
+    return {"n": len(samples), "mean": statistics.fmean(samples), "p50": p50, "p95": p95, "p99": p99}
+
+
+def reset_stores() -> None:
+    """
+    Function to empty the benchmark stores, so that every run starts from the same state
+    """
+    from src import config
+    from src.connections import get_mongodb_conn, get_mysql_conn, get_neo4j_conn
+
+    for file_name in os.listdir(DATA_DIR):
+        if file_name.endswith(".pkl") or file_name.startswith("invalidation.log"):
+            os.remove(os.path.join(DATA_DIR, file_name))
+    if config.store_config["backend"] == "embedded":
+        shutil.rmtree(config.embedded_config["path"], ignore_errors=True)
+        return
+
+    mysql_conn = get_mysql_conn()
+    with mysql_conn.cursor() as cursor:
+        for table in ["users", "hashtag_dict", "tweet_hashtags", "tweet_rollups", "user_rollups"]:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    mysql_conn.commit()
+    mysql_conn.close()
+    for collection in ["tweet_data", "user_data"]:
+        get_mongodb_conn(collection=collection).drop()
+    get_neo4j_conn().execute_query("MATCH (n) DETACH DELETE n")
+
+
+def bench_ingest(file_path: str, n_tweets: int) -> Dict[str, float]:
+    from src.tweet_data_processor import TweetDataProcessor
+
+    processor = TweetDataProcessor()
+    start = time.perf_counter()
+    processor.process_data(file_path=file_path)
+    elapsed = time.perf_counter() - start
+    processor.trending_hashtags.save_trending_hashtags()
+    return {"tweets": n_tweets, "seconds": elapsed, "tweets_per_second": n_tweets / elapsed}
+
+
+def query_cases(generator: SyntheticTweetGenerator) -> List[Tuple[str, Callable]]:
+    # The most active users and most used hashtags, as drawn by the Zipf samplers
+    top_user = generator.users[0]
+    user_info = {user["id_str"]: user for user in generator.users[:5]}
+    first_name = top_user["name"].split()[0]
+    return [
+        ("get_user_data_by_username", lambda tq: tq.get_user_data_by_username(top_user["name"])),
+        ("get_user_data", lambda tq: tq.get_user_data(list(user_info))),
+        ("search_tweets_username", lambda tq: tq.search_tweets_username(user_info)),
+        ("search_and_sort_users", lambda tq: tq.search_and_sort_users(first_name)),
+        ("search_popular_tweets_based_on_engagement", lambda tq: tq.search_popular_tweets_based_on_engagement()),
+        ("search_tweets_by_keyword", lambda tq: tq.search_tweets_by_keyword("death")),
+        ("search_tweets_by_hashtag", lambda tq: tq.search_tweets_by_hashtag(generator.hashtags[0])),
+        ("get_relevant_users_by_user_id", lambda tq: tq.get_relevant_users_by_user_id(top_user["id_str"])),
+        ("get_relevant_tweets_by_user_id", lambda tq: tq.get_relevant_tweets_by_user_id(top_user["id_str"])),
+        ("get_trending_hashtags", lambda tq: tq.get_trending_hashtags()),
+        ("get_rollup_counts", lambda tq: tq.get_rollup_counts()),
+    ]
+
+
+def bench_queries(cases: List[Tuple[str, Callable]], repeat: int) -> Dict[str, Dict]:
+    from src.twitter_queries import TwitterQueries
+
+    tq = TwitterQueries()
+    caches = [tq.tweet_cache, tq.user_cache, tq.postings_cache]
+    results = {}
+    for name, call in cases:
+        cold, warm = [], []
+        for _ in range(repeat):
+            for cache in caches:
+                cache.clear()
+            start = time.perf_counter()
+            call(tq)
+            cold.append((time.perf_counter() - start) * 1000)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call(tq)
+            warm.append((time.perf_counter() - start) * 1000)
+        results[name] = {"cold": summarize(cold), "warm": summarize(warm)}
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> bool:
+    """
+    Function to print results next to a baseline
+    Args:
+        results: Results of this run
+        baseline: Results of a previous run
+        tolerance: Relative change above which a metric counts as a regression
+    Returns: Boolean flag indicating whether any metric regressed
+    """
+    rows = [("ingest tweets/s", baseline["ingest"]["tweets_per_second"], results["ingest"]["tweets_per_second"], True)]
+    for name, runs in results["queries"].items():
+        for run, stats in runs.items():
+            if name in baseline["queries"]:
+                rows.append((f"{name} {run} p95 ms", baseline["queries"][name][run]["p95"], stats["p95"], False))
+
+    regressed = False
+    print(f"{'metric':<60}{'baseline':>12}{'current':>12}{'change':>10}")
+    for metric, before, after, higher_is_better in rows:
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"{metric:<60}{before:>12.2f}{after:>12.2f}{change:>+10.1%}{flag}")
+    return regressed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tweets", type=int, default=20000, help="number of synthetic tweets to ingest")
+    parser.add_argument("--repeat", type=int, default=20, help="calls per query and cache state")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--retweet-share", type=float, default=0.4)
+    parser.add_argument("--quote-share", type=float, default=0.1)
+    parser.add_argument("--config", default=BENCHMARK_CONFIG, help="config with the stores to benchmark against")
+    parser.add_argument("--output", help="write results as JSON, e.g. to save a new baseline")
+    parser.add_argument("--baseline", help="results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change reported as a regression")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    # The config is read when src is first imported
+    os.environ["TWEETPRIME_CONFIG"] = args.config
+    os.makedirs(DATA_DIR, exist_ok=True)
+    import src.tweet_data_processor  # noqa: F401
+    import src.twitter_queries  # noqa: F401
+    # Imported lazily by src, imported here so that the first timed query does not pay for it
+    import pandas  # noqa: F401
+    # Logging is configured from logging.conf on first import, so the level is set afterwards
+    logging.getLogger().setLevel(args.log_level)
+
+    generator = SyntheticTweetGenerator(seed=args.seed, retweet_share=args.retweet_share,
+                                        quote_share=args.quote_share)
+    file_path = os.path.join(DATA_DIR, f"tweets-{args.seed}-{args.tweets}.json")
+    generator.write(file_path, args.tweets)
+
+    reset_stores()
+    results = {
+        "meta": {"tweets": args.tweets, "repeat": args.repeat, "seed": args.seed, "python": platform.python_version(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "ingest": bench_ingest(file_path, args.tweets),
+        "queries": bench_queries(query_cases(generator), args.repeat),
+    }
+    print(f"Ingested {args.tweets} tweets at {results['ingest']['tweets_per_second']:.1f} tweets/s")
+    for name, runs in results["queries"].items():
+        print(f"{name:<45} " + "  ".join(f"{run} p50 {s['p50']:.1f} p95 {s['p95']:.1f} p99 {s['p99']:.1f} ms"
+                                         for run, s in runs.items()))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fp:
+            if compare(results, json.load(fp), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import json
+import random
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Dict, Iterator, List
+
+FIRST_NAMES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy", "mallory",
+               "niaj", "olivia", "peggy", "rupert", "sybil", "trent", "victor", "walter", "zoe"]
+LAST_NAMES = ["smith", "jones", "brown", "taylor", "wilson", "davies", "evans", "thomas", "roberts", "walker"]
+WORDS = ["covid", "virus", "lockdown", "vaccine", "mask", "cases", "death", "hospital", "news", "world", "health",
+         "people", "home", "stay", "safe", "testing", "doctors", "nurses", "school", "work", "economy", "today",
+         "update", "government", "pandemic", "outbreak", "spread", "quarantine", "symptoms", "recovery"]
+HASHTAGS = ["corona", "coronavirus", "covid19", "covid_19", "stayhome", "lockdown", "socialdistancing", "pandemic",
+            "quarantine", "stayathome"]
+LANGS = ["en", "en", "en", "en", "es", "fr", "de", "it", "pt", "und"]
+
+TWITTER_DATETIME = '%a %b %d %H:%M:%S +0000 %Y'
+
+
+class ZipfSampler:
+    """
+    Samples indexes 0..n-1 with probability proportional to 1 / (rank + 1) ** s
+    """
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.population = range(n)
+        self.cum_weights = list(accumulate(1 / (rank + 1) ** s for rank in self.population))
+        self.rng = rng
+
+    def sample(self, k: int = 1) -> List[int]:
+        return self.rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+
+
+class SyntheticTweetGenerator:
+    """
+    Generates tweets in the Twitter API v1.1 format read by TweetDataProcessor, with Zipf distributed
+    users, hashtags and words and a configurable share of retweets, quotes and replies.
+    """
+
+    def __init__(self, n_users=10000, n_hashtags=2000, zipf_s=1.1, retweet_share=0.4, quote_share=0.1,
+                 reply_share=0.1, hashtag_share=0.3, seed=42, start=datetime(2024, 4, 1, tzinfo=timezone.utc)):
+        self.rng = random.Random(seed)
+        self.retweet_share = retweet_share
+        self.quote_share = quote_share
+        self.reply_share = reply_share
+        self.hashtag_share = hashtag_share
+        self.users = [self._user(i) for i in range(n_users)]
+        self.hashtags = HASHTAGS + [f"tag{i}" for i in range(max(n_hashtags - len(HASHTAGS), 0))]
+        self.user_sampler = ZipfSampler(len(self.users), zipf_s, self.rng)
+        self.hashtag_sampler = ZipfSampler(len(self.hashtags), zipf_s, self.rng)
+        self.word_sampler = ZipfSampler(len(WORDS), zipf_s, self.rng)
+        self.next_id = 1250000000000000000
+        self.now = start
+        # Recent original tweets that can be retweeted, quoted or replied to, most recent first
+        self.max_originals = 1000
+        self.originals = []
+        self.original_sampler = ZipfSampler(self.max_originals, zipf_s, self.rng)
+
+    def _user(self, i: int) -> Dict:
+        followers = int(self.rng.paretovariate(1.2) * 10)
+        return {
+            "id": 100000000 + i,
+            "id_str": str(100000000 + i),
+            "name": f"{self.rng.choice(FIRST_NAMES).title()} {self.rng.choice(LAST_NAMES).title()}",
+            "screen_name": f"user{i}",
+            "protected": False,
+            "verified": followers > 10000,
+            "followers_count": followers,
+            "friends_count": self.rng.randint(0, 2000),
+            "listed_count": self.rng.randint(0, 50),
+            "favourites_count": self.rng.randint(0, 10000),
+            "statuses_count": self.rng.randint(1, 50000),
+            "created_at": (datetime(2015, 1, 1) + timedelta(days=self.rng.randint(0, 3000))).strftime(TWITTER_DATETIME),
+        }
+
+    def _original(self) -> Dict:
+        self.next_id += self.rng.randint(1, 1 << 22)
+        self.now += timedelta(milliseconds=self.rng.randint(1, 200))
+        user = self.users[self.user_sampler.sample()[0]]
+        words = [WORDS[i] for i in self.word_sampler.sample(self.rng.randint(5, 20))]
+        hashtags = []
+        if self.rng.random() < self.hashtag_share:
+            hashtags = list(dict.fromkeys(self.hashtags[i] for i in self.hashtag_sampler.sample(self.rng.randint(1, 3))))
+        text = " ".join(words + [f"#{h}" for h in hashtags])
+        has_url = self.rng.random() < 0.2
+        has_geo = self.rng.random() < 0.01
+        return {
+            "created_at": self.now.strftime(TWITTER_DATETIME),
+            "id": self.next_id,
+            "id_str": str(self.next_id),
+            "text": text,
+            "user": dict(user),
+            "in_reply_to_status_id_str": None,
+            "in_reply_to_user_id_str": None,
+            "in_reply_to_screen_name": None,
+            "geo": None,
+            "coordinates": {"type": "Point", "coordinates": [-74.4, 40.5]} if has_geo else None,
+            "is_quote_status": False,
+            "quote_count": 0,
+            "reply_count": 0,
+            "retweet_count": 0,
+            "favorite_count": 0,
+            "entities": {
+                "hashtags": [{"text": h, "indices": [0, 0]} for h in hashtags],
+                "urls": [{"url": "https://t.co/x"}] if has_url else [],
+                "user_mentions": [],
+            },
+            "favorited": False,
+            "retweeted": False,
+            "filter_level": "low",
+            "lang": self.rng.choice(LANGS),
+        }
+
+    def _earlier(self) -> Dict:
+        # Popular tweets are more likely to be interacted with
+        original = self.originals[min(self.original_sampler.sample()[0], len(self.originals) - 1)]
+        for counter in ("retweet_count", "quote_count", "reply_count", "favorite_count"):
+            original[counter] += self.rng.randint(0, 3)
+        return deepcopy(original)
+
+    def tweet(self) -> Dict:
+        tweet = self._original()
+        if self.originals:
+            kind = self.rng.random()
+            if kind < self.retweet_share:
+                retweeted = self._earlier()
+                tweet["retweeted_status"] = retweeted
+                tweet["text"] = f"RT @{retweeted['user']['screen_name']}: {retweeted['text']}"
+                tweet["entities"] = retweeted["entities"]
+            elif kind < self.retweet_share + self.quote_share:
+                tweet["quoted_status"] = self._earlier()
+                tweet["is_quote_status"] = True
+            elif kind < self.retweet_share + self.quote_share + self.reply_share:
+                replied = self._earlier()
+                tweet["in_reply_to_status_id_str"] = replied["id_str"]
+                tweet["in_reply_to_user_id_str"] = replied["user"]["id_str"]
+                tweet["in_reply_to_screen_name"] = replied["user"]["screen_name"]
+        if "retweeted_status" not in tweet:
+            self.originals.insert(0, deepcopy({k: v for k, v in tweet.items() if k != "quoted_status"}))
+            del self.originals[self.max_originals:]
+        return tweet
+
+    def generate(self, n: int) -> Iterator[Dict]:
+        for _ in range(n):
+            yield self.tweet()
+
+    def write(self, file_path: str, n: int) -> None:
+        """
+        Function to write n tweets as newline delimited JSON, the format read by process_data
+        """
+        with open(file_path, 'w') as fp:
+            for tweet in self.generate(n):
+                fp.write(json.dumps(tweet))
+                fp.write("\n")
@@ -1,43 +1,101 @@
-from src.tweet_data_processor import TweetDataProcessor
-from src.twitter_queries import TwitterQueries
+"""
+Command line entry point
 
-# obj = TweetDataProcessor()
-# obj.process_data(file_path="/Users/rohitvernekar/Desktop/corona-out-2")
+    python main.py serve [--port 8000] [--workers 4]      # API, Swagger UI at /docs
+    python main.py ingest FILE                             # ingest a file of newline delimited tweets
+    python main.py follow PATH [--from-end]                # ingest the tweets appended to a file or directory
+    python main.py migrate                                 # update the data of older versions, once after upgrading
+    python main.py demo                                    # run each query once
+"""
+import argparse
+import signal
+import threading
 
-twitter_queries = TwitterQueries()
 
-user = twitter_queries.get_user_data_by_username("NUFF")
+def serve(args: argparse.Namespace) -> None:
+    from src.api import serve
 
-# Search for tweets by the user from the last week
-twitter_queries.search_tweets_username(user, '1week')
+    serve(host=args.host, port=args.port, workers=args.workers)
 
-twitter_queries.search_and_sort_users('bob', sort_by='followers_count', order='desc')
 
-twitter_queries.search_popular_tweets_based_on_engagement('1month')
+def ingest(args: argparse.Namespace) -> None:
+    from src.tweet_data_processor import TweetDataProcessor
 
-twitter_queries.search_tweets_by_keyword("death", '1week')
+    TweetDataProcessor().process_data(file_path=args.file)
 
-twitter_queries.get_relevant_users_by_user_id("10228272")
 
-twitter_queries.get_relevant_tweets_by_user_id("10228272")
+def follow(args: argparse.Namespace) -> None:
+    from src.metrics import start_metrics_server
+    from src.tweet_data_processor import TweetDataProcessor
 
-twitter_queries.get_trending_hashtags()
+    stop = threading.Event()
+    # Stopped between micro-flushes, so that everything read is flushed and checkpointed
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    # Exposes ingest_lag_seconds among the other metrics
+    start_metrics_server()
+    TweetDataProcessor().follow(args.path, from_end=args.from_end, stop=stop)
 
-# import time
-# from src.twitter_queries import TwitterQueries
-#
-#
-# def time_it(func, *args):
-#     start = time.time()
-#     res = func(*args)
-#     print("Time Taken:", time.time() - start)
-#     print(res)
-#
-#
-# tq = TwitterQueries()
-#
-# time_it(tq.get_trending_hashtags)
-#
-# time_it(tq.search_tweets_by_hashtag, "covid_19")
-#
-# time_it(tq.get_relevant_users_by_user_id, "10228272")
\ No newline at end of file
+
+def migrate(args: argparse.Namespace) -> None:
+    from src.store import get_store
+
+    get_store().migrate()
+
+
+def demo(args: argparse.Namespace) -> None:
+    from src.twitter_queries import TwitterQueries
+
+    twitter_queries = TwitterQueries()
+
+    user = twitter_queries.get_user_data_by_username("NUFF")
+
+    # Search for tweets by the user from the last week
+    twitter_queries.search_tweets_username(user, '1week')
+
+    twitter_queries.search_and_sort_users('bob', sort_by='followers_count', order='desc')
+
+    twitter_queries.search_popular_tweets_based_on_engagement('1month')
+
+    twitter_queries.search_tweets_by_keyword("death", '1week')
+
+    twitter_queries.get_relevant_users_by_user_id("10228272")
+
+    twitter_queries.get_relevant_tweets_by_user_id("10228272")
+
+    twitter_queries.get_trending_hashtags()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TweetPrime")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Serve the HTTP API")
+    serve_parser.add_argument("--host", help="Interface to listen on, api.host by default")
+    serve_parser.add_argument("--port", type=int, help="Port to listen on, api.port by default")
+    serve_parser.add_argument("--workers", type=int, help="Number of processes, api.workers by default")
+    serve_parser.set_defaults(func=serve)
+
+    ingest_parser = commands.add_parser("ingest", help="Ingest a file of newline delimited tweets")
+    ingest_parser.add_argument("file")
+    ingest_parser.set_defaults(func=ingest)
+
+    follow_parser = commands.add_parser("follow", help="Ingest the tweets appended to a file or directory until stopped")
+    follow_parser.add_argument("path", help="File, or directory of rotating files")
+    follow_parser.add_argument("--from-end", action="store_true",
+                               help="Skip the tweets written before starting instead of resuming from the checkpoint")
+    follow_parser.set_defaults(func=follow)
+
+    migrate_parser = commands.add_parser("migrate", help="Update the data written by older versions, once after "
+                                                         "upgrading")
+    migrate_parser.set_defaults(func=migrate)
+
+    demo_parser = commands.add_parser("demo", help="Run each query once")
+    demo_parser.set_defaults(func=demo)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
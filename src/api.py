@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+
+from src import config
+from src.invalidation import get_subscriber
+from src.lazy import lazy_import
+from src.log import get_logger
+from src.metrics import registry
+from src.store import BadRequest, NotFound
+from src.twitter_queries import TwitterQueries
+
+logger = get_logger(__name__)
+
+pd = lazy_import("pandas")
+
+TimeFrame = Optional[Literal["1day", "1week", "1month"]]
+MAX_LIMIT = 10000
+
+
+def to_json(result) -> bytes:
+    """
+    Function to serialize a query result, DataFrames are written by pandas without building a dict per row
+    Args:
+        result: DataFrame, or any JSON serializable value (dates and ObjectIds are written as strings)
+    Returns: JSON document
+    """
+    if isinstance(result, pd.DataFrame):
+        return result.to_json(orient="records", date_format="iso", default_handler=str).encode()
+    return json.dumps(result, default=str).encode()
+
+
+def first_chunk(frames) -> "pd.DataFrame":
+    """
+    Function to get the first DataFrame of a chunked result, the following pages are never fetched
+    """
+    for frame in frames:
+        return frame
+    return pd.DataFrame()
+
+
+class QueryRunner:
+    """
+    Runs TwitterQueries calls for the request handlers on a thread pool, at most api.max_concurrency (or the
+    endpoint's entry of api.limits) at once per endpoint, and answers If-None-Match requests from data versions
+    without running the query.
+    """
+
+    def __init__(self, queries: TwitterQueries):
+        self.queries = queries
+        self.executor = ThreadPoolExecutor(max_workers=config.api_config["threads"], thread_name_prefix="query")
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Versions are counted per process, ETags of another process must never match
+        self.instance = uuid.uuid4().hex
+
+    def semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        if endpoint not in self.semaphores:
+            limit = config.api_config["limits"].get(endpoint, config.api_config["max_concurrency"])
+            self.semaphores[endpoint] = asyncio.Semaphore(limit)
+        return self.semaphores[endpoint]
+
+    def etag(self, request: Request) -> str:
+        """
+        Function to get the ETag of the response to a request, from the data version of the queries. It also
+        changes every api.etag_window seconds, results over relative time frames change without any ingest.
+        """
+        window = int(time.time() // config.api_config["etag_window"])
+        params = sorted(request.query_params.multi_items())
+        key = f"{self.instance}|{request.url.path}|{params}|{self.queries.data_version()}|{window}"
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+    @staticmethod
+    def _call(func: Callable, *args) -> bytes:
+        # Serialized in the worker thread as well, keeping the event loop free
+        return to_json(func(*args))
+
+    async def run(self, endpoint: str, func: Callable, *args) -> bytes:
+        """
+        Function to run a query in the thread pool
+        Args:
+            endpoint: Name of the endpoint, the unit of concurrency limits
+            func: Query, its result is serialized by to_json
+            args: Arguments of func
+        Returns: JSON document
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.api_config["timeout"]
+        semaphore = self.semaphore(endpoint)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=deadline - loop.time())
+        except asyncio.TimeoutError:
+            raise HTTPException(503, f"Too many concurrent {endpoint} requests", headers={"Retry-After": "1"})
+
+        def release(future: asyncio.Future) -> None:
+            # A query cannot be interrupted, its slot is freed once it finished even if the request timed out
+            semaphore.release()
+            if not future.cancelled() and future.exception() is not None and loop.time() > deadline:
+                logger.warning(f"{endpoint} failed after its request timed out: {future.exception()!r}")
+
+        future = loop.run_in_executor(self.executor, self._call, func, *args)
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            raise HTTPException(504, f"{endpoint} did not complete in {config.api_config['timeout']}s")
+        # Only errors raised on purpose by queries, anything else is a 500
+        except BadRequest as err:
+            raise HTTPException(400, str(err))
+        except NotFound as err:
+            raise HTTPException(404, str(err))
+
+    async def respond(self, request: Request, endpoint: str, func: Callable, *args) -> Response:
+        """
+        Function to answer a request with the JSON result of a query, or with 304 if the client's copy is current
+        """
+        start = time.perf_counter()
+        status = 500
+        try:
+            etag = self.etag(request)
+            if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+                status = 304
+                return Response(status_code=304, headers={"ETag": etag})
+            body = await self.run(endpoint, func, *args)
+            status = 200
+            return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+        except HTTPException as err:
+            status = err.status_code
+            raise
+        finally:
+            registry.counter("api_requests_total", "Requests answered by the API", endpoint=endpoint,
+                             status=str(status)).inc()
+            registry.histogram("api_request_seconds", "Time to answer a request", endpoint=endpoint).observe(
+                time.perf_counter() - start)
+
+
+def create_app(queries: TwitterQueries = None) -> FastAPI:
+    """
+    Function to create the API over TwitterQueries, Swagger UI is served at /docs
+    Args:
+        queries: Queries to serve, created at startup if None
+    Returns: FastAPI application
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        runner = QueryRunner(queries or TwitterQueries())
+        get_subscriber().start()
+        # In the background, requests are served meanwhile
+        runner.queries.warm_up()
+        app.state.runner = runner
+        yield
+        runner.executor.shutdown(wait=False, cancel_futures=True)
+
+    app = FastAPI(title="TweetPrime", lifespan=lifespan)
+    app.add_middleware(GZipMiddleware, minimum_size=config.api_config["gzip_min_bytes"])
+
+    def queries_of(request: Request) -> TwitterQueries:
+        return request.app.state.runner.queries
+
+    async def respond(request: Request, endpoint: str, func: Callable, *args) -> Response:
+        return await request.app.state.runner.respond(request, endpoint, func, *args)
+
+    @app.get("/users")
+    async def users_by_name(request: Request, name: str):
+        q = queries_of(request)
+        return await respond(request, "users_by_name", lambda: list(q.get_user_data_by_username(name).values()))
+
+    @app.get("/users/search")
+    async def search_users(request: Request, term: str, sort_by: str = "followers_count",
+                           order: Literal["asc", "desc"] = "desc", limit: int = Query(100, ge=1, le=MAX_LIMIT)):
+        q = queries_of(request)
+        return await respond(request, "search_users",
+                             lambda: first_chunk(q.search_and_sort_users(term, sort_by, order, chunksize=limit)))
+
+    @app.get("/users/{user_id}")
+    async def user(request: Request, user_id: str):
+        q = queries_of(request)
+
+        def get_user():
+            users = q.get_user_data([user_id])
+            if user_id not in users:
+                raise NotFound(f"User {user_id} not found")
+            return users[user_id]
+
+        return await respond(request, "user", get_user)
+
+    @app.get("/users/{user_id}/tweets")
+    async def user_tweets(request: Request, user_id: str, time_frame: TimeFrame = None,
+                          limit: int = Query(100, ge=1, le=MAX_LIMIT)):
+        q = queries_of(request)
+
+        def get_tweets():
+            user_info = q.get_user_data([user_id])
+            if not user_info:
+                raise NotFound(f"User {user_id} not found")
+            return first_chunk(q.search_tweets_username(user_info, time_frame, chunksize=limit))
+
+        return await respond(request, "user_tweets", get_tweets)
+
+    @app.get("/users/{user_id}/relevant-users")
+    async def relevant_users(request: Request, user_id: str, limit: int = Query(10, ge=1, le=100)):
+        q = queries_of(request)
+        return await respond(request, "relevant_users", q.get_relevant_users_by_user_id, user_id, limit)
+
+    @app.get("/users/{user_id}/relevant-tweets")
+    async def relevant_tweets(request: Request, user_id: str, limit: int = Query(10, ge=1, le=MAX_LIMIT),
+                              user_limit: int = Query(10, ge=1, le=100)):
+        q = queries_of(request)
+        return await respond(request, "relevant_tweets", q.get_relevant_tweets_by_user_id, user_id, limit,
+                             user_limit)
+
+    @app.get("/tweets/search")
+    async def search_tweets(request: Request, keyword: str, time_frame: TimeFrame = None,
+                            limit: int = Query(100, ge=1, le=MAX_LIMIT)):
+        q = queries_of(request)
+        return await respond(request, "search_tweets",
+                             lambda: first_chunk(q.search_tweets_by_keyword(keyword, time_frame, chunksize=limit)))
+
+    @app.get("/tweets/popular")
+    async def popular_tweets(request: Request, time_frame: TimeFrame = None):
+        q = queries_of(request)
+        return await respond(request, "popular_tweets", q.search_popular_tweets_based_on_engagement, time_frame)
+
+    @app.get("/hashtags/trending")
+    async def trending_hashtags(request: Request):
+        q = queries_of(request)
+        return await respond(request, "trending_hashtags",
+                             lambda: [{"hashtag": hashtag, "count": count} for hashtag, count in
+                                      q.get_trending_hashtags()])
+
+    @app.get("/hashtags/{hashtag}/tweets")
+    async def hashtag_tweets(request: Request, hashtag: str, limit: int = Query(100, ge=1, le=MAX_LIMIT)):
+        q = queries_of(request)
+        return await respond(request, "hashtag_tweets",
+                             lambda: first_chunk(q.search_tweets_by_hashtag(hashtag, chunksize=limit)))
+
+    @app.get("/rollups")
+    async def rollups(request: Request, time_frame: TimeFrame = None,
+                      group_by: List[Literal["hour", "lang", "tweet_type"]] = Query(["hour"])):
+        q = queries_of(request)
+        return await respond(request, "rollups", q.get_rollup_counts, time_frame, tuple(group_by))
+
+    @app.get("/health")
+    async def health(request: Request):
+        return {"status": "ok", "warmed_up": queries_of(request).prefetcher.warmed.is_set()}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return PlainTextResponse(registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+
+def serve(host: str = None, port: int = None, workers: int = None) -> None:
+    """
+    Function to serve the API until interrupted
+    Args:
+        host: Interface to listen on
+        port: Port to listen on
+        workers: Number of processes, each with its own caches, queries are bound by the GIL within a process
+    """
+    import uvicorn
+
+    # log_config=None keeps the configuration of logging.conf
+    uvicorn.run("src.api:create_app", factory=True, host=host or config.api_config["host"],
+                port=port or config.api_config["port"], workers=workers or config.api_config["workers"],
+                log_config=None)
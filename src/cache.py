@@ -1,45 +1,110 @@
-import logging.config
-import os.path
+import os
 import pickle
+import threading
 import time
-from typing import Union
+from typing import Iterable, Union
 
-from apscheduler.schedulers.background import BackgroundScheduler
+from src import config
+from src.invalidation import get_subscriber
+from src.log import get_logger
+from src.metrics import SamplingFilter, registry
+from src.scheduler import add_interval_job, remove_job
 
-from src.config import cache_config
-
-logging.config.fileConfig('logging.conf')
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
+logger.addFilter(SamplingFilter())
 
 
 class Cache:
 
-    def __init__(self, cache_path: str, max_size=cache_config["max_size"]):
-        self._data = {}
+    def __init__(self, cache_path: str, max_size=None, topic: str = None, access_log=None, ttl: float = None,
+                 invalidate: bool = True):
+        """
+        Args:
+            cache_path: Pickle file the cache is saved to
+            max_size: Maximum number of entries
+            topic: Invalidation topic (tweets, users or hashtags) whose published keys are evicted, None to
+            only rely on the TTL
+            access_log: AccessLog recording the keys looked up under topic, to warm up the cache after a restart
+            ttl: Seconds an entry is served, cache.ttl by default
+            invalidate: Evict the published keys of topic, otherwise entries are only refreshed once their ttl
+            expired, for keys published so often that they would hardly ever be served
+        """
+        # Loaded from disk on first use
+        self._data = None
+        self._job = None
         self._cache_path = cache_path
-        self._max_size = max_size
+        self._max_size = max_size or config.cache_config["max_size"]
+        self._topic = topic
+        self._access_log = access_log
+        self._ttl = ttl or config.cache_config["ttl"]
+        # Topic whose published keys are evicted
+        self._invalidation_topic = topic if invalidate else None
+        # Entries are also written by the invalidation and prefetch threads
+        self._lock = threading.RLock()
+        # Incremented whenever entries may have been invalidated
+        self.version = 0
+
+        name = os.path.splitext(os.path.basename(cache_path))[0]
+        self._hits = registry.counter("cache_hits_total", "Cache lookups that found a live entry", cache=name)
+        self._misses = registry.counter("cache_misses_total", "Cache lookups without a live entry", cache=name)
+        self._ttl_evictions = registry.counter("cache_evictions_total", "Entries removed from cache",
+                                               cache=name, reason="ttl")
+        self._size_evictions = registry.counter("cache_evictions_total", "Entries removed from cache",
+                                                cache=name, reason="size")
+        self._invalidation_evictions = registry.counter("cache_evictions_total", "Entries removed from cache",
+                                                        cache=name, reason="invalidation")
+        self._size = registry.gauge("cache_size", "Number of entries in cache", cache=name)
 
-        self.load_from_disk()
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.add_job(self.save_to_disk, 'interval', seconds=cache_config["save_to_disk_interval"])
-        self.scheduler.start()
+    def _loaded(self) -> dict:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self.load_from_disk()
+        return self._data
 
     def load_from_disk(self) -> None:
         """
-        Function to load cache from disk
+        Function to load cache from disk and start saving it periodically
         """
+        data, position = {}, None
         if os.path.isfile(self._cache_path):
             logger.debug(f"Loading cache from {self._cache_path}")
             with open(self._cache_path, 'rb') as fp:
-                self._data = pickle.load(fp)
+                saved = pickle.load(fp)
+            if "data" in saved and "position" in saved:
+                data, position = saved["data"], saved["position"]
+            else:
+                # Saved before invalidation positions were recorded
+                data = saved
+        if self._invalidation_topic is not None:
+            subscriber = get_subscriber()
+            if data and (position is None or not subscriber.replay(position, data, self._invalidation_topic)):
+                logger.info(f"Dropping {len(data)} entries of {self._cache_path}, invalidations since it was "
+                            f"saved are unknown")
+                data = {}
+            subscriber.subscribe(self._invalidation_topic, self)
+        self._data = data
+        self._size.set(len(self._data))
+        if self._job is None:
+            self._job = add_interval_job(self.save_to_disk, seconds=config.cache_config["save_to_disk_interval"])
 
     def save_to_disk(self) -> None:
         """
         Function to save cache to disk
         """
+        if self._data is None:
+            # Never used, the file on disk is up to date
+            return
+        # Read before copying the entries, replaying events that were already applied is harmless
+        position = get_subscriber().position if self._invalidation_topic is not None else None
+        with self._lock:
+            data = dict(self._data)
         logger.debug(f"Saving cache to {self._cache_path}")
-        with open(self._cache_path, 'wb') as fp:
-            pickle.dump(self._data, fp)
+        # Replaced atomically, API workers share the file
+        tmp_path = f"{self._cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump({"position": position, "data": data}, fp)
+        os.replace(tmp_path, self._cache_path)
 
     def get(self, key: Union[int, str]) -> Union[None, str, dict, int, float, bool]:
         """
@@ -49,31 +114,76 @@ class Cache:
         Returns:
             Data corresponding to key
         """
-        if key in self._data:
-            timestamp, data = self._data.get(key)
-            if time.time() > timestamp + cache_config["ttl"]:
-                logger.debug(f"{key} expired in cache")
-                del self._data[key]
+        if self._access_log is not None:
+            self._access_log.record(self._topic, key)
+        entry = self._loaded().get(key)
+        if entry is not None:
+            timestamp, data = entry
+            if time.time() > timestamp + self._ttl:
+                logger.debug("%s expired in cache", key)
+                self._data.pop(key, None)
+                self._ttl_evictions.inc()
+                self._misses.inc()
+                self._size.set(len(self._data))
                 return None
+            self._hits.inc()
             return data
-        logger.debug(f"{key} not found in cache")
+        logger.debug("%s not found in cache", key)
+        self._misses.inc()
         return None
 
-    def put(self, key: Union[int, str], value: Union[str, dict, int, float, bool]) -> None:
+    def put(self, key: Union[int, str], value: Union[str, dict, int, float, bool], version: int = None) -> None:
         """
         Function to add data to cache
         Args:
             key: Key to be store
             value: Value corresponding to key
+            version: Cache.version read before value was read from the store, value is not cached if entries
+            were invalidated since as it may predate the change
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                logger.debug("Not caching %s, invalidated while it was read", key)
+                return
+            self._loaded().pop(key, None)
+            if len(self._data) > self._max_size:
+                logger.debug("Cache full. Deleting oldest entry.")
+                oldest_key = next(iter(self._data))
+                del self._data[oldest_key]
+                self._size_evictions.inc()
+            self._data[key] = (time.time(), value)
+            self._size.set(len(self._data))
+
+    def evict(self, keys: Iterable[Union[int, str]]) -> None:
+        """
+        Function to remove entries whose data changed in the store
+        Args:
+            keys: Keys published on the invalidation log
+        """
+        removed = 0
+        with self._lock:
+            # Also when not loaded yet, a value read meanwhile is put once it is loaded
+            self.version += 1
+            if self._data is None:
+                return
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    removed += 1
+        if removed:
+            logger.debug("Invalidated %s entries of %s", removed, self._cache_path)
+            self._invalidation_evictions.inc(removed)
+            self._size.set(len(self._data))
+
+    def clear(self) -> None:
+        """
+        Function to remove all entries from cache
         """
-        self._data.pop(key, None)
-        if len(self._data) > self._max_size:
-            logger.debug("Cache full. Deleting oldest entry.")
-            oldest_key = next(iter(self._data))
-            del self._data[oldest_key]
-        self._data[key] = (time.time(), value)
+        with self._lock:
+            self._loaded().clear()
+            self.version += 1
+            self._size.set(0)
 
     def __del__(self):
-        self.scheduler.shutdown()
-        logger.info("Scheduler shut down successfully.")
-        self.save_to_disk()
+        # After shutdown the scheduler already saved the cache one last time
+        if self._job is not None and remove_job(self._job):
+            self.save_to_disk()
@@ -1,9 +1,48 @@
-import yaml
-
-with open("config.yml") as fp:
-    config = yaml.safe_load(fp)
-    cache_config = config["cache"]
-    mysql_config = config["mysql"]
-    mongodb_config = config["mongodb"]
-    neo4j_config = config["neo4j"]
-    hashtag_config = config["hashtag"]
+import os
+import threading
+
+# Sections of config.yml, exposed as <section>_config. The file is read when one of them is first used.
+SECTIONS = ["cache", "mysql", "mongodb", "neo4j", "hashtag", "query", "export", "rollup", "metrics", "store",
+            "embedded", "invalidation", "warmup", "api", "follow"]
+
+_lock = threading.Lock()
+
+
+def read_config(path: str) -> dict:
+    """
+    Function to read a config file. A file with an extends key only holds overrides of the file it names
+    (relative to its own directory): each of its keys replaces the one of the same section of that file.
+    Args:
+        path: Config file
+    Returns: Dictionary with the sections of the config file
+    """
+    import yaml
+
+    with open(path) as fp:
+        config = yaml.safe_load(fp)
+    base = config.pop("extends", None)
+    if base is None:
+        return config
+    merged = read_config(os.path.join(os.path.dirname(path), base))
+    for section, values in config.items():
+        merged[section] = {**merged.get(section, {}), **values}
+    return merged
+
+
+def load_config() -> dict:
+    """
+    Function to read the config file, its path can be overridden, e.g. to point at the benchmark stores
+    Returns: Dictionary with the sections of the config file
+    """
+    return read_config(os.environ.get("TWEETPRIME_CONFIG", "config.yml"))
+
+
+def __getattr__(name: str):
+    section = name[:-len("_config")] if name.endswith("_config") else None
+    if section not in SECTIONS and name != "config":
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    with _lock:
+        if "config" not in globals():
+            config = load_config()
+            globals().update(config=config, **{f"{s}_config": config[s] for s in SECTIONS})
+    return globals()[name]
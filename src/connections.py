@@ -1,27 +1,23 @@
-import logging.config
 import time
 
-import certifi
-import mysql.connector
-from neo4j import GraphDatabase
-from pymongo import MongoClient
+from src import config
+from src.log import get_logger
 
-from src.config import mysql_config, mongodb_config, neo4j_config
-
-logging.config.fileConfig('logging.conf')
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 def get_mysql_conn(attempts=3, delay=2):
+    import mysql.connector
+
     logger.info("Trying to get MySQL connection")
     attempt = 1
     while attempt < attempts + 1:
         try:
-            return mysql.connector.connect(host=mysql_config["host"],
-                                           user=mysql_config["user"],
-                                           passwd=mysql_config["password"],
-                                           database=mysql_config["db"],
-                                           port=mysql_config["port"])
+            return mysql.connector.connect(host=config.mysql_config["host"],
+                                           user=config.mysql_config["user"],
+                                           passwd=config.mysql_config["password"],
+                                           database=config.mysql_config["db"],
+                                           port=config.mysql_config["port"])
         except (mysql.connector.Error, IOError) as err:
             if attempts == attempt:
                 logger.exception("Failed to connect to MySQL, exiting without a connection")
@@ -31,14 +27,51 @@ def get_mysql_conn(attempts=3, delay=2):
             attempt += 1
 
 
+def get_mysql_pool(size: int, attempts=3, delay=2):
+    """
+    Function to create a pool of MySQL connections, for queries running concurrently in several threads
+    Args:
+        size: Number of connections, at most 32
+    Returns: MySQLConnectionPool, connections are returned to it when closed
+    """
+    import mysql.connector
+    from mysql.connector import pooling
+
+    logger.info(f"Trying to create a pool of {size} MySQL connections")
+    attempt = 1
+    while attempt < attempts + 1:
+        try:
+            return pooling.MySQLConnectionPool(pool_name="tweetprime", pool_size=size,
+                                               host=config.mysql_config["host"],
+                                               user=config.mysql_config["user"],
+                                               passwd=config.mysql_config["password"],
+                                               database=config.mysql_config["db"],
+                                               port=config.mysql_config["port"])
+        except (mysql.connector.Error, IOError) as err:
+            if attempts == attempt:
+                logger.exception("Failed to create MySQL connection pool, exiting without a connection")
+                raise err
+            logger.info(f"MySQL Connection failed: {err}. Retrying ({attempt}/{attempts - 1})...")
+            time.sleep(delay ** attempt)
+            attempt += 1
+
+
 def get_mongodb_conn(collection: str, attempts=3, delay=2):
+    from pymongo import MongoClient
+
     logger.info("Trying to get MongoDB connection")
     attempt = 1
-    mongo_conn_string = f'mongodb+srv://{mongodb_config["user"]}:{mongodb_config["password"]}@{mongodb_config["host"]}/?retryWrites=true&w=majority&appName=Cluster0'
+    if "uri" in config.mongodb_config:
+        # Plain connection string, e.g. a local server
+        mongo_conn_string, tls_options = config.mongodb_config["uri"], {}
+    else:
+        mongo_conn_string = f'mongodb+srv://{config.mongodb_config["user"]}:{config.mongodb_config["password"]}@{config.mongodb_config["host"]}/?retryWrites=true&w=majority&appName=Cluster0'
+        import certifi
+        tls_options = {"tlsCAFile": certifi.where()}
     while attempt < attempts + 1:
         try:
-            client = MongoClient(mongo_conn_string, tlsCAFile=certifi.where())
-            db = client[mongodb_config["db"]]
+            client = MongoClient(mongo_conn_string, **tls_options)
+            db = client[config.mongodb_config["db"]]
             return db[collection]
         except Exception as err:
             if attempts == attempt:
@@ -50,12 +83,14 @@ def get_mongodb_conn(collection: str, attempts=3, delay=2):
 
 
 def get_neo4j_conn(attempts=3, delay=2):
+    from neo4j import GraphDatabase
+
     logger.info("Trying to get Neo4j connection")
     attempt = 1
 
     while attempt < attempts + 1:
         try:
-            driver = GraphDatabase.driver(neo4j_config["host"], auth=(neo4j_config["user"], neo4j_config["password"]))
+            driver = GraphDatabase.driver(config.neo4j_config["host"], auth=(config.neo4j_config["user"], config.neo4j_config["password"]))
             driver.verify_connectivity()
             return driver
         except Exception as err:
@@ -0,0 +1,489 @@
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src import config
+from src.hashtag_store import HashtagStore
+from src.log import get_logger
+from src.rollups import COUNT_COLUMNS, HyperLogLog
+from src.store import ROLLUP_GROUPS, USER_SORT_COLUMNS, BadRequest, TweetStore
+
+logger = get_logger(__name__)
+
+USER_COLUMNS = ["id_str", "name", "screen_name", "protected", "verified", "followers_count", "friends_count",
+                "listed_count", "favourites_count", "statuses_count", "created_at", "last_post_timestamp"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id_str TEXT NOT NULL PRIMARY KEY,
+    name TEXT,
+    screen_name TEXT,
+    protected BOOLEAN,
+    verified BOOLEAN,
+    followers_count INTEGER,
+    friends_count INTEGER,
+    listed_count INTEGER,
+    favourites_count INTEGER,
+    statuses_count INTEGER,
+    created_at TIMESTAMP,
+    last_post_timestamp TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS users_name ON users (name);
+CREATE INDEX IF NOT EXISTS users_screen_name ON users (screen_name);
+
+CREATE TABLE IF NOT EXISTS user_relationships (
+    id_str TEXT NOT NULL,
+    field TEXT NOT NULL,
+    other_id TEXT NOT NULL,
+    PRIMARY KEY (id_str, field, other_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tweets (
+    id_str TEXT NOT NULL UNIQUE,
+    user TEXT,
+    created_ts TEXT,
+    engagement INTEGER NOT NULL,
+    text TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tweets_user ON tweets (user);
+CREATE INDEX IF NOT EXISTS tweets_engagement ON tweets (engagement);
+CREATE VIRTUAL TABLE IF NOT EXISTS tweets_fts USING fts5(text, content='tweets', tokenize='porter unicode61');
+CREATE TRIGGER IF NOT EXISTS tweets_ai AFTER INSERT ON tweets BEGIN
+    INSERT INTO tweets_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS tweets_au AFTER UPDATE OF text ON tweets BEGIN
+    INSERT INTO tweets_fts (tweets_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+    INSERT INTO tweets_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+
+CREATE TABLE IF NOT EXISTS hashtag_dict (
+    hashtag_id INTEGER PRIMARY KEY,
+    hashtag TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS tweet_hashtags (
+    hashtag_id INTEGER NOT NULL,
+    tweet_id INTEGER NOT NULL,
+    user_id TEXT,
+    PRIMARY KEY (hashtag_id, tweet_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tweet_hashtags_tweet_id ON tweet_hashtags (tweet_id);
+
+CREATE TABLE IF NOT EXISTS tweet_rollups (
+    hour TIMESTAMP NOT NULL,
+    lang TEXT NOT NULL,
+    tweet_type TEXT NOT NULL,
+    tweets INTEGER NOT NULL,
+    with_urls INTEGER NOT NULL,
+    with_hashtags INTEGER NOT NULL,
+    with_geo INTEGER NOT NULL,
+    PRIMARY KEY (hour, lang, tweet_type)
+);
+CREATE TABLE IF NOT EXISTS user_rollups (
+    hour TIMESTAMP NOT NULL PRIMARY KEY,
+    users_hll BLOB NOT NULL
+);
+"""
+
+
+def _dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class EmbeddedStore(TweetStore):
+    """
+    Single node store running inside the ingest or query process, for deployments without the remote clusters.
+
+    Users, hashtags, rollups and tweet documents (JSON with a full text index) are kept in SQLite and user
+    interactions in an in-memory graph pickled next to it. SQLite runs in WAL mode, so query processes read
+    while ingest writes, and writes are committed every embedded.commit_every operations and on flush.
+    """
+
+    def __init__(self, path: str = None):
+        path = path or config.embedded_config["path"]
+        os.makedirs(path, exist_ok=True)
+        self.graph_path = os.path.join(path, "graph.pkl")
+        self.conn = sqlite3.connect(os.path.join(path, "store.db"), check_same_thread=False,
+                                    detect_types=sqlite3.PARSE_DECLTYPES)
+        self.conn.row_factory = _dict_factory
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute(f"PRAGMA cache_size = -{config.embedded_config['cache_size_mb'] * 1024}")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.executescript(SCHEMA)
+        # The connection is shared by the threads of a process
+        self.lock = threading.RLock()
+        self.pending_writes = 0
+
+        # user id -> {screen_name, tweet_list}
+        self.nodes: Dict[str, dict] = {}
+        # user id -> user id -> relationship -> [count, last_interaction]
+        self.edges: Dict[str, Dict[str, Dict[str, list]]] = {}
+        # user id -> ids of users with an edge to it
+        self.incoming: Dict[str, set] = defaultdict(set)
+        # Loaded on first use, see refresh_graph
+        self.graph_mtime = None
+        self.graph_dirty = False
+        self.graph_saved = time.time()
+
+    def setup(self) -> None:
+        # Tables are created when the store is opened
+        pass
+
+    def migrate(self) -> None:
+        # No data of older versions to update
+        pass
+
+    def _write(self, sql: str, params=()) -> None:
+        with self.lock:
+            self.conn.execute(sql, params)
+            self.pending_writes += 1
+            if self.pending_writes >= config.embedded_config["commit_every"]:
+                self.commit()
+
+    def commit(self) -> None:
+        with self.lock:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def flush(self, full: bool = True) -> None:
+        self.commit()
+        # Pickling the whole graph is costly, micro-flushes save it every embedded.graph_save_interval seconds
+        due = time.time() - self.graph_saved >= config.embedded_config["graph_save_interval"]
+        if self.graph_dirty and (full or due):
+            self.save_graph()
+
+    def _fetchall(self, sql: str, params=()) -> List[dict]:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # Users
+
+    def upsert_user(self, user_data: dict, last_post_timestamp: str) -> None:
+        created_at = datetime.strftime(datetime.strptime(user_data['created_at'], '%a %b %d %H:%M:%S %z %Y'),
+                                       '%Y-%m-%d %H:%M:%S')
+        values = [user_data[c] for c in USER_COLUMNS[:10]] + [created_at, last_post_timestamp]
+        updates = ", ".join(f"{c} = excluded.{c}" for c in USER_COLUMNS[1:11])
+        self._write(f"""
+        INSERT INTO users ({", ".join(USER_COLUMNS)}) VALUES ({", ".join(["?"] * len(USER_COLUMNS))})
+        ON CONFLICT (id_str) DO UPDATE SET {updates},
+        last_post_timestamp = MAX(COALESCE(last_post_timestamp, '1000-01-01 00:00:00'), excluded.last_post_timestamp)
+        """, values)
+
+    def upsert_reply_user(self, user_id: str, screen_name: str) -> None:
+        # Name is equal to screen_name until the user is seen as an author, known users are kept as they are
+        self._write("INSERT OR IGNORE INTO users (id_str, name, screen_name) VALUES (?, ?, ?)",
+                    (user_id, screen_name, screen_name))
+
+    def find_users_by_name(self, name: str) -> List[dict]:
+        return self._fetchall("SELECT * FROM users WHERE name LIKE '%' || ? || '%'", (name,))
+
+    def get_users(self, user_ids: List[str]) -> List[dict]:
+        users = []
+        page_size = config.query_config["page_size"]
+        for i in range(0, len(user_ids), page_size):
+            page = user_ids[i:i + page_size]
+            users.extend(self._fetchall(f"SELECT * FROM users WHERE id_str IN ({', '.join(['?'] * len(page))})",
+                                        page))
+        return users
+
+    def iter_users(self, search_term: str, sort_by: str = 'followers_count', order: str = 'desc',
+                   fields: Optional[List[str]] = None) -> Iterator[dict]:
+        if sort_by not in USER_SORT_COLUMNS:
+            raise BadRequest(f"Cannot sort users by {sort_by}")
+        order_by, op = ("DESC", "<") if order == 'desc' else ("ASC", ">")
+        sort_expr = f"COALESCE({sort_by}, ?)"
+        columns = "*" if fields is None else ", ".join(dict.fromkeys(list(fields) + ["id_str", sort_by]))
+        page_size = config.query_config["page_size"]
+        default = USER_SORT_COLUMNS[sort_by]
+        last_key = None
+        while True:
+            params = [search_term]
+            keyset = ""
+            if last_key is not None:
+                keyset = f"AND ({sort_expr}, id_str) {op} (?, ?)"
+                params += [default, *last_key]
+            params += [default, page_size]
+            page = self._fetchall(f"""
+            SELECT {columns}
+            FROM users
+            WHERE name LIKE '%' || ? || '%' {keyset}
+            ORDER BY {sort_expr} {order_by}, id_str {order_by}
+            LIMIT ?
+            """, params)
+            yield from page
+            if len(page) < page_size:
+                return
+            last_row = page[-1]
+            last_value = default if last_row[sort_by] is None else last_row[sort_by]
+            if isinstance(last_value, datetime):
+                last_value = last_value.strftime('%Y-%m-%d %H:%M:%S')
+            last_key = (last_value, last_row["id_str"])
+
+    # Tweets
+
+    @staticmethod
+    def _tweet_row(tweet_data: dict) -> tuple:
+        created_ts = datetime.strptime(tweet_data['created_at'], '%a %b %d %H:%M:%S %z %Y').astimezone(timezone.utc)
+        engagement = sum(tweet_data.get(c) or 0 for c in ('quote_count', 'reply_count', 'retweet_count',
+                                                           'favorite_count'))
+        return (tweet_data['user'], created_ts.isoformat(), engagement, tweet_data.get('text'),
+                json.dumps(tweet_data), tweet_data['id_str'])
+
+    def find_tweet(self, tweet_id: str) -> Optional[dict]:
+        rows = self._fetchall("SELECT doc FROM tweets WHERE id_str = ?", (tweet_id,))
+        return json.loads(rows[0]["doc"]) if rows else None
+
+    def insert_tweet(self, tweet_data: dict) -> None:
+        self._write("INSERT INTO tweets (user, created_ts, engagement, text, doc, id_str) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._tweet_row(tweet_data))
+
+    def replace_tweet(self, tweet_id: str, tweet_data: dict) -> None:
+        self._write("UPDATE tweets SET user = ?, created_ts = ?, engagement = ?, text = ?, doc = ? WHERE id_str = ?",
+                    self._tweet_row(dict(tweet_data, id_str=tweet_id)))
+
+    @staticmethod
+    def _project(doc: dict, fields: Optional[List[str]]) -> dict:
+        return doc if fields is None else {f: doc[f] for f in fields if f in doc}
+
+    def get_tweets(self, tweet_ids: List[str], fields: Optional[List[str]] = None) -> List[dict]:
+        tweets = []
+        page_size = config.query_config["page_size"]
+        for i in range(0, len(tweet_ids), page_size):
+            page = tweet_ids[i:i + page_size]
+            rows = self._fetchall(f"SELECT doc FROM tweets WHERE id_str IN ({', '.join(['?'] * len(page))})", page)
+            tweets.extend(self._project(json.loads(row["doc"]), fields) for row in rows)
+        return tweets
+
+    def _iter_pages(self, from_where: str, params: list, fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        Function to iterate over tweet documents using keyset pagination on the rowid
+        Args:
+            from_where: FROM and WHERE clauses, with tweets aliased as t
+            params: Parameters of the WHERE clause
+            fields: Fields to keep, None for full documents
+        Returns: Generator of documents
+        """
+        page_size = config.query_config["page_size"]
+        last_rowid = 0
+        while True:
+            page = self._fetchall(f"SELECT t.rowid, t.doc {from_where} AND t.rowid > ? ORDER BY t.rowid LIMIT ?",
+                                  params + [last_rowid, page_size])
+            for row in page:
+                yield self._project(json.loads(row["doc"]), fields)
+            if len(page) < page_size:
+                return
+            last_rowid = page[-1]["rowid"]
+
+    def iter_tweets_by_users(self, user_ids: List[str], since: Optional[datetime] = None,
+                             fields: Optional[List[str]] = None) -> Iterator[dict]:
+        user_ids = list(user_ids)
+        where = f"t.user IN ({', '.join(['?'] * len(user_ids))})"
+        params = user_ids
+        if since:
+            where += " AND t.created_ts >= ?"
+            params = params + [since.astimezone(timezone.utc).isoformat()]
+        return self._iter_pages(f"FROM tweets t WHERE {where}", params, fields)
+
+    def ensure_text_index(self) -> None:
+        # tweets_fts is created with the tables
+        pass
+
+    def iter_tweets_by_keyword(self, keyword: str, since: Optional[datetime] = None,
+                               fields: Optional[List[str]] = None) -> Iterator[dict]:
+        # Any of the words, as in a MongoDB $text search
+        terms = re.findall(r"\w+", keyword)
+        if not terms:
+            return iter(())
+        where = "tweets_fts MATCH ?"
+        params = [" OR ".join(f'"{term}"' for term in terms)]
+        if since:
+            where += " AND t.created_ts >= ?"
+            params.append(since.astimezone(timezone.utc).isoformat())
+        return self._iter_pages(f"FROM tweets_fts JOIN tweets t ON t.rowid = tweets_fts.rowid WHERE {where}",
+                                params, fields)
+
+    def popular_tweets(self, since: Optional[datetime] = None, limit: int = 10) -> List[dict]:
+        where, params = ("WHERE created_ts >= ?", [since.astimezone(timezone.utc).isoformat()]) if since else ("", [])
+        rows = self._fetchall(f"SELECT doc, engagement FROM tweets {where} ORDER BY engagement DESC LIMIT ?",
+                              params + [limit])
+        tweets = []
+        for row in rows:
+            doc = json.loads(row["doc"])
+            tweet = {'text': doc.get('text'), 'user': doc.get('user')}
+            tweet.update({c: doc.get(c) or 0 for c in ('quote_count', 'reply_count', 'retweet_count',
+                                                        'favorite_count')})
+            tweet['total_engagement'] = row["engagement"]
+            tweets.append(tweet)
+        return tweets
+
+    # Hashtags
+
+    def add_hashtags(self, hashtags: List[str], tweet_id: str, user_id: str) -> None:
+        for hashtag in hashtags:
+            hashtag = HashtagStore.normalize(hashtag)
+            self._write("INSERT OR IGNORE INTO hashtag_dict (hashtag) VALUES (?)", (hashtag,))
+            self._write("""
+            INSERT OR IGNORE INTO tweet_hashtags (hashtag_id, tweet_id, user_id)
+            SELECT hashtag_id, ?, ? FROM hashtag_dict WHERE hashtag = ?
+            """, (int(tweet_id), user_id, hashtag))
+
+    def hashtag_tweet_ids(self, hashtag: str) -> List[str]:
+        rows = self._fetchall("""
+        SELECT th.tweet_id
+        FROM hashtag_dict hd
+        JOIN tweet_hashtags th ON th.hashtag_id = hd.hashtag_id
+        WHERE hd.hashtag = ?
+        ORDER BY th.tweet_id DESC
+        """, (HashtagStore.normalize(hashtag),))
+        return [str(row["tweet_id"]) for row in rows]
+
+    # Interactions
+
+    def add_user_document(self, user_id: str) -> None:
+        # Relationship lists are rows of user_relationships, an empty user document has none
+        pass
+
+    def add_user_relationship(self, id_A: str, id_B: str, field_A: str, field_B: str) -> None:
+        self._write("INSERT OR IGNORE INTO user_relationships (id_str, field, other_id) VALUES (?, ?, ?)",
+                    (id_A, field_A, id_B))
+        self._write("INSERT OR IGNORE INTO user_relationships (id_str, field, other_id) VALUES (?, ?, ?)",
+                    (id_B, field_B, id_A))
+
+    def _merge_node(self, user: dict, tweet_id: str) -> None:
+        node = self.nodes.get(user['id_str'])
+        if node is None:
+            self.nodes[user['id_str']] = {'screen_name': user['screen_name'], 'tweet_list': [tweet_id]}
+        elif tweet_id not in node['tweet_list']:
+            node['tweet_list'].append(tweet_id)
+
+    def add_interaction(self, user_A: dict, user_B: dict, relationship: str, time: str, tweet_A: str,
+                        tweet_B: str) -> None:
+        with self.lock:
+            self.refresh_graph()
+            self._merge_node(user_A, tweet_A)
+            self._merge_node(user_B, tweet_B)
+            edge = self.edges.setdefault(user_A['id_str'], {}).setdefault(user_B['id_str'], {})
+            if relationship in edge:
+                edge[relationship][0] += 1
+                edge[relationship][1] = max(edge[relationship][1], time)
+            else:
+                edge[relationship] = [1, time]
+            self.incoming[user_B['id_str']].add(user_A['id_str'])
+            self.graph_dirty = True
+
+    def relevant_users(self, user_id: str, limit: int = 10, include_tweet: bool = False) -> List[dict]:
+        with self.lock:
+            self.refresh_graph()
+            # Same aggregation as the Cypher query of RemoteStore, which counts a path once per relationship
+            # of a to user_id and once per relationship of a to b
+            totals = {}
+            for a in self.incoming.get(user_id, ()):
+                if a == user_id:
+                    continue
+                for _ in self.edges[a][user_id]:
+                    for b, relationships in self.edges[a].items():
+                        if b == user_id:
+                            continue
+                        node = self.nodes[b]
+                        for count, last_interaction in relationships.values():
+                            row = totals.setdefault(b, {'screen_name': node['screen_name'], 'id_str': b,
+                                                        'n_of_tweets': 0, 'n_of_interactions': 0,
+                                                        'last_interaction_dt': last_interaction})
+                            row['n_of_tweets'] += len(node['tweet_list'])
+                            row['n_of_interactions'] += count
+                            row['last_interaction_dt'] = max(row['last_interaction_dt'], last_interaction)
+            rows = sorted(totals.values(), key=lambda r: (r['n_of_interactions'], r['last_interaction_dt'],
+                                                          r['n_of_tweets']), reverse=True)[:limit]
+            if include_tweet:
+                for row in rows:
+                    row['tweet_list'] = list(self.nodes[row['id_str']]['tweet_list'])
+            return rows
+
+    def save_graph(self) -> None:
+        """
+        Function to save the interaction graph to disk
+        """
+        with self.lock:
+            tmp_path = f"{self.graph_path}.tmp"
+            with open(tmp_path, 'wb') as fp:
+                pickle.dump({"nodes": self.nodes, "edges": self.edges}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.graph_path)
+            self.graph_mtime = os.path.getmtime(self.graph_path)
+            self.graph_dirty = False
+            self.graph_saved = time.time()
+        logger.debug(f"Saved interaction graph of {len(self.nodes)} users to {self.graph_path}")
+
+    def load_graph(self) -> None:
+        """
+        Function to load the interaction graph from disk
+        """
+        if not os.path.isfile(self.graph_path):
+            return
+        with self.lock:
+            self.graph_mtime = os.path.getmtime(self.graph_path)
+            with open(self.graph_path, 'rb') as fp:
+                data = pickle.load(fp)
+            self.nodes, self.edges = data["nodes"], data["edges"]
+            self.incoming = defaultdict(set)
+            for a, targets in self.edges.items():
+                for b in targets:
+                    self.incoming[b].add(a)
+        logger.debug(f"Loaded interaction graph of {len(self.nodes)} users from {self.graph_path}")
+
+    def refresh_graph(self) -> None:
+        """
+        Function to reload the graph when another process, e.g. ingest, saved a newer one
+        """
+        if (not self.graph_dirty and os.path.isfile(self.graph_path)
+                and os.path.getmtime(self.graph_path) != self.graph_mtime):
+            self.load_graph()
+
+    # Rollups
+
+    def save_rollups(self, counts: Dict[Tuple[str, str, str], List[int]], users: Dict[str, HyperLogLog]) -> None:
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in COUNT_COLUMNS)
+        with self.lock:
+            self.conn.executemany(f"""
+            INSERT INTO tweet_rollups (hour, lang, tweet_type, {", ".join(COUNT_COLUMNS)})
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (hour, lang, tweet_type) DO UPDATE SET {updates}
+            """, [(*key, *values) for key, values in counts.items()])
+
+            hours = list(users)
+            rows = self.conn.execute(f"SELECT hour, users_hll FROM user_rollups WHERE hour IN "
+                                     f"({', '.join(['?'] * len(hours))})", hours).fetchall()
+            for row in rows:
+                users[row["hour"].strftime('%Y-%m-%d %H:00:00')].merge(HyperLogLog.from_bytes(row["users_hll"]))
+            self.conn.executemany("INSERT OR REPLACE INTO user_rollups (hour, users_hll) VALUES (?, ?)",
+                                  [(hour, hll.to_bytes()) for hour, hll in users.items()])
+            self.commit()
+
+    def query_rollups(self, since: Optional[str] = None, group_by: Tuple[str, ...] = ("hour",)
+                      ) -> Tuple[List[Dict], Optional[Dict[datetime, HyperLogLog]]]:
+        if not set(group_by) <= ROLLUP_GROUPS:
+            raise BadRequest(f"Cannot group rollups by {group_by}")
+        where = "WHERE hour >= ?" if since else ""
+        params = (since,) if since else ()
+        columns = ", ".join(group_by)
+        sums = ", ".join(f"SUM({c}) AS {c}" for c in COUNT_COLUMNS)
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(f"""
+            SELECT {columns + ", " if columns else ""}{sums}
+            FROM tweet_rollups {where}
+            {"GROUP BY " + columns + " ORDER BY " + columns if columns else ""}
+            """, params)
+            rows = cursor.fetchall()
+            if not set(group_by) <= {"hour"}:
+                return rows, None
+            cursor.execute(f"SELECT hour, users_hll FROM user_rollups {where}", params)
+            users = {row["hour"]: HyperLogLog.from_bytes(row["users_hll"]) for row in cursor.fetchall()}
+        return rows, users
@@ -0,0 +1,265 @@
+import fnmatch
+import hashlib
+import os
+import pickle
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src import config
+from src.log import get_logger
+
+logger = get_logger(__name__)
+
+# (st_dev, st_ino) of a file, inodes of deleted files are reused right away
+FileKey = Tuple[int, int]
+# (st_dev, st_ino, fingerprint, offset) of the next line to be read
+Position = Tuple[int, int, Optional[str], int]
+
+FINGERPRINT_BYTES = 4096
+
+
+def fingerprint(fd: int) -> Optional[str]:
+    """
+    Function to identify the content of a file, telling it apart from a file that reused its inode
+    Args:
+        fd: Descriptor of the file
+    Returns: Hash of its first line (or of its first FINGERPRINT_BYTES bytes if longer), None while it has neither
+    """
+    data = os.pread(fd, FINGERPRINT_BYTES, 0)
+    if b"\n" in data:
+        data = data[:data.index(b"\n") + 1]
+    elif len(data) < FINGERPRINT_BYTES:
+        return None
+    return hashlib.sha1(data).hexdigest()
+
+
+def path_fingerprint(path: str) -> Optional[str]:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        return fingerprint(fd)
+    finally:
+        os.close(fd)
+
+
+class FileTailer:
+    """
+    Non-blocking reader of the lines appended to a file, or to the files of a directory in the order they were
+    written. A file rotated away (its path now holds another file, or a newer file appeared in the directory) is
+    read until it was left unchanged for follow.rotate_wait seconds before moving on, as its writer may still be
+    appending to it. A truncated or rewritten file is read again from its start and a trailing line is only
+    returned once it is complete, or once its file was rotated away and left unchanged.
+
+    Files are identified by device and inode, and by the fingerprint of their first line, so that a file reusing
+    the inode of a deleted one is not mistaken for it.
+    """
+
+    def __init__(self, path: str, from_end: bool = False, position: Optional[Position] = None):
+        """
+        Args:
+            path: File, or directory whose files matching follow.pattern are read
+            from_end: Skip the lines written before starting
+            position: Position to resume from, e.g. a checkpoint saved after the lines before it were ingested,
+            ignored if from_end or if its file no longer exists
+        """
+        self.path = path
+        self.directory = os.path.isdir(path)
+        self.fp = None
+        self.key: Optional[FileKey] = None
+        self.fingerprint = None
+        self.partial = b""
+        # Fingerprints of the files of the directory read to their end, by key as rotated files are renamed
+        self.done: Dict[FileKey, Optional[str]] = {}
+        self._start(from_end, position)
+
+    def _files(self) -> List[Tuple[float, str, FileKey]]:
+        """
+        Function to list the files that may be followed, oldest first, and forget the finished files that are gone
+        Returns: Modification time, path and key of each file
+        """
+        if not self.directory:
+            paths = [self.path]
+        else:
+            pattern = config.follow_config["pattern"]
+            paths = [os.path.join(self.path, name) for name in os.listdir(self.path) if fnmatch.fnmatch(name, pattern)]
+        files = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.isfile(path):
+                files.append((stat.st_mtime, path, (stat.st_dev, stat.st_ino)))
+        present = {key for _, _, key in files}
+        self.done = {key: done for key, done in self.done.items() if key in present}
+        return sorted(files)
+
+    def _is_done(self, path: str, key: FileKey) -> bool:
+        return key in self.done and self.done[key] == path_fingerprint(path)
+
+    def _pending(self) -> List[Tuple[float, str, FileKey]]:
+        """
+        Function to list the files not read to their end yet, other than the one being read
+        """
+        return [f for f in self._files() if f[2] != self.key and not self._is_done(f[1], f[2])]
+
+    def _open(self, path: str, offset: int = 0) -> None:
+        if self.fp is not None:
+            self.fp.close()
+        self.fp = open(path, 'rb')
+        stat = os.fstat(self.fp.fileno())
+        self.key = (stat.st_dev, stat.st_ino)
+        self.fingerprint = fingerprint(self.fp.fileno())
+        self.partial = b""
+        self.fp.seek(offset, os.SEEK_SET if offset >= 0 else os.SEEK_END)
+        logger.info(f"Following {path} from offset {self.fp.tell()}")
+
+    def _start(self, from_end: bool, position: Optional[Position]) -> None:
+        files = self._files()
+        if not files:
+            return
+        if position is not None and not from_end:
+            if len(position) != 4:
+                logger.warning(f"Ignoring checkpoint of {self.path} saved in an older format")
+            else:
+                dev, ino, saved_fingerprint, offset = position
+                for i, (_, path, key) in enumerate(files):
+                    if key != (dev, ino):
+                        continue
+                    # Before its first line was complete the checkpoint can only be at its start
+                    if (offset == 0 or path_fingerprint(path) == saved_fingerprint) and os.path.getsize(path) >= offset:
+                        self.done.update((older, path_fingerprint(older_path)) for _, older_path, older in files[:i])
+                        self._open(path, offset)
+                        return
+                    break
+                logger.warning(f"Cannot resume following {self.path}, its checkpointed file is gone")
+        if from_end:
+            self.done.update((key, path_fingerprint(path)) for _, path, key in files[:-1])
+            self._open(files[-1][1], -1)
+        else:
+            self._open(files[0][1])
+
+    @property
+    def position(self) -> Optional[Position]:
+        """
+        Position after the last complete line returned
+        """
+        if self.fp is None:
+            return None
+        if self.fingerprint is None:
+            self.fingerprint = fingerprint(self.fp.fileno())
+        return (*self.key, self.fingerprint, self.fp.tell() - len(self.partial))
+
+    def _split(self, data: bytes) -> List[str]:
+        *lines, self.partial = (self.partial + data).split(b"\n")
+        return [line.decode("utf-8", errors="replace") for line in lines if line.strip()]
+
+    def _check_truncated(self) -> None:
+        """
+        Function to read the file again from its start if it was truncated or rewritten since the previous read,
+        e.g. by copytruncate. Appends following a truncation may already have made it larger than the offset,
+        its first line then changed.
+        """
+        fd = self.fp.fileno()
+        offset = self.fp.tell()
+        if self.fingerprint is None:
+            self.fingerprint = fingerprint(fd)
+            rewritten = False
+        else:
+            rewritten = fingerprint(fd) != self.fingerprint
+        if os.fstat(fd).st_size < offset or rewritten:
+            logger.warning(f"{self.fp.name} was truncated, following it from its start")
+            self.fp.seek(0)
+            self.partial = b""
+            self.fingerprint = fingerprint(fd)
+
+    def _finish(self) -> Optional[List[str]]:
+        """
+        Function to end reading a file that was rotated away and read to its end
+        Returns: Its trailing line, complete as the file is no longer written to, None while it may still be
+        """
+        stat = os.fstat(self.fp.fileno())
+        if time.time() - stat.st_mtime < config.follow_config["rotate_wait"]:
+            return None
+        lines = [self.partial.decode("utf-8", errors="replace")] if self.partial.strip() else []
+        self.partial = b""
+        self.done[self.key] = self.fingerprint or fingerprint(self.fp.fileno())
+        return lines
+
+    def read_lines(self, max_bytes: int = None) -> List[str]:
+        """
+        Function to read the complete lines written since the previous call, without waiting for new ones
+        Args:
+            max_bytes: Bytes read at most, bounding the lines returned while catching up
+        Returns: Lines, without their line feed
+        """
+        max_bytes = max_bytes or config.follow_config["read_size"]
+        if self.fp is None:
+            files = self._pending()
+            if not files:
+                return []
+            self._open(files[0][1])
+
+        self._check_truncated()
+        data = self.fp.read(max_bytes)
+        if data:
+            return self._split(data)
+
+        # Drained, the file may have been rotated
+        if self.directory:
+            newer = self._pending()
+            if newer:
+                lines = self._finish()
+                if lines is not None:
+                    self._open(newer[0][1])
+                return lines or []
+        else:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                # Rotated, its successor is not created yet
+                return []
+            if (stat.st_dev, stat.st_ino) != self.key:
+                lines = self._finish()
+                if lines is not None:
+                    self._open(self.path)
+                return lines or []
+        return []
+
+    def close(self) -> None:
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+
+def load_checkpoint(path: str) -> Optional[Position]:
+    """
+    Function to read the position of a followed path saved by save_checkpoint
+    Args:
+        path: Followed file or directory
+    Returns: Position, None if there is no checkpoint for path
+    """
+    checkpoint_path = config.follow_config["checkpoint_path"]
+    if not os.path.isfile(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'rb') as fp:
+        checkpoint = pickle.load(fp)
+    return checkpoint["position"] if checkpoint["path"] == os.path.abspath(path) else None
+
+
+def save_checkpoint(path: str, position: Optional[Position]) -> None:
+    """
+    Function to save the position up to which a followed path was ingested
+    Args:
+        path: Followed file or directory
+        position: Position of its tailer
+    """
+    if position is None:
+        return
+    checkpoint_path = config.follow_config["checkpoint_path"]
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'wb') as fp:
+        pickle.dump({"path": os.path.abspath(path), "position": position}, fp)
+    os.replace(tmp_path, checkpoint_path)
@@ -0,0 +1,144 @@
+from typing import Dict, Iterable, List
+
+from src import config
+from src.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class HashtagStore:
+    """
+    Hashtags in MySQL, normalized to an integer dictionary.
+
+    hashtag_dict maps the lowercased hashtag text to a hashtag_id and tweet_hashtags holds one row per
+    (hashtag_id, tweet_id), so the postings of a hashtag are a primary key range scan.
+    """
+
+    def __init__(self, mysql_conn):
+        self.mysql_conn = mysql_conn
+        self.hashtag_ids = {}
+        self.pending = []
+
+    def create_tables(self) -> None:
+        """
+        Function to create the hashtag tables in MySQL
+        """
+        sql_setup = ["""CREATE TABLE IF NOT EXISTS hashtag_dict (
+                        hashtag_id INT UNSIGNED NOT NULL AUTO_INCREMENT,
+                        hashtag VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+                        PRIMARY KEY (hashtag_id),
+                        UNIQUE INDEX (hashtag)
+                        );
+                     """,
+                     """CREATE TABLE IF NOT EXISTS tweet_hashtags (
+                        hashtag_id INT UNSIGNED NOT NULL,
+                        tweet_id BIGINT UNSIGNED NOT NULL,
+                        user_id VARCHAR(255),
+                        PRIMARY KEY (hashtag_id, tweet_id),
+                        INDEX (tweet_id)
+                        );
+                     """]
+        try:
+            with self.mysql_conn.cursor() as cursor:
+                for sql in sql_setup:
+                    cursor.execute(sql)
+            self.mysql_conn.commit()
+        except Exception:
+            logger.exception("Error occurred while creating hashtag tables in MySQL DB.")
+
+    @staticmethod
+    def normalize(hashtag: str) -> str:
+        # Also used by TrendingHashtags and the invalidation log, so trending tags can be searched as they are shown
+        return hashtag.lstrip("#").lower()
+
+    def _select_ids(self, cursor, hashtags: List[str]) -> None:
+        placeholders = ", ".join(["%s"] * len(hashtags))
+        cursor.execute(f"SELECT hashtag, hashtag_id FROM hashtag_dict WHERE hashtag IN ({placeholders})", hashtags)
+        self.hashtag_ids.update(cursor.fetchall())
+
+    def get_ids(self, hashtags: Iterable[str]) -> Dict[str, int]:
+        """
+        Function to get the ids of normalized hashtags, adding the ones not seen before to the dictionary
+        Args:
+            hashtags: Normalized hashtags
+        Returns: Dictionary with hashtag as key and hashtag_id as value
+        """
+        hashtags = set(hashtags)
+        missing = [h for h in hashtags if h not in self.hashtag_ids]
+        if missing:
+            with self.mysql_conn.cursor() as cursor:
+                self._select_ids(cursor, missing)
+                missing = [h for h in missing if h not in self.hashtag_ids]
+                if missing:
+                    cursor.executemany("INSERT IGNORE INTO hashtag_dict (hashtag) VALUES (%s)", [(h,) for h in missing])
+                    self.mysql_conn.commit()
+                    self._select_ids(cursor, missing)
+        return {h: self.hashtag_ids[h] for h in hashtags}
+
+    def add(self, hashtags: Iterable[str], tweet_id: str, user_id: str) -> None:
+        """
+        Function to buffer the hashtags of a tweet, they are written in bulk by flush
+        Args:
+            hashtags: Hashtags mentioned in the tweet
+            tweet_id: Tweet in which the hashtags were mentioned
+            user_id: User who used the hashtags
+        """
+        for hashtag in hashtags:
+            self.pending.append((self.normalize(hashtag), int(tweet_id), user_id))
+        if len(self.pending) >= config.hashtag_config["batch_size"]:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Function to write the buffered hashtags to MySQL
+        """
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        hashtag_ids = self.get_ids(h for h, _, _ in pending)
+        rows = [(hashtag_ids[h], tweet_id, user_id) for h, tweet_id, user_id in pending]
+        with self.mysql_conn.cursor() as cursor:
+            cursor.executemany("INSERT IGNORE INTO tweet_hashtags (hashtag_id, tweet_id, user_id) VALUES (%s, %s, %s)",
+                               rows)
+        self.mysql_conn.commit()
+        logger.debug(f"Saved {len(rows)} hashtags")
+
+    def get_tweet_ids(self, hashtag: str, conn=None) -> List[str]:
+        """
+        Function to get the ids of the tweets mentioning a hashtag, newest first
+        Args:
+            hashtag: Hashtag to be searched
+            conn: Connection to query with, e.g. one lent by a pool, defaults to the connection of the store
+        Returns: List of tweet ids
+        """
+        query = """
+        SELECT th.tweet_id
+        FROM hashtag_dict hd
+        JOIN tweet_hashtags th ON th.hashtag_id = hd.hashtag_id
+        WHERE hd.hashtag = %s
+        ORDER BY th.tweet_id DESC;
+        """
+        with (conn or self.mysql_conn).cursor() as cursor:
+            cursor.execute(query, (self.normalize(hashtag),))
+            return [str(item[0]) for item in cursor.fetchall()]
+
+    def migrate_legacy_table(self) -> None:
+        """
+        Function to copy rows of the old free text hashtags table, if any, into the dictionary encoded tables.
+        Rows already copied are skipped, so it can be run again.
+        """
+        normalized = "CONVERT(TRIM(LEADING '#' FROM LOWER(h.hashtag)) USING utf8mb4) COLLATE utf8mb4_bin"
+        with self.mysql_conn.cursor() as cursor:
+            cursor.execute("""SELECT COUNT(*) FROM information_schema.TABLES
+                              WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'hashtags'""")
+            if not cursor.fetchone()[0]:
+                return
+            cursor.execute(f"INSERT IGNORE INTO hashtag_dict (hashtag) SELECT DISTINCT {normalized} FROM hashtags h")
+            cursor.execute(f"""
+            INSERT IGNORE INTO tweet_hashtags (hashtag_id, tweet_id, user_id)
+            SELECT hd.hashtag_id, h.tweet_id, h.user_id
+            FROM hashtags h
+            JOIN hashtag_dict hd ON hd.hashtag = {normalized}
+            """)
+        self.mysql_conn.commit()
+        logger.info("Migrated legacy hashtags table")
@@ -0,0 +1,279 @@
+import json
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src import config
+from src.follow import fingerprint
+from src.log import get_logger
+from src.scheduler import add_interval_job
+
+logger = get_logger(__name__)
+
+TOPICS = ("tweets", "users", "hashtags")
+
+# (inode, fingerprint, offset) of the next event to be read, the inode of a rotated log is reused right away
+Position = Tuple[Optional[int], Optional[str], int]
+
+
+class InvalidationLog:
+    """
+    Publishing side of the invalidation channel, an append-only log of JSON lines next to the caches.
+
+    Ingest buffers the keys it changed and appends them as one line, once the store committed them, e.g.
+    {"time": 1712000000.0, "tweets": ["1250..."], "users": ["1000..."], "hashtags": ["covid19"]}. Keys of
+    changes the store committed as they were made are written every invalidation.publish_interval seconds, the
+    keys of deferred topics on flush, after the store flushed its buffered writes. The log is rotated to
+    <path>.1 once it is larger than invalidation.max_bytes.
+    """
+
+    def __init__(self, path: str = None, deferred: Iterable[str] = TOPICS):
+        """
+        Args:
+            path: Log file
+            deferred: Topics whose changes are only committed by the next flush of the store
+        """
+        self.path = path or config.invalidation_config["path"]
+        self.deferred_topics = set(deferred)
+        # Keys of committed changes, and of changes committed by the next flush
+        self.pending: Dict[str, Set[str]] = defaultdict(set)
+        self.deferred: Dict[str, Set[str]] = defaultdict(set)
+        self.lock = threading.Lock()
+        self.job = None
+
+    def publish(self, topic: str, keys: Iterable[str]) -> None:
+        """
+        Function to buffer keys to be invalidated
+        Args:
+            topic: One of TOPICS
+            keys: Changed tweet ids, user ids or normalized hashtags
+        """
+        with self.lock:
+            if topic in self.deferred_topics:
+                self.deferred[topic].update(keys)
+                return
+            self.pending[topic].update(keys)
+            if self.job is None:
+                # Also runs while ingest is stalled, e.g. waiting on a slow store
+                self.job = add_interval_job(self.write_pending,
+                                            seconds=config.invalidation_config["publish_interval"])
+
+    def flush(self) -> None:
+        """
+        Function to append every buffered key to the log, once the store flushed its buffered writes
+        """
+        with self.lock:
+            for topic, keys in self.deferred.items():
+                self.pending[topic].update(keys)
+            self.deferred.clear()
+            self._write()
+
+    def write_pending(self) -> None:
+        """
+        Function to append the buffered keys of committed changes to the log
+        """
+        with self.lock:
+            self._write()
+
+    def _write(self) -> None:
+        if not self.pending:
+            return
+        event = {"time": time.time(), **{topic: sorted(keys) for topic, keys in self.pending.items() if keys}}
+        self.pending.clear()
+        line = (json.dumps(event, separators=(",", ":")) + "\n").encode()
+        # Opened per flush, so that a log rotated by another publisher is not written to
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > config.invalidation_config["max_bytes"]:
+            # Subscribers read the rest of the rotated file through the descriptor they hold
+            os.replace(self.path, f"{self.path}.1")
+            logger.info(f"Rotated invalidation log {self.path}")
+
+
+class InvalidationSubscriber:
+    """
+    Reading side of the invalidation channel, one per process. Caches subscribe to a topic and the log is
+    polled on the shared scheduler, evicting the published keys from every subscribed cache.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.invalidation_config["path"]
+        self.caches: Dict[str, weakref.WeakSet] = defaultdict(weakref.WeakSet)
+        self.lock = threading.RLock()
+        self.fp = None
+        self.inode = None
+        self.fingerprint = None
+        self.partial = b""
+        # Number of events applied, changes whenever cached data may have been evicted
+        self.version = 0
+        self.job = None
+        self._open(at_end=True)
+
+    def _open(self, at_end: bool = False) -> None:
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        self.inode, self.fingerprint, self.partial = None, None, b""
+        try:
+            self.fp = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        self.inode = os.fstat(self.fp.fileno()).st_ino
+        self.fingerprint = fingerprint(self.fp.fileno())
+        if at_end:
+            self.fp.seek(0, os.SEEK_END)
+
+    @property
+    def position(self) -> Position:
+        with self.lock:
+            if self.fp is None:
+                return None, None, 0
+            if self.fingerprint is None:
+                # Opened while empty
+                self.fingerprint = fingerprint(self.fp.fileno())
+            return self.inode, self.fingerprint, self.fp.tell() - len(self.partial)
+
+    def subscribe(self, topic: str, cache) -> None:
+        """
+        Function to evict keys of a topic from cache whenever they are published
+        Args:
+            topic: One of TOPICS
+            cache: Object with an evict(keys) method
+        """
+        if topic not in TOPICS:
+            raise ValueError(f"Unknown invalidation topic {topic}")
+        with self.lock:
+            self.caches[topic].add(cache)
+        self.start()
+
+    def start(self) -> None:
+        """
+        Function to start polling the log, version then follows ingest even before a cache subscribes
+        """
+        with self.lock:
+            if self.job is None:
+                self.job = add_interval_job(self.poll, seconds=config.invalidation_config["poll_interval"])
+
+    def _read_events(self) -> List[dict]:
+        self.partial += self.fp.read()
+        lines = self.partial.split(b"\n")
+        # A line being written is completed by a later read
+        self.partial = lines.pop()
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping malformed invalidation event in {self.path}")
+        return events
+
+    def _apply(self, events: List[dict]) -> None:
+        for event in events:
+            for topic in TOPICS:
+                if event.get(topic):
+                    for cache in list(self.caches[topic]):
+                        cache.evict(event[topic])
+            self.version += 1
+
+    def _clear_all(self) -> None:
+        for caches in self.caches.values():
+            for cache in list(caches):
+                cache.clear()
+        self.version += 1
+
+    def poll(self) -> None:
+        """
+        Function to apply the events published since the previous poll
+        """
+        with self.lock:
+            if self.fp is None:
+                # Created since, every event in it is new
+                self._open()
+                if self.fp is None:
+                    return
+            self._apply(self._read_events())
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if stat.st_ino != self.inode:
+                # Rotated, the old file was read to its end above
+                logger.debug(f"Following rotated invalidation log {self.path}")
+                self._open()
+                self._apply(self._read_events())
+            elif stat.st_size < self.fp.tell():
+                # Truncated, events may have been missed
+                logger.warning(f"Invalidation log {self.path} was truncated, clearing caches")
+                self._open()
+                self._clear_all()
+
+    def replay(self, position: Position, data: dict, topic: str) -> bool:
+        """
+        Function to evict from a cache loaded from disk the keys published since it was saved
+        Args:
+            position: Position of the log when the cache was saved
+            data: Cached entries by key
+            topic: Topic of the cache
+        Returns: Boolean flag indicating whether every event since position could be read
+        """
+        if len(position) != 3:
+            # Saved before fingerprints were recorded
+            return False
+        inode, saved_fingerprint, offset = position
+        paths = [f"{self.path}.1", self.path]
+        files = []
+        for path in paths:
+            try:
+                files.append(open(path, 'rb'))
+            except FileNotFoundError:
+                pass
+        try:
+            # Before its first event was written a log can only be at its start
+            keys = [(os.fstat(fp.fileno()).st_ino, fingerprint(fp.fileno()) if saved_fingerprint else None)
+                    for fp in files]
+            if inode is None:
+                # No log existed when saved, every event in it is newer
+                start, offset = 0, 0
+            elif (inode, saved_fingerprint) in keys:
+                start = keys.index((inode, saved_fingerprint))
+            else:
+                return False
+            for i, fp in enumerate(files[start:]):
+                fp.seek(offset if i == 0 else 0)
+                if i == 0 and os.fstat(fp.fileno()).st_size < offset:
+                    return False
+                for line in fp.read().split(b"\n"):
+                    if not line:
+                        continue
+                    try:
+                        keys = json.loads(line).get(topic) or ()
+                    except ValueError:
+                        continue
+                    for key in keys:
+                        data.pop(key, None)
+            return True
+        finally:
+            for fp in files:
+                fp.close()
+
+
+_subscriber = None
+_lock = threading.Lock()
+
+
+def get_subscriber() -> InvalidationSubscriber:
+    """
+    Function to get the invalidation subscriber of the process, created on first use
+    """
+    global _subscriber
+    with _lock:
+        if _subscriber is None:
+            _subscriber = InvalidationSubscriber()
+        return _subscriber
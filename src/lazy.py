@@ -0,0 +1,28 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, keeping heavy dependencies out of
+    import time for processes that never use them
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._module or self._load(), attr)
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
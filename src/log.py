@@ -0,0 +1,23 @@
+import logging
+import threading
+
+_configured = False
+_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Function to get a logger, configuring logging from logging.conf the first time it is called
+    Args:
+        name: Logger name, usually __name__
+    Returns: Logger
+    """
+    global _configured
+    if not _configured:
+        with _lock:
+            if not _configured:
+                from logging.config import fileConfig
+                # Loggers created before, e.g. by an earlier import, keep working
+                fileConfig('logging.conf', disable_existing_loggers=False)
+                _configured = True
+    return logging.getLogger(name)
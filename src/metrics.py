@@ -0,0 +1,257 @@
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from collections import Counter as _Counter, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+from src import config
+from src.log import get_logger
+
+logger = get_logger(__name__)
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str):
+        yield name, {}, self.value
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value) -> None:
+        self.value = value
+
+    def samples(self, name: str):
+        yield name, {}, self.value
+
+
+class Meter:
+    """
+    Events per second over a sliding window
+    """
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._seconds = deque()
+        self._lock = threading.Lock()
+
+    def mark(self, amount=1) -> None:
+        now = int(time.time())
+        with self._lock:
+            if self._seconds and self._seconds[-1][0] == now:
+                self._seconds[-1][1] += amount
+            else:
+                self._seconds.append([now, amount])
+            self._expire(now)
+
+    def _expire(self, now: int) -> None:
+        while self._seconds and self._seconds[0][0] <= now - self.window:
+            self._seconds.popleft()
+
+    @property
+    def value(self) -> float:
+        with self._lock:
+            self._expire(int(time.time()))
+            return sum(count for _, count in self._seconds) / self.window
+
+    def samples(self, name: str):
+        yield name, {}, self.value
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name: str):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield f"{name}_bucket", {"le": "+Inf" if bound == float("inf") else repr(bound)}, cumulative
+        yield f"{name}_sum", {}, self.sum
+        yield f"{name}_count", {}, self.count
+
+
+class MetricsRegistry:
+    """
+    Process wide registry of metrics, rendered in the Prometheus text format or as JSON
+    """
+
+    TYPES = {Counter: "counter", Gauge: "gauge", Meter: "gauge", Histogram: "histogram"}
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[type, str, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, labels: Dict[str, str]):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (cls, help_text, {}))
+            if family[0] is not cls:
+                raise ValueError(f"Metric {name} is already registered as a {self.TYPES[family[0]]}")
+            metrics = family[2]
+            if key not in metrics:
+                metrics[key] = cls()
+            return metrics[key]
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def meter(self, name: str, help_text: str = "", **labels) -> Meter:
+        return self._get(Meter, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels)
+
+    @contextmanager
+    def timer(self, name: str, help_text: str = "", **labels):
+        """
+        Context manager observing the time spent in its block, in seconds
+        """
+        histogram = self.histogram(name, help_text, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            families = list(self._families.items())
+        for name, (cls, help_text, metrics) in families:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {self.TYPES[cls]}")
+            for key, metric in list(metrics.items()):
+                for sample_name, extra_labels, value in metric.samples(name):
+                    labels = dict(key, **extra_labels)
+                    label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                    lines.append(f"{sample_name}{{{label_str}}} {value}" if label_str else f"{sample_name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict:
+        result = {}
+        with self._lock:
+            families = list(self._families.items())
+        for name, (cls, _, metrics) in families:
+            series = []
+            for key, metric in list(metrics.items()):
+                entry = {"labels": dict(key)}
+                if cls is Histogram:
+                    entry.update(count=metric.count, sum=metric.sum,
+                                 buckets=dict(zip(map(repr, metric.buckets + (float("inf"),)), metric.counts)))
+                else:
+                    entry["value"] = metric.value
+                series.append(entry)
+            result[name] = series
+        return result
+
+
+registry = MetricsRegistry()
+
+
+def timed(name: str, help_text: str = "", **labels):
+    """
+    Decorator observing the duration of each call in a histogram
+    Args:
+        name: Histogram name
+        help_text: Description of the histogram
+        labels: Labels of the histogram
+    """
+    histogram = registry.histogram(name, help_text, **labels)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Logging filter letting through one in every `rate` records below WARNING from each call site
+    """
+
+    def __init__(self, rate: int = None):
+        super().__init__()
+        self.rate = rate
+        self.seen = _Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate is None:
+            self.rate = config.metrics_config["log_sample_rate"]
+        if record.levelno >= logging.WARNING or self.rate <= 1:
+            return True
+        site = (record.pathname, record.lineno)
+        self.seen[site] += 1
+        return self.seen[site] % self.rate == 1
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = registry.render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(registry.to_dict()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_metrics_server(port: int = None) -> ThreadingHTTPServer:
+    """
+    Function to serve /metrics (Prometheus text format) and /metrics.json from a background thread
+    Args:
+        port: Port to listen on
+    Returns: Running server
+    """
+    port = port or config.metrics_config["port"]
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
@@ -0,0 +1,125 @@
+import hashlib
+import math
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from src import config
+from src.log import get_logger
+
+logger = get_logger(__name__)
+
+COUNT_COLUMNS = ["tweets", "with_urls", "with_hashtags", "with_geo"]
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch estimating the number of distinct values. Sketches with the same precision are
+    merged by taking the register wise maximum, so counts from several workers can be combined.
+    """
+
+    def __init__(self, precision: int = None, registers: bytes = None):
+        self.precision = precision or config.rollup_config["hll_precision"]
+        self.m = 1 << self.precision
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        x = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = x >> (64 - self.precision)
+        remaining = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge a HyperLogLog of precision {other.precision} into one of precision "
+                             f"{self.precision}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small range correction
+            estimate = self.m * math.log(self.m / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        registers = zlib.decompress(data)
+        return cls(precision=int(math.log2(len(registers))), registers=registers)
+
+
+class TweetRollups:
+    """
+    Pre-aggregated tweet counts per hour x lang x tweet type, and distinct users per hour, maintained at ingest time.
+    Tweets are counted when first inserted into the store, so ingesting a file again does not count them twice.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(lambda: [0] * len(COUNT_COLUMNS))
+        self.users = defaultdict(HyperLogLog)
+        self.pending = 0
+
+    @staticmethod
+    def tweet_type(tweet_data: dict) -> str:
+        # Processing replaces retweeted_status by is_retweet_status
+        if 'retweeted_status' in tweet_data or tweet_data.get('is_retweet_status'):
+            return 'retweet'
+        if 'quoted_status' in tweet_data or tweet_data.get('is_quote_status'):
+            return 'quote'
+        if tweet_data.get('in_reply_to_status_id_str'):
+            return 'reply'
+        return 'tweet'
+
+    @staticmethod
+    def hour(timestamp_str: str) -> str:
+        created_at = datetime.strptime(timestamp_str, '%a %b %d %H:%M:%S %z %Y').astimezone(timezone.utc)
+        return created_at.strftime('%Y-%m-%d %H:00:00')
+
+    def add(self, tweet_data: dict) -> None:
+        """
+        Function to count a tweet inserted into the store
+        Args:
+            tweet_data: Dict have tweet data, with the user id as user
+        Returns: None
+        """
+        hour = self.hour(tweet_data['created_at'])
+        entities = tweet_data.get('entities', {})
+        counts = self.counts[(hour, tweet_data.get('lang') or 'und', self.tweet_type(tweet_data))]
+        counts[0] += 1
+        counts[1] += 1 if entities.get('urls') else 0
+        counts[2] += 1 if entities.get('hashtags') else 0
+        counts[3] += 1 if tweet_data.get('coordinates') is not None else 0
+        self.users[hour].add(tweet_data['user'])
+        self.pending += 1
+
+    def merge(self, other: "TweetRollups") -> None:
+        """
+        Function to merge rollups of another worker into this one
+        """
+        for key, counts in other.counts.items():
+            self.counts[key] = [a + b for a, b in zip(self.counts[key], counts)]
+        for hour, hll in other.users.items():
+            self.users[hour].merge(hll)
+        self.pending += other.pending
+
+    def flush(self, store) -> None:
+        """
+        Function to merge the buffered rollups into the store and reset the buffer
+        Args:
+            store: TweetStore
+        Returns: None
+        """
+        if not self.pending:
+            return
+        store.save_rollups(self.counts, self.users)
+        logger.info(f"Flushed rollups of {self.pending} tweets")
+        self.counts.clear()
+        self.users.clear()
+        self.pending = 0
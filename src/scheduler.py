@@ -0,0 +1,72 @@
+import atexit
+import threading
+from typing import Callable
+
+from src.log import get_logger
+
+logger = get_logger(__name__)
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Function to get the background scheduler shared by the whole process, started on first use
+    Returns: Running BackgroundScheduler
+    """
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+
+            _scheduler = BackgroundScheduler(daemon=True)
+            _scheduler.start()
+            atexit.register(shutdown)
+            logger.debug("Started shared scheduler")
+        return _scheduler
+
+
+def add_interval_job(func: Callable, seconds: int):
+    """
+    Function to run func every seconds on the shared scheduler
+    Args:
+        func: Function to be run
+        seconds: Interval between runs
+    Returns: Job, to be passed to remove_job
+    """
+    return get_scheduler().add_job(func, 'interval', seconds=seconds)
+
+
+def remove_job(job) -> bool:
+    """
+    Function to stop running a job
+    Returns: Boolean flag indicating whether the job was still scheduled, it is not after shutdown
+    """
+    with _lock:
+        if _scheduler is None:
+            return False
+    try:
+        job.remove()
+        return True
+    except Exception:
+        logger.debug("Job %s was already removed", job)
+        return False
+
+
+def shutdown() -> None:
+    """
+    Function to run every job one last time, e.g. to save caches to disk, and shut down the scheduler
+    """
+    global _scheduler
+    with _lock:
+        scheduler, _scheduler = _scheduler, None
+    if scheduler is None:
+        return
+    for job in scheduler.get_jobs():
+        try:
+            job.func()
+        except Exception:
+            logger.exception(f"Error running {job} at shutdown")
+    scheduler.shutdown(wait=False)
+    logger.info("Scheduler shut down successfully.")
@@ -0,0 +1,325 @@
+import os
+import pickle
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.parquet as pq
+import pymongo
+from bson import ObjectId
+
+from src import config
+from src.hashtag_store import HashtagStore
+from src.log import get_logger
+from src.store import RemoteStore, get_store
+
+logger = get_logger(__name__)
+
+SCHEMAS = {
+    "tweets": pa.schema([
+        ("id_str", pa.string()),
+        ("user", pa.string()),
+        ("text", pa.string()),
+        ("lang", pa.string()),
+        ("created_at", pa.timestamp("s", tz="UTC")),
+        ("is_retweet_status", pa.bool_()),
+        ("is_quote_status", pa.bool_()),
+        ("retweeted_status_id_str", pa.string()),
+        ("in_reply_to_status_id_str", pa.string()),
+        ("quote_count", pa.int64()),
+        ("reply_count", pa.int64()),
+        ("retweet_count", pa.int64()),
+        ("favorite_count", pa.int64()),
+        ("updated_at", pa.timestamp("ms", tz="UTC")),
+    ]),
+    "users": pa.schema([
+        ("id_str", pa.string()),
+        ("name", pa.string()),
+        ("screen_name", pa.string()),
+        ("protected", pa.bool_()),
+        ("verified", pa.bool_()),
+        ("followers_count", pa.int64()),
+        ("friends_count", pa.int64()),
+        ("listed_count", pa.int64()),
+        ("favourites_count", pa.int64()),
+        ("statuses_count", pa.int64()),
+        ("created_at", pa.timestamp("s")),
+        ("last_post_timestamp", pa.timestamp("s")),
+        ("updated_at", pa.timestamp("us")),
+    ]),
+    "hashtags": pa.schema([
+        ("hashtag", pa.string()),
+        ("user_id", pa.string()),
+        ("tweet_id", pa.string()),
+    ]),
+    "edges": pa.schema([
+        ("src", pa.string()),
+        ("dst", pa.string()),
+        ("relationship", pa.string()),
+        ("count", pa.int64()),
+        ("last_interaction", pa.string()),
+        ("updated_at", pa.timestamp("ms", tz="UTC")),
+    ]),
+}
+
+# Columns identifying a row of the datasets whose rows are exported again when updated, the latest is the one
+# with the greatest updated_at
+KEYS = {
+    "tweets": ["id_str"],
+    "users": ["id_str"],
+    "edges": ["src", "dst", "relationship"],
+}
+
+
+class SnapshotExporter:
+    """
+    Writes incremental, date partitioned columnar snapshots of the stores for BI dashboards.
+
+    Every dataset keeps a watermark so that each run only exports rows written since the previous run. Tweets,
+    users and edges are exported again when updated, with the (updated_at, id) of the last row exported as
+    watermark and readers keeping the latest row of each key. Hashtags of a tweet never change, they use the
+    MongoDB _id of the tweet. Rows written less than export.settle_seconds ago are left to the next run, as a
+    write stamped earlier may not be visible yet.
+
+    Only the remote store is exported, the embedded store keeps no updated_at to use as watermark.
+    """
+
+    def __init__(self):
+        store = get_store()
+        if not isinstance(store, RemoteStore):
+            raise ValueError(f"Snapshots cannot be exported from the {config.store_config['backend']} store, "
+                             f"only from the remote one")
+        self.path = config.export_config["path"]
+        self.format = config.export_config["format"]
+        self.batch_size = config.export_config["batch_size"]
+        self.watermark_path = config.export_config["watermark_path"]
+        self.watermarks = self.load_watermarks()
+        self.mysql_conn = store.mysql_conn
+        self.tweet_collection = store.tweet_collection
+        self.neo4j_connection = store.neo4j_connection
+
+    def load_watermarks(self) -> Dict:
+        """
+        Function to load the export watermarks from disk
+        Returns: Dictionary with dataset name as key and watermark as value
+        """
+        if os.path.isfile(self.watermark_path):
+            with open(self.watermark_path, 'rb') as fp:
+                return pickle.load(fp)
+        return {}
+
+    def save_watermarks(self) -> None:
+        """
+        Function to save the export watermarks to disk
+        """
+        with open(self.watermark_path, 'wb') as fp:
+            pickle.dump(self.watermarks, fp)
+
+    @staticmethod
+    def parse_tweet_datetime(timestamp_str: Optional[str]) -> Optional[datetime]:
+        if not timestamp_str:
+            return None
+        return datetime.strptime(timestamp_str, '%a %b %d %H:%M:%S %z %Y').astimezone(timezone.utc)
+
+    def cutoff(self) -> datetime:
+        """
+        Function to get the time up to which rows are exported by this run
+        """
+        return datetime.now(timezone.utc) - timedelta(seconds=config.export_config["settle_seconds"])
+
+    def keyset(self, name: str) -> Optional[tuple]:
+        # Watermarks saved before keysets were used are dropped, the dataset is exported again and deduplicated
+        watermark = self.watermarks.get(name)
+        return watermark if isinstance(watermark, tuple) else None
+
+    def iter_tweets(self) -> Iterator[dict]:
+        query = {"updated_at": {"$lt": self.cutoff()}}
+        if keyset := self.keyset("tweets"):
+            updated_at, _id = keyset
+            query = {"$and": [query, {"$or": [{"updated_at": {"$gt": updated_at}},
+                                              {"updated_at": updated_at, "_id": {"$gt": _id}}]}]}
+        projection = dict.fromkeys(SCHEMAS["tweets"].names, 1)
+        cursor = self.tweet_collection.find(query, projection).sort([("updated_at", pymongo.ASCENDING),
+                                                                     ("_id", pymongo.ASCENDING)])
+        for tweet in cursor.batch_size(self.batch_size):
+            self.watermarks["tweets"] = (tweet["updated_at"], tweet.pop("_id"))
+            tweet["created_at"] = self.parse_tweet_datetime(tweet.get("created_at"))
+            tweet["is_retweet_status"] = bool(tweet.get("is_retweet_status", False))
+            tweet["is_quote_status"] = bool(tweet.get("is_quote_status", False))
+            yield tweet
+
+    def iter_users(self) -> Iterator[dict]:
+        updated_at, id_str = self.keyset("users") or (datetime(1000, 1, 1), "")
+        query = f"""
+        SELECT {", ".join(SCHEMAS["users"].names)}
+        FROM users
+        WHERE (updated_at, id_str) > (%s, %s) AND updated_at < NOW(6) - INTERVAL %s SECOND
+        ORDER BY updated_at, id_str;
+        """
+        with self.mysql_conn.cursor(dictionary=True) as cursor:
+            cursor.execute(query, (updated_at, id_str, config.export_config["settle_seconds"]))
+            while rows := cursor.fetchmany(self.batch_size):
+                for row in rows:
+                    self.watermarks["users"] = (row["updated_at"], row["id_str"])
+                    row["protected"] = None if row["protected"] is None else bool(row["protected"])
+                    row["verified"] = None if row["verified"] is None else bool(row["verified"])
+                    yield row
+
+    def iter_hashtags(self) -> Iterator[dict]:
+        query = {"entities.hashtags.0": {"$exists": True}, "_id": {"$lt": ObjectId.from_datetime(self.cutoff())}}
+        if "hashtags" in self.watermarks:
+            query["_id"]["$gt"] = self.watermarks["hashtags"]
+        projection = {"id_str": 1, "user": 1, "entities.hashtags.text": 1}
+        for tweet in self.tweet_collection.find(query, projection).sort("_id", pymongo.ASCENDING).batch_size(self.batch_size):
+            self.watermarks["hashtags"] = tweet["_id"]
+            for hashtag in tweet["entities"]["hashtags"]:
+                yield {"hashtag": HashtagStore.normalize(hashtag["text"]), "user_id": tweet["user"], "tweet_id": tweet["id_str"]}
+
+    def iter_edges(self) -> Iterator[dict]:
+        updated_at, element_id = self.keyset("edges") or (0, "")
+        query = """MATCH (a:user)-[r]->(b:user)
+                WHERE r.updated_at < $cutoff
+                AND (r.updated_at > $updated_at OR (r.updated_at = $updated_at AND elementId(r) > $element_id))
+                RETURN a.id_str as src, b.id_str as dst, type(r) as relationship,
+                r.count as count, r.last_interaction as last_interaction,
+                r.updated_at as updated_at, elementId(r) as element_id
+                ORDER BY updated_at, element_id
+                """
+        cutoff = int(self.cutoff().timestamp() * 1000)
+        with self.neo4j_connection.session() as session:
+            for record in session.run(query, cutoff=cutoff, updated_at=updated_at, element_id=element_id):
+                row = record.data()
+                self.watermarks["edges"] = (row["updated_at"], row.pop("element_id"))
+                # Milliseconds since the epoch, as set by timestamp()
+                row["updated_at"] = datetime.fromtimestamp(row["updated_at"] / 1000, timezone.utc)
+                yield row
+
+    def write_dataset(self, name: str, rows: Iterator[dict]) -> int:
+        """
+        Function to write rows of a dataset into a new partition file
+        Args:
+            name: Dataset name, one of SCHEMAS
+            rows: Rows to be written
+        Returns: Number of rows written
+        """
+        schema = SCHEMAS[name]
+        partition = os.path.join(self.path, name, f"dt={datetime.now(timezone.utc):%Y-%m-%d}")
+        os.makedirs(partition, exist_ok=True)
+        file_name = f"part-{time.time_ns()}.{self.format}"
+        file_path = os.path.join(partition, file_name)
+        # Files starting with a dot are ignored by readers until they are complete
+        tmp_path = os.path.join(partition, f".{file_name}")
+
+        if self.format == "parquet":
+            writer = pq.ParquetWriter(tmp_path, schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(tmp_path, schema)
+
+        n_rows = 0
+        batch = []
+        try:
+            with writer:
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) == self.batch_size:
+                        writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                        n_rows += len(batch)
+                        batch = []
+                if batch:
+                    writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                    n_rows += len(batch)
+            if n_rows:
+                os.replace(tmp_path, file_path)
+        finally:
+            # Left behind by an empty or failed export
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return n_rows
+
+    def export(self, datasets: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Function to export everything added since the last run
+        Args:
+            datasets: Datasets to export, defaults to all of them
+        Returns: Dictionary with dataset name as key and number of exported rows as value
+        """
+        sources = {
+            "tweets": self.iter_tweets,
+            "users": self.iter_users,
+            "hashtags": self.iter_hashtags,
+            "edges": self.iter_edges,
+        }
+        exported = {}
+        for name in datasets or sources:
+            logger.info(f"Exporting {name} snapshot")
+            previous = dict(self.watermarks)
+            try:
+                exported[name] = self.write_dataset(name, sources[name]())
+            except Exception:
+                self.watermarks = previous
+                raise
+            # Watermarks only move forward once the partition file is in place
+            self.save_watermarks()
+            logger.info(f"Exported {exported[name]} rows of {name}")
+        return exported
+
+
+class SnapshotReader:
+    """
+    Reads snapshots written by SnapshotExporter. Arrow IPC files are memory mapped, so scans are zero-copy.
+    """
+
+    def __init__(self, path: str = None, file_format: str = None):
+        self.path = path or config.export_config["path"]
+        self.format = file_format or config.export_config["format"]
+        self.filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+
+    def dataset(self, name: str) -> ds.Dataset:
+        partitioning = ds.partitioning(pa.schema([("dt", pa.string())]), flavor="hive")
+        return ds.dataset(os.path.join(self.path, name), schema=SCHEMAS[name].append(pa.field("dt", pa.string())),
+                          format="ipc" if self.format == "arrow" else self.format,
+                          partitioning=partitioning, filesystem=self.filesystem)
+
+    def read(self, name: str, columns: Optional[List[str]] = None, since: Optional[str] = None,
+             latest: bool = True) -> pa.Table:
+        """
+        Function to read a dataset
+        Args:
+            name: Dataset name, one of SCHEMAS
+            columns: Columns to read, defaults to all of them
+            since: Only read partitions from this date on (YYYY-MM-DD)
+            latest: Keep only the most recent row of tweets, users and edges exported more than once
+        Returns: Arrow table
+        """
+        dataset = self.dataset(name)
+        partition_filter = (ds.field("dt") >= since) if since else None
+        dedup = latest and name in KEYS
+        read_columns = columns
+        if dedup and columns is not None:
+            # The key and ordering columns are needed to deduplicate, whether they were asked for or not
+            read_columns = list(dict.fromkeys(columns + KEYS[name] + ["updated_at"]))
+        table = dataset.to_table(columns=read_columns, filter=partition_filter)
+        if dedup:
+            table = self.latest_rows(name, table)
+            if columns is not None:
+                table = table.select(columns)
+        return table
+
+    @staticmethod
+    def latest_rows(name: str, table: pa.Table) -> pa.Table:
+        """
+        Function to keep the row with the greatest updated_at of each key, in updated_at order. The order of the
+        files of a dataset is not the order they were written in, rows exported before updated_at existed come
+        first.
+        """
+        table = table.take(pc.sort_indices(table, sort_keys=[("updated_at", "ascending")], null_placement="at_start"))
+        indexed = table.append_column("_row", pa.array(range(table.num_rows), pa.int64()))
+        last = indexed.group_by(KEYS[name], use_threads=False).aggregate([("_row", "max")])["_row_max"]
+        return table.take(pc.take(last, pc.sort_indices(last)))
+
+    def read_pandas(self, name: str, **kwargs):
+        return self.read(name, **kwargs).to_pandas()
@@ -0,0 +1,751 @@
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src import config
+from src.connections import get_mongodb_conn, get_mysql_conn, get_mysql_pool, get_neo4j_conn
+from src.hashtag_store import HashtagStore
+from src.lazy import lazy_import
+from src.log import get_logger
+from src.rollups import COUNT_COLUMNS, HyperLogLog
+
+logger = get_logger(__name__)
+
+pymongo = lazy_import("pymongo")
+
+# Columns used when sorting users, with the value NULLs sort as in keyset pagination
+USER_SORT_COLUMNS = {
+    "followers_count": 0,
+    "friends_count": 0,
+    "listed_count": 0,
+    "favourites_count": 0,
+    "statuses_count": 0,
+    "created_at": "1000-01-01 00:00:00",
+    "last_post_timestamp": "1000-01-01 00:00:00",
+}
+
+ROLLUP_GROUPS = {"hour", "lang", "tweet_type"}
+
+# Types of the relationships between users in Neo4j
+RELATIONSHIPS = ("replied_to", "retweeted", "quoted")
+
+
+class BadRequest(ValueError):
+    """
+    Raised when the arguments of a query are invalid, e.g. an unknown sort column
+    """
+
+
+class NotFound(LookupError):
+    """
+    Raised when the subject of a query does not exist, e.g. an unknown user id
+    """
+
+
+class TweetStore(ABC):
+    """
+    Storage used by TweetDataProcessor and TwitterQueries: users, tweets, hashtags, user interactions and rollups.
+
+    Writes may be buffered, flush makes everything written so far visible to readers.
+    """
+
+    # Invalidation topics whose writes only become visible on flush, the others are committed as they are made
+    deferred_topics: Tuple[str, ...] = ("tweets", "users", "hashtags")
+
+    @abstractmethod
+    def setup(self) -> None:
+        """
+        Function to create tables and indexes used by ingest
+        """
+
+    @abstractmethod
+    def migrate(self) -> None:
+        """
+        Function to bring the data written by older versions up to date, run once after upgrading by
+        main.py migrate. It scans whole collections, so it is kept out of setup.
+        """
+
+    @abstractmethod
+    def flush(self, full: bool = True) -> None:
+        """
+        Function to write buffered data
+        Args:
+            full: Also save state that is costly to save, otherwise it may be saved later
+        """
+
+    # Users
+
+    @abstractmethod
+    def upsert_user(self, user_data: dict, last_post_timestamp: str) -> None:
+        """
+        Function to save a user
+        Args:
+            user_data: Dict have user data
+            last_post_timestamp: Creation time of the tweet the user data comes from (YYYY-MM-DD HH:MM:SS)
+        """
+
+    @abstractmethod
+    def upsert_reply_user(self, user_id: str, screen_name: str) -> None:
+        """
+        Function to save a user known only as the recipient of a reply
+        """
+
+    @abstractmethod
+    def find_users_by_name(self, name: str) -> List[dict]:
+        """
+        Function to get the users whose name contains name
+        """
+
+    @abstractmethod
+    def get_users(self, user_ids: List[str]) -> List[dict]:
+        """
+        Function to get users by id, ids that are not found are skipped
+        """
+
+    @abstractmethod
+    def iter_users(self, search_term: str, sort_by: str, order: str,
+                   fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        Function to stream users whose name contains search_term, sorted by one of USER_SORT_COLUMNS
+        Args:
+            search_term: Term to be matched against the user name
+            sort_by: One of USER_SORT_COLUMNS
+            order: asc or desc
+            fields: Columns to return, None for all of them
+        Returns: Generator of users
+        """
+
+    # Tweets
+
+    @abstractmethod
+    def find_tweet(self, tweet_id: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def insert_tweet(self, tweet_data: dict) -> None:
+        pass
+
+    @abstractmethod
+    def replace_tweet(self, tweet_id: str, tweet_data: dict) -> None:
+        pass
+
+    @abstractmethod
+    def get_tweets(self, tweet_ids: List[str], fields: Optional[List[str]] = None) -> List[dict]:
+        """
+        Function to get tweets by id, in no particular order
+        Args:
+            tweet_ids: Tweet ids
+            fields: Fields to return, None for full documents
+        """
+
+    @abstractmethod
+    def iter_tweets_by_users(self, user_ids: List[str], since: Optional[datetime] = None,
+                             fields: Optional[List[str]] = None) -> Iterator[dict]:
+        pass
+
+    @abstractmethod
+    def ensure_text_index(self) -> None:
+        """
+        Function to create the full text index searched by iter_tweets_by_keyword, if missing
+        """
+
+    @abstractmethod
+    def iter_tweets_by_keyword(self, keyword: str, since: Optional[datetime] = None,
+                               fields: Optional[List[str]] = None) -> Iterator[dict]:
+        pass
+
+    @abstractmethod
+    def popular_tweets(self, since: Optional[datetime] = None, limit: int = 10) -> List[dict]:
+        """
+        Function to get the tweets with the highest sum of quote, reply, retweet and favorite counts
+        """
+
+    # Hashtags
+
+    @abstractmethod
+    def add_hashtags(self, hashtags: List[str], tweet_id: str, user_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def hashtag_tweet_ids(self, hashtag: str) -> List[str]:
+        """
+        Function to get the ids of the tweets mentioning a normalized hashtag, newest first
+        """
+
+    # Interactions
+
+    @abstractmethod
+    def add_user_document(self, user_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def add_user_relationship(self, id_A: str, id_B: str, field_A: str, field_B: str) -> None:
+        """
+        Function to add users ids into each other's relationship lists
+        """
+
+    @abstractmethod
+    def add_interaction(self, user_A: dict, user_B: dict, relationship: str, time: str, tweet_A: str,
+                        tweet_B: str) -> None:
+        """
+        Function to add an interaction of user A with user B to the user graph
+        """
+
+    @abstractmethod
+    def relevant_users(self, user_id: str, limit: int = 10, include_tweet: bool = False) -> List[dict]:
+        """
+        Function to get the users that the users interacting with user_id interact with the most
+        Returns: Rows with screen_name, id_str, n_of_tweets, n_of_interactions, last_interaction_dt and
+        optionally tweet_list
+        """
+
+    # Rollups
+
+    @abstractmethod
+    def save_rollups(self, counts: Dict[Tuple[str, str, str], List[int]], users: Dict[str, HyperLogLog]) -> None:
+        """
+        Function to merge rollups into the stored ones
+        Args:
+            counts: COUNT_COLUMNS values by (hour, lang, tweet_type)
+            users: Distinct users sketch by hour
+        """
+
+    @abstractmethod
+    def query_rollups(self, since: Optional[str] = None, group_by: Tuple[str, ...] = ("hour",)
+                      ) -> Tuple[List[Dict], Optional[Dict[datetime, HyperLogLog]]]:
+        """
+        Function to read rollups
+        Args:
+            since: Only read hours from this timestamp on (YYYY-MM-DD HH:MM:SS, UTC)
+            group_by: Any of hour, lang, tweet_type
+        Returns: Aggregated count rows and the user sketches by hour, None when grouping by lang or tweet_type
+        """
+
+
+def get_store() -> TweetStore:
+    """
+    Function to create the store selected by store.backend in config.yml
+    """
+    if config.store_config["backend"] == "embedded":
+        from src.embedded_store import EmbeddedStore
+        return EmbeddedStore()
+    return RemoteStore()
+
+
+class RemoteStore(TweetStore):
+    """
+    Users, hashtags and rollups in MySQL, tweets in MongoDB and user interactions in Neo4j
+    """
+
+    # Users and tweets are committed row by row, hashtag postings are written in bulk on flush
+    deferred_topics = ("hashtags",)
+
+    def __init__(self):
+        self.text_index_checked = False
+
+    # Connections are opened on first use, a process running a single query only connects to one store
+
+    @cached_property
+    def mysql_conn(self):
+        # Writes of the ingest process, which runs in a single thread
+        return get_mysql_conn()
+
+    @cached_property
+    def mysql_pool(self):
+        return get_mysql_pool(config.mysql_config["pool_size"])
+
+    @cached_property
+    def mysql_slots(self) -> threading.BoundedSemaphore:
+        # The pool raises instead of waiting when all its connections are lent
+        return threading.BoundedSemaphore(config.mysql_config["pool_size"])
+
+    @contextmanager
+    def mysql_reader(self):
+        """
+        Context manager lending a pooled connection to a query, so that queries running in several threads do not
+        share a connection. Its session is reset when returned, so the next query sees the latest commits.
+        """
+        with self.mysql_slots:
+            conn = self.mysql_pool.get_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    @cached_property
+    def tweet_collection(self):
+        return get_mongodb_conn(collection="tweet_data")
+
+    @cached_property
+    def user_collection(self):
+        return get_mongodb_conn(collection="user_data")
+
+    @cached_property
+    def neo4j_connection(self):
+        return get_neo4j_conn()
+
+    @cached_property
+    def hashtag_store(self) -> HashtagStore:
+        return HashtagStore(self.mysql_conn)
+
+    @staticmethod
+    def escape(text: str) -> str:
+        return text.replace("'", "\\'").replace('"', '\\"')
+
+    def setup(self) -> None:
+        self.create_user_tb_mysql()
+        self.hashtag_store.create_tables()
+        self.create_rollup_tables()
+        self.neo4j_connection.execute_query("CREATE INDEX user_id IF NOT EXISTS FOR (n:user) ON (n.id_str)")
+        self.tweet_collection.create_index([("user", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+        self.ensure_text_index()
+        self.setup_created_ts()
+        self.setup_updated_at()
+
+    @staticmethod
+    def created_ts(tweet_data: dict) -> datetime:
+        # created_at is kept in the Twitter format, which does not sort by time
+        return datetime.strptime(tweet_data['created_at'], '%a %b %d %H:%M:%S %z %Y').astimezone(timezone.utc)
+
+    def setup_created_ts(self) -> None:
+        """
+        Function to index created_ts, the creation time of tweets as a date that since filters compare with
+        """
+        self.tweet_collection.create_index([("created_ts", pymongo.ASCENDING)])
+
+    def migrate_created_ts(self) -> None:
+        """
+        Function to set created_ts on the tweets inserted before it existed, which since filters skip until then
+        """
+        updates = []
+        n_updated = 0
+        for tweet in self.tweet_collection.find({"created_ts": {"$exists": False}}, {"created_at": 1}):
+            updates.append(pymongo.UpdateOne({"_id": tweet["_id"]}, {"$set": {"created_ts": self.created_ts(tweet)}}))
+            if len(updates) == config.query_config["page_size"]:
+                self.tweet_collection.bulk_write(updates, ordered=False)
+                n_updated += len(updates)
+                updates = []
+        if updates:
+            self.tweet_collection.bulk_write(updates, ordered=False)
+            n_updated += len(updates)
+        logger.info(f"Set created_ts on {n_updated} tweets")
+
+    def setup_updated_at(self) -> None:
+        """
+        Function to index the updated_at of tweets and interactions, the watermark of snapshot exports
+        """
+        self.tweet_collection.create_index([("updated_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+        for relationship in RELATIONSHIPS:
+            self.neo4j_connection.execute_query(f"CREATE INDEX {relationship}_updated_at IF NOT EXISTS "
+                                                f"FOR ()-[r:{relationship}]-() ON (r.updated_at)")
+
+    def migrate(self) -> None:
+        self.setup()
+        # Hashtags of the old table are only searchable once copied
+        self.hashtag_store.migrate_legacy_table()
+        self.migrate_created_ts()
+        self.migrate_updated_at()
+
+    def migrate_updated_at(self) -> None:
+        """
+        Function to add updated_at to the users table and to set it on the tweets and interactions written before
+        it existed
+        """
+        # The creation time of an ObjectId is the time the tweet was inserted
+        result = self.tweet_collection.update_many({"updated_at": {"$exists": False}},
+                                                   [{"$set": {"updated_at": {"$toDate": "$_id"}}}])
+        logger.info(f"Set updated_at on {result.modified_count} tweets")
+        with self.mysql_conn.cursor() as cursor:
+            cursor.execute("""SELECT COUNT(*) FROM information_schema.COLUMNS
+                              WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND COLUMN_NAME = 'updated_at'""")
+            if not cursor.fetchone()[0]:
+                cursor.execute("""ALTER TABLE users
+                                  ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+                                  ON UPDATE CURRENT_TIMESTAMP(6),
+                                  ADD INDEX (updated_at, id_str)""")
+                logger.info("Added updated_at to the users table")
+        self.mysql_conn.commit()
+        _, summary, _ = self.neo4j_connection.execute_query("MATCH (:user)-[r]->(:user) WHERE r.updated_at IS NULL "
+                                                            "SET r.updated_at = timestamp()")
+        logger.info(f"Set updated_at on {summary.counters.properties_set} interactions")
+
+    def flush(self, full: bool = True) -> None:
+        self.hashtag_store.flush()
+
+    def create_user_tb_mysql(self):
+        sql_setup = """CREATE TABLE IF NOT EXISTS users (
+                        id_str VARCHAR(255) NOT NULL,
+                        name VARCHAR(255),
+                        screen_name VARCHAR(255),
+                        protected BOOLEAN,
+                        verified BOOLEAN,
+                        followers_count INT,
+                        friends_count INT,
+                        listed_count INT,
+                        favourites_count INT,
+                        statuses_count INT,
+                        created_at TIMESTAMP,
+                        last_post_timestamp TIMESTAMP,
+                        updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                        PRIMARY KEY (id_str),
+                        INDEX (name),
+                        INDEX (screen_name),
+                        INDEX (updated_at, id_str)
+                        );
+                    """
+        try:
+            self.mysql_conn.cursor().execute(sql_setup)
+            self.mysql_conn.commit()
+        except Exception:
+            logger.exception("Error occurred while creating table userdata in MySQL DB.")
+
+    def create_rollup_tables(self) -> None:
+        sql_setup = ["""CREATE TABLE IF NOT EXISTS tweet_rollups (
+                        hour DATETIME NOT NULL,
+                        lang VARCHAR(16) NOT NULL,
+                        tweet_type VARCHAR(16) NOT NULL,
+                        tweets INT UNSIGNED NOT NULL,
+                        with_urls INT UNSIGNED NOT NULL,
+                        with_hashtags INT UNSIGNED NOT NULL,
+                        with_geo INT UNSIGNED NOT NULL,
+                        PRIMARY KEY (hour, lang, tweet_type)
+                        );
+                     """,
+                     """CREATE TABLE IF NOT EXISTS user_rollups (
+                        hour DATETIME NOT NULL,
+                        users_hll BLOB NOT NULL,
+                        PRIMARY KEY (hour)
+                        );
+                     """]
+        try:
+            with self.mysql_conn.cursor() as cursor:
+                for sql in sql_setup:
+                    cursor.execute(sql)
+            self.mysql_conn.commit()
+        except Exception:
+            logger.exception("Error occurred while creating rollup tables in MySQL DB.")
+
+    # Users
+
+    def upsert_user(self, user_data: dict, last_post_timestamp: str) -> None:
+        name = self.escape(user_data['name'])
+        screen_name = self.escape(user_data['screen_name'])
+        created_at = datetime.strftime(datetime.strptime(user_data['created_at'], '%a %b %d %H:%M:%S %z %Y'),
+                                       '%Y-%m-%d %H:%M:%S')
+
+        sql_insertion = f"""
+        REPLACE INTO users
+        (id_str,
+        name,
+        screen_name,
+        protected,
+        verified,
+        followers_count,
+        friends_count,
+        listed_count,
+        favourites_count,
+        statuses_count,
+        created_at,
+        last_post_timestamp
+        ) VALUES (
+        '{user_data['id_str']}',
+        '{name}',
+        '{screen_name}',
+        {user_data['protected']},
+        {user_data['verified']},
+        {user_data['followers_count']},
+        {user_data['friends_count']},
+        {user_data['listed_count']},
+        {user_data['favourites_count']},
+        {user_data['statuses_count']},
+        TIMESTAMP('{created_at}'),
+        GREATEST(COALESCE(last_post_timestamp,'1000-01-01 00:00:00'), TIMESTAMP('{last_post_timestamp}'))
+        );
+        """
+        self.mysql_conn.cursor().execute(sql_insertion)
+        self.mysql_conn.commit()
+
+    def upsert_reply_user(self, user_id: str, screen_name: str) -> None:
+        ## For reply users not inserted in database yet, name will be equal to screen_name
+        screen_name = self.escape(screen_name)
+        sql_insertion = f"""
+        REPLACE INTO users
+        (id_str, name, screen_name, protected, verified, followers_count,
+        friends_count, listed_count, favourites_count, statuses_count,
+        created_at, last_post_timestamp
+        ) VALUES (
+        '{user_id}',
+        '{screen_name}',
+        '{screen_name}',
+        null, null, null, null, null, null, null, null, null
+        );
+        """
+        self.mysql_conn.cursor().execute(sql_insertion)
+        self.mysql_conn.commit()
+
+    def find_users_by_name(self, name: str) -> List[dict]:
+        query = "SELECT * FROM users WHERE name LIKE CONCAT('%', %s, '%');"
+        with self.mysql_reader() as conn, conn.cursor(dictionary=True) as cursor:
+            cursor.execute(query, (name,))
+            return cursor.fetchall()
+
+    def get_users(self, user_ids: List[str]) -> List[dict]:
+        if not user_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        with self.mysql_reader() as conn, conn.cursor(dictionary=True) as cursor:
+            cursor.execute(f"SELECT * FROM users WHERE id_str IN ({placeholders});", list(user_ids))
+            return cursor.fetchall()
+
+    def iter_users(self, search_term: str, sort_by: str = 'followers_count', order: str = 'desc',
+                   fields: Optional[List[str]] = None) -> Iterator[dict]:
+        if sort_by not in USER_SORT_COLUMNS:
+            raise BadRequest(f"Cannot sort users by {sort_by}")
+        order_by, op = ("DESC", "<") if order == 'desc' else ("ASC", ">")
+        sort_expr = f"COALESCE({sort_by}, %s)"
+        columns = "*" if fields is None else ", ".join(dict.fromkeys(list(fields) + ["id_str", sort_by]))
+        page_size = config.query_config["page_size"]
+        default = USER_SORT_COLUMNS[sort_by]
+        last_key = None
+        while True:
+            params = [search_term]
+            keyset = ""
+            if last_key is not None:
+                keyset = f"AND ({sort_expr}, id_str) {op} (%s, %s)"
+                params += [default, *last_key]
+            query = f"""
+            SELECT {columns}
+            FROM users
+            WHERE name LIKE CONCAT('%', %s, '%') {keyset}
+            ORDER BY {sort_expr} {order_by}, id_str {order_by}
+            LIMIT %s;
+            """
+            params += [default, page_size]
+            with self.mysql_reader() as conn, conn.cursor(dictionary=True) as cursor:
+                cursor.execute(query, params)
+                page = cursor.fetchall()
+            yield from page
+            if len(page) < page_size:
+                return
+            last_row = page[-1]
+            last_key = (default if last_row[sort_by] is None else last_row[sort_by], last_row["id_str"])
+
+    # Tweets
+
+    def find_tweet(self, tweet_id: str) -> Optional[dict]:
+        return self.tweet_collection.find_one({"id_str": tweet_id})
+
+    def insert_tweet(self, tweet_data: dict) -> None:
+        self.tweet_collection.insert_one(dict(tweet_data, created_ts=self.created_ts(tweet_data),
+                                              updated_at=datetime.now(timezone.utc)))
+
+    def replace_tweet(self, tweet_id: str, tweet_data: dict) -> None:
+        self.tweet_collection.replace_one({"id_str": tweet_id}, dict(tweet_data, created_ts=self.created_ts(tweet_data),
+                                                                     updated_at=datetime.now(timezone.utc)))
+
+    @staticmethod
+    def projection(fields: Optional[List[str]]) -> Optional[dict]:
+        return dict.fromkeys(fields, 1) if fields is not None else None
+
+    def get_tweets(self, tweet_ids: List[str], fields: Optional[List[str]] = None) -> List[dict]:
+        tweets = []
+        page_size = config.query_config["page_size"]
+        for i in range(0, len(tweet_ids), page_size):
+            tweets.extend(self.tweet_collection.find({"id_str": {"$in": tweet_ids[i:i + page_size]}},
+                                                     self.projection(fields)))
+        return tweets
+
+    def _iter_mongo_pages(self, query: dict, fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        Function to iterate over MongoDB documents using keyset pagination on _id, for filters an index serves in
+        _id order, so that every page is a range scan
+        Args:
+            query: MongoDB filter
+            fields: Fields to project server side, None for full documents
+        Returns: Generator of documents
+        """
+        projection = self.projection(fields)
+        page_size = config.query_config["page_size"]
+        last_id = None
+        while True:
+            page_query = dict(query)
+            if last_id is not None:
+                page_query["_id"] = {"$gt": last_id}
+            page = list(self.tweet_collection.find(page_query, projection).sort("_id", pymongo.ASCENDING)
+                        .limit(page_size))
+            yield from page
+            if len(page) < page_size:
+                return
+            last_id = page[-1]["_id"]
+
+    def iter_tweets_by_users(self, user_ids: List[str], since: Optional[datetime] = None,
+                             fields: Optional[List[str]] = None) -> Iterator[dict]:
+        # Served in _id order by the (user, _id) index, merging the ranges of the users
+        query = {"user": {"$in": list(user_ids)}}
+        if since:
+            query["created_ts"] = {"$gte": since}
+        return self._iter_mongo_pages(query, fields)
+
+    def ensure_text_index(self) -> None:
+        if self.text_index_checked:
+            return
+        if 'text' not in self.tweet_collection.index_information():
+            self.tweet_collection.create_index([('text', pymongo.TEXT)], default_language='english')
+            logger.info("Text index created on the 'text' field.")
+        else:
+            logger.info("Text index already exists.")
+        self.text_index_checked = True
+
+    def iter_tweets_by_keyword(self, keyword: str, since: Optional[datetime] = None,
+                               fields: Optional[List[str]] = None) -> Iterator[dict]:
+        self.ensure_text_index()
+        query = {'$text': {'$search': keyword}}
+        if since:
+            query['created_ts'] = {'$gte': since}
+        # Read through a single cursor, a page resuming after an _id would match and sort every tweet again
+        cursor = self.tweet_collection.find(query, self.projection(fields))
+        return cursor.batch_size(config.query_config["page_size"])
+
+    def popular_tweets(self, since: Optional[datetime] = None, limit: int = 10) -> List[dict]:
+        pipeline = [
+            {
+                '$match': {"created_ts": {"$gte": since}} if since else {}
+            },
+            {
+                '$project': {
+                    'text': 1,
+                    'user': 1,
+                    'quote_count': {'$ifNull': ['$quote_count', 0]},
+                    'reply_count': {'$ifNull': ['$reply_count', 0]},
+                    'retweet_count': {'$ifNull': ['$retweet_count', 0]},
+                    'favorite_count': {'$ifNull': ['$favorite_count', 0]},
+                    'total_engagement': {
+                        '$add': [
+                            '$quote_count', '$reply_count', '$retweet_count', '$favorite_count'
+                        ]
+                    }
+                }
+            },
+            {
+                '$sort': {'total_engagement': -1}
+            },
+            {
+                '$limit': limit
+            }
+        ]
+        return list(self.tweet_collection.aggregate(pipeline))
+
+    # Hashtags
+
+    def add_hashtags(self, hashtags: List[str], tweet_id: str, user_id: str) -> None:
+        self.hashtag_store.add(hashtags=hashtags, tweet_id=tweet_id, user_id=user_id)
+
+    def hashtag_tweet_ids(self, hashtag: str) -> List[str]:
+        with self.mysql_reader() as conn:
+            return self.hashtag_store.get_tweet_ids(hashtag, conn)
+
+    # Interactions
+
+    def add_user_document(self, user_id: str) -> None:
+        user = {'id_str': user_id, 'reply_users': [], 'quoted_users': [], 'retweeted_users': [],
+                'replied_by_users': [], 'quoted_by_users': [], 'retweeted_by_users': []}
+
+        self.user_collection.update_one({'id_str': user['id_str']},
+                                        {'$setOnInsert': user}, upsert=True)
+
+    def add_user_relationship(self, id_A: str, id_B: str, field_A: str, field_B: str) -> None:
+        self.user_collection.update_one({'id_str': id_A},
+                                        {'$addToSet': {field_A: id_B}})
+
+        self.user_collection.update_one({'id_str': id_B},
+                                        {'$addToSet': {field_B: id_A}})
+
+    def add_interaction(self, user_A: dict, user_B: dict, relationship: str, time: str, tweet_A: str,
+                        tweet_B: str) -> None:
+        # The relationship type cannot be a parameter
+        if relationship not in RELATIONSHIPS:
+            raise ValueError(f"Unknown relationship {relationship}")
+        query = f"""MERGE (a:user {{id_str: $id_A}})
+                    ON CREATE SET a.screen_name = $screen_name_A, a.tweet_list = [$tweet_A]
+                    ON MATCH SET a += {{tweet_list: CASE WHEN $tweet_A IN a.tweet_list THEN a.tweet_list ELSE a.tweet_list + $tweet_A END}}
+                    WITH a
+                    MERGE (b:user {{id_str: $id_B}})
+                    ON CREATE SET b.screen_name = $screen_name_B, b.tweet_list = [$tweet_B]
+                    ON MATCH SET b += {{tweet_list: CASE WHEN $tweet_B IN b.tweet_list THEN b.tweet_list ELSE b.tweet_list + $tweet_B END}}
+                    WITH a,b
+                    MERGE (a)-[r:{relationship}]->(b)
+                    ON CREATE SET r.count = 1, r.last_interaction = $time, r.updated_at = timestamp()
+                    ON MATCH SET r.count = r.count + 1, r.updated_at = timestamp(),
+                    r.last_interaction = CASE r.last_interaction WHEN > $time THEN r.last_interaction ELSE $time END
+        """
+        # Tweet ids are stored as strings, the unknown tweet a reply may be to as 'None'
+        self.neo4j_connection.execute_query(query, id_A=user_A['id_str'], screen_name_A=user_A['screen_name'],
+                                            tweet_A=str(tweet_A), id_B=user_B['id_str'],
+                                            screen_name_B=user_B['screen_name'], tweet_B=str(tweet_B), time=time)
+
+    def relevant_users(self, user_id: str, limit: int = 10, include_tweet: bool = False) -> List[dict]:
+        text = ''
+        if include_tweet:
+            text = ', b.tweet_list as tweet_list'
+        # user_id comes from the request path of the API, it is only passed as a parameter
+        query = f"""MATCH (a)-[]->(n:user {{id_str: $user_id}}) WHERE a.id_str <> $user_id
+                WITH a MATCH (a)-[r]->(b) WHERE b.id_str <> $user_id
+                RETURN b.screen_name as screen_name, b.id_str as id_str, SUM(SIZE(b.tweet_list)) as n_of_tweets,
+                SUM(r.count) as n_of_interactions, MAX(r.last_interaction) as last_interaction_dt {text}
+                ORDER BY n_of_interactions DESC, last_interaction_dt DESC, n_of_tweets DESC
+                LIMIT $limit
+                """
+        records, _, _ = self.neo4j_connection.execute_query(query, user_id=user_id, limit=int(limit))
+        return [record.data() for record in records]
+
+    # Rollups
+
+    def save_rollups(self, counts: Dict[Tuple[str, str, str], List[int]], users: Dict[str, HyperLogLog]) -> None:
+        updates = ", ".join(f"{c} = {c} + VALUES({c})" for c in COUNT_COLUMNS)
+        with self.mysql_conn.cursor() as cursor:
+            cursor.executemany(f"""
+            INSERT INTO tweet_rollups (hour, lang, tweet_type, {", ".join(COUNT_COLUMNS)})
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE {updates}
+            """, [(*key, *values) for key, values in counts.items()])
+
+            # Sketches are merged in Python, lock the rows so that concurrent workers do not lose updates. Missing
+            # rows are created empty first, locking rows that do not exist would lock the gaps around them.
+            hours = sorted(users)
+            cursor.executemany("""
+            INSERT INTO user_rollups (hour, users_hll) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE hour = hour
+            """, [(hour, HyperLogLog(users[hour].precision).to_bytes()) for hour in hours])
+            placeholders = ", ".join(["%s"] * len(hours))
+            cursor.execute(f"SELECT hour, users_hll FROM user_rollups WHERE hour IN ({placeholders}) FOR UPDATE",
+                           hours)
+            for hour, data in cursor.fetchall():
+                users[hour.strftime('%Y-%m-%d %H:00:00')].merge(HyperLogLog.from_bytes(data))
+            cursor.executemany("UPDATE user_rollups SET users_hll = %s WHERE hour = %s",
+                               [(users[hour].to_bytes(), hour) for hour in hours])
+        self.mysql_conn.commit()
+
+    def query_rollups(self, since: Optional[str] = None, group_by: Tuple[str, ...] = ("hour",)
+                      ) -> Tuple[List[Dict], Optional[Dict[datetime, HyperLogLog]]]:
+        if not set(group_by) <= ROLLUP_GROUPS:
+            raise BadRequest(f"Cannot group rollups by {group_by}")
+        where = "WHERE hour >= %s" if since else ""
+        params = (since,) if since else ()
+        columns = ", ".join(group_by)
+        sums = ", ".join(f"SUM({c}) AS {c}" for c in COUNT_COLUMNS)
+        query = f"""
+        SELECT {columns + ", " if columns else ""}{sums}
+        FROM tweet_rollups {where}
+        {"GROUP BY " + columns + " ORDER BY " + columns if columns else ""};
+        """
+        with self.mysql_reader() as conn, conn.cursor(dictionary=True) as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            if not set(group_by) <= {"hour"}:
+                return rows, None
+            cursor.execute(f"SELECT hour, users_hll FROM user_rollups {where};", params)
+            users = {row["hour"]: HyperLogLog.from_bytes(row["users_hll"]) for row in cursor.fetchall()}
+        return rows, users
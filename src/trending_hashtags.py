@@ -1,29 +1,37 @@
-import logging.config
 import os
 import pickle
 from collections import defaultdict
 from copy import deepcopy
 from typing import List, Tuple
 
-from apscheduler.schedulers.background import BackgroundScheduler
 from indexed_priority_queue import IndexedPriorityQueue
 
-from src.config import hashtag_config
+from src import config
+from src.hashtag_store import HashtagStore
+from src.log import get_logger
+from src.scheduler import add_interval_job, remove_job
 
-logging.config.fileConfig('logging.conf')
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 class TrendingHashtags:
-    def __init__(self):
-        self.file_path = hashtag_config["path"]
-        if not self.load_trending_hashtags():
-            self.hashtag_freq = defaultdict(int)
-            self.pq = IndexedPriorityQueue()
+    def __init__(self, read_only=False):
+        """
+        Args:
+            read_only: Only read the data saved by the ingest process, reloading it when the file changes
+        """
+        self.file_path = config.hashtag_config["path"]
+        self.read_only = read_only
+        self.loaded_mtime = None
+        self.hashtag_freq = defaultdict(int)
+        self.pq = IndexedPriorityQueue()
 
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.add_job(self.save_trending_hashtags, 'interval', seconds=hashtag_config["save_to_disk_interval"])
-        self.scheduler.start()
+        self.job = None
+        if not read_only:
+            # Readers load the saved data on first use, see refresh
+            self.load_trending_hashtags()
+            self.job = add_interval_job(self.save_trending_hashtags,
+                                        seconds=config.hashtag_config["save_to_disk_interval"])
 
     def update_hashtags(self, hashtags: List[str]) -> None:
         """
@@ -33,25 +41,33 @@ class TrendingHashtags:
         Returns: None
         """
         for h in hashtags:
-            hashtag = h.lower()
+            hashtag = HashtagStore.normalize(h)
             hashtag_count = self.hashtag_freq[hashtag] = self.hashtag_freq[hashtag] + 1
+            self.push(hashtag, hashtag_count)
 
-            if hashtag in self.pq:
-                self.pq.update(hashtag, hashtag_count)
-            elif len(self.pq) < hashtag_config["max_size"]:
+    def push(self, hashtag: str, hashtag_count: int) -> None:
+        """
+        Function to update the count of a hashtag in the top hashtags, replacing the least trending one if it
+        outgrew it
+        """
+        if hashtag in self.pq:
+            self.pq.update(hashtag, hashtag_count)
+        elif len(self.pq) < config.hashtag_config["max_size"]:
+            self.pq.push(hashtag, hashtag_count)
+        else:
+            top_hashtag, top_count = self.pq.peek()
+            if hashtag_count > top_count:
+                self.pq.pop()
                 self.pq.push(hashtag, hashtag_count)
-            else:
-                top_hashtag, top_count = self.pq.peek()
-                if hashtag_count > top_count:
-                    self.pq.pop()
-                    self.pq.push(hashtag, hashtag_count)
 
     def get_top_hashtags(self) -> List[Tuple[str, int]]:
         """
         Function to get top trending hashtags
         Returns: List of top hashtags and their count
         """
-        logger.info(f"Retrieving top {hashtag_config['max_size']} hashtags")
+        logger.info(f"Retrieving top {config.hashtag_config['max_size']} hashtags")
+        if self.read_only:
+            self.refresh()
         top_hashtags = []
         temp_heap = deepcopy(self.pq)
         while temp_heap:
@@ -60,6 +76,24 @@ class TrendingHashtags:
         top_hashtags.reverse()
         return top_hashtags
 
+    def is_trending(self, hashtag: str) -> bool:
+        """
+        Function to check whether a hashtag is one of the top trending hashtags
+        Args:
+            hashtag: Hashtag, with or without its #
+        Returns: Boolean flag
+        """
+        if self.read_only:
+            self.refresh()
+        return HashtagStore.normalize(hashtag) in self.pq
+
+    def refresh(self) -> None:
+        """
+        Function to reload hashtag data if the file on disk changed since it was loaded
+        """
+        if os.path.isfile(self.file_path) and os.path.getmtime(self.file_path) != self.loaded_mtime:
+            self.load_trending_hashtags()
+
     def save_trending_hashtags(self) -> None:
         """
         Function to save hashtag data to disk
@@ -70,8 +104,11 @@ class TrendingHashtags:
             "hashtag_freq": self.hashtag_freq,
             "pq": self.pq
         }
-        with open(self.file_path, 'wb') as fp:
+        # Replaced atomically, readers reload it whenever it changes
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'wb') as fp:
             pickle.dump(data, fp)
+        os.replace(tmp_path, self.file_path)
 
     def load_trending_hashtags(self) -> bool:
         """
@@ -80,15 +117,31 @@ class TrendingHashtags:
         """
         if os.path.isfile(self.file_path):
             logger.debug(f"Loading trending hashtags data from {self.file_path}")
+            self.loaded_mtime = os.path.getmtime(self.file_path)
             with open(self.file_path, 'rb') as fp:
                 data = pickle.load(fp)
                 self.hashtag_freq = data["hashtag_freq"]
                 self.pq = data["pq"]
-                return True
+            if any(HashtagStore.normalize(hashtag) != hashtag for hashtag in self.hashtag_freq):
+                self.renormalize()
+            return True
         logger.info(f"Trending hashtags data not found at {self.file_path}")
         return False
 
+    def renormalize(self) -> None:
+        """
+        Function to merge the counts of hashtags saved before they were normalized like HashtagStore does, e.g.
+        "#AI" into "ai"
+        """
+        hashtag_freq = defaultdict(int)
+        for hashtag, count in self.hashtag_freq.items():
+            hashtag_freq[HashtagStore.normalize(hashtag)] += count
+        self.hashtag_freq = hashtag_freq
+        self.pq = IndexedPriorityQueue()
+        for hashtag, count in hashtag_freq.items():
+            self.push(hashtag, count)
+
     def __del__(self):
-        self.scheduler.shutdown()
-        logger.info("Scheduler shut down successfully.")
-        self.save_trending_hashtags()
+        # After shutdown the scheduler already saved the data one last time
+        if self.job is not None and remove_job(self.job):
+            self.save_trending_hashtags()
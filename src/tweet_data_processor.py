@@ -1,106 +1,114 @@
 import json
-import logging.config
+import threading
+import time
 from datetime import datetime
 
-from src.connections import get_mongodb_conn, get_mysql_conn, get_neo4j_conn
+from src import config
+from src.follow import FileTailer, load_checkpoint, save_checkpoint
+from src.hashtag_store import HashtagStore
+from src.invalidation import InvalidationLog
+from src.log import get_logger
+from src.metrics import SamplingFilter, registry, timed
+from src.rollups import TweetRollups
+from src.store import get_store
 from src.trending_hashtags import TrendingHashtags
 
-logging.config.fileConfig('logging.conf')
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
+# Per-record messages are sampled, logging every tweet is a large share of the ingest time
+logger.addFilter(SamplingFilter())
+
+STAGE_SECONDS = "ingest_stage_seconds"
+STAGE_HELP = "Time spent per ingest stage and record"
 
 
 class TweetDataProcessor:
     def __init__(self):
         self.trending_hashtags = TrendingHashtags()
-        self.mysql_conn = get_mysql_conn()
-        self.create_user_tb_mysql()
-        self.tweet_collection = get_mongodb_conn(collection="tweet_data")
-        self.user_collection = get_mongodb_conn(collection="user_data")
-        self.neo4j_connection = get_neo4j_conn()
-        self.neo4j_connection.execute_query("CREATE INDEX user_id IF NOT EXISTS FOR (n:user) ON (n.id_str)")
-
-    def create_user_tb_mysql(self):
-        sql_setup = """CREATE TABLE IF NOT EXISTS users (
-                        id_str VARCHAR(255) NOT NULL,
-                        name VARCHAR(255),
-                        screen_name VARCHAR(255),
-                        protected BOOLEAN,
-                        verified BOOLEAN,
-                        followers_count INT,
-                        friends_count INT,
-                        listed_count INT,
-                        favourites_count INT,
-                        statuses_count INT,
-                        created_at TIMESTAMP,
-                        last_post_timestamp TIMESTAMP,
-                        PRIMARY KEY (id_str),
-                        INDEX (name),
-                        INDEX (screen_name)
-                        );
-                    """
-        try:
-            self.mysql_conn.cursor().execute(sql_setup)
-            self.mysql_conn.commit()
-        except Exception:
-            logger.exception(f"Error occurred while creating table userdata in MySQL DB.")
+        self.store = get_store()
+        self.store.setup()
+        self.rollups = TweetRollups()
+        # Keys changed by ingest, published to the caches of query processes once committed
+        self.invalidation = InvalidationLog(deferred=self.store.deferred_topics)
+        self.trending_saved = time.monotonic()
+        self.last_created_at = None
+
+        self.parse_seconds = registry.histogram(STAGE_SECONDS, STAGE_HELP, stage="parse")
+        self.tweets_ingested = registry.counter("tweets_ingested_total", "Tweets read by process_data and follow")
+        self.ingest_rate = registry.meter("ingest_tweets_per_second",
+                                          "Tweets ingested per second over the last minute")
+        self.event_lag = registry.gauge("ingest_event_lag_seconds",
+                                        "Time from the creation of the last tweet flushed to its flush")
 
     @staticmethod
     def parse_datetime(timestamp_str):
         return datetime.strftime(datetime.strptime(timestamp_str, '%a %b %d %H:%M:%S %z %Y'), '%Y-%m-%d %H:%M:%S')
 
+    @timed(STAGE_SECONDS, STAGE_HELP, stage="hashtags")
     def process_hashtag(self, hashtags: list, tweet_id: str, user_id: str) -> None:
         """
-        Function to save hashtags in MySQL db
+        Function to save hashtags
         Args:
             hashtags: List of hashtags to be saved
             tweet_id: Tweet in which the hashtag was mentioned
             user_id: User who used the hashtag
         Returns: None
         """
-        h_list = []
-        for hashtag in hashtags:
-            logger.info(f"Saving hashtag: {hashtag['text']}")
-            self.mysql_conn.cursor().execute(f"""
-            INSERT INTO hashtags (hashtag, user_id, tweet_id) VALUES ('{hashtag["text"]}', '{user_id}', '{tweet_id}')
-            """)
-            h_list.append(hashtag["text"])
-        self.mysql_conn.commit()
+        h_list = [hashtag["text"] for hashtag in hashtags]
+        logger.info("Saving hashtags: %s", h_list)
+        self.store.add_hashtags(hashtags=h_list, tweet_id=tweet_id, user_id=user_id)
+        self.invalidation.publish("hashtags", map(HashtagStore.normalize, h_list))
         self.trending_hashtags.update_hashtags(hashtags=h_list)
 
     def process_tweet(self, tweet_data: dict) -> None:
         """
-        Function to process and save tweet to MongoDB
+        Function to process and save tweet, with its hashtags and rollup counts when first seen
         Args:
             tweet_data: Dict have tweet data
         Returns: None
         """
-        tweet_id = tweet_data['id_str']
-        logger.info(f"Processing Tweet: {tweet_id}")
         keys_to_be_dropped = ["id", "geo", "favorited", "retweeted", "filter_level", "quoted_status_id"]
         for key in keys_to_be_dropped:
             tweet_data.pop(key, None)
         tweet_data["user"] = tweet_data["user"]["id_str"]
 
+        if self.save_tweet(tweet_data):
+            hashtags = tweet_data.get("entities", {}).get("hashtags")
+            if hashtags:
+                self.process_hashtag(hashtags=hashtags, tweet_id=tweet_data["id_str"], user_id=tweet_data["user"])
+            # Counted once, like the store holds it once
+            self.rollups.add(tweet_data)
+
+    @timed(STAGE_SECONDS, STAGE_HELP, stage="tweets")
+    def save_tweet(self, tweet_data: dict) -> bool:
+        """
+        Function to insert a tweet, or to replace the stored one if this one is newer
+        Args:
+            tweet_data: Dict have tweet data, with the user id as user
+        Returns: Boolean flag indicating whether the tweet was inserted
+        """
+        tweet_id = tweet_data['id_str']
+        logger.info("Processing Tweet: %s", tweet_id)
+
         # Check if tweet with same ID exists
-        existing_tweet = self.tweet_collection.find_one({"id_str": tweet_id})
+        existing_tweet = self.store.find_tweet(tweet_id)
         if existing_tweet:
             existing_created_at = datetime.strptime(existing_tweet['created_at'], '%a %b %d %H:%M:%S %z %Y')
             new_created_at = datetime.strptime(tweet_data['created_at'], '%a %b %d %H:%M:%S %z %Y')
 
             if new_created_at > existing_created_at:
                 # Update existing tweet with new data
-                self.tweet_collection.replace_one({"id_str": tweet_id}, tweet_data)
-                logger.info(f"Updated existing tweet with ID: {tweet_id}")
+                self.store.replace_tweet(tweet_id, tweet_data)
+                self.invalidation.publish("tweets", [tweet_id])
+                logger.info("Updated existing tweet with ID: %s", tweet_id)
             else:
-                logger.info(f"Skipping tweet with ID {tweet_id} as existing tweet is newer")
-        else:
-            # Insert new tweet data
-            hashtags = tweet_data.get("entities", {}).get("hashtags")
-            if hashtags:
-                self.process_hashtag(hashtags=hashtags, tweet_id=tweet_data["id_str"], user_id=tweet_data["user"])
-            self.tweet_collection.insert_one(tweet_data)
-            logger.info(f"Inserted new tweet with ID: {tweet_id}")
-
+                logger.info("Skipping tweet with ID %s as existing tweet is newer", tweet_id)
+            return False
+        # Insert new tweet data
+        self.store.insert_tweet(tweet_data)
+        logger.info("Inserted new tweet with ID: %s", tweet_id)
+        return True
+
+    @timed(STAGE_SECONDS, STAGE_HELP, stage="users")
     def process_reply_user_mysql(self, tweet_data: dict) -> None:
         """
         Function to process and save user in_reply_to_user_id_str information into MySQL
@@ -108,24 +116,13 @@ class TweetDataProcessor:
             tweet_data: Dict have tweet data
         Returns: None
         """
-        logger.info(f"Processing User into MySQL: {tweet_data['in_reply_to_user_id_str']}")
-
-        ## For reply users not inserted in database yet, name will be equal to screen_name 
-        sql_insertion = f"""
-        REPLACE INTO users 
-        (id_str, name, screen_name, protected, verified, followers_count,
-        friends_count, listed_count, favourites_count, statuses_count,
-        created_at, last_post_timestamp
-        ) VALUES (
-        '{tweet_data['in_reply_to_user_id_str']}', 
-        '{tweet_data['in_reply_to_screen_name']}', 
-        '{tweet_data['in_reply_to_screen_name']}', 
-        null, null, null, null, null, null, null, null, null
-        );
-        """
-        self.mysql_conn.cursor().execute(sql_insertion)
-        self.mysql_conn.commit()
+        logger.info("Processing User into MySQL: %s", tweet_data['in_reply_to_user_id_str'])
 
+        self.store.upsert_reply_user(user_id=tweet_data['in_reply_to_user_id_str'],
+                                     screen_name=tweet_data['in_reply_to_screen_name'])
+        self.invalidation.publish("users", [tweet_data['in_reply_to_user_id_str']])
+
+    @timed(STAGE_SECONDS, STAGE_HELP, stage="users")
     def process_user_mysql(self, tweet_data: dict, user_data: dict) -> None:
         """
         Function to process and save user information into MySQL
@@ -134,43 +131,12 @@ class TweetDataProcessor:
             user_data: Dict have user data
         Returns: None
         """
-        logger.info(f"Processing User into MySQL: {user_data['id_str']}")
-
-        user_data['name'] = user_data['name'].replace("'", "\\'").replace('"', '\\"')
-        user_data['screen_name'] = user_data['screen_name'].replace("'", "\\'").replace('"', '\\"')
-
-        sql_insertion = f"""
-        REPLACE INTO users 
-        (id_str, 
-        name, 
-        screen_name, 
-        protected, 
-        verified, 
-        followers_count,
-        friends_count, 
-        listed_count, 
-        favourites_count, 
-        statuses_count,
-        created_at, 
-        last_post_timestamp
-        ) VALUES (
-        '{user_data['id_str']}', 
-        '{user_data['name']}',
-        '{user_data['screen_name']}',
-        {user_data['protected']}, 
-        {user_data['verified']}, 
-        {user_data['followers_count']},
-        {user_data['friends_count']}, 
-        {user_data['listed_count']}, 
-        {user_data['favourites_count']},
-        {user_data['statuses_count']}, 
-        TIMESTAMP('{self.parse_datetime(user_data['created_at'])}'),
-        GREATEST(COALESCE(last_post_timestamp,'1000-01-01 00:00:00'), TIMESTAMP('{self.parse_datetime(tweet_data['created_at'])}'))
-        );
-        """
-        self.mysql_conn.cursor().execute(sql_insertion)
-        self.mysql_conn.commit()
+        logger.info("Processing User into MySQL: %s", user_data['id_str'])
 
+        self.store.upsert_user(user_data=user_data, last_post_timestamp=self.parse_datetime(tweet_data['created_at']))
+        self.invalidation.publish("users", [user_data['id_str']])
+
+    @timed(STAGE_SECONDS, STAGE_HELP, stage="relationships")
     def process_user_mongodb(self, user_data: dict) -> None:
         """
         Function to process and save user information into MongoDB
@@ -178,14 +144,11 @@ class TweetDataProcessor:
             user_data: Dict have user data
         Returns: None
         """
-        logger.info(f"Processing User into MongoDB: {user_data['id_str']}")
-
-        user = {'id_str': user_data['id_str'], 'reply_users': [], 'quoted_users': [], 'retweeted_users': [],
-                'replied_by_users': [], 'quoted_by_users': [], 'retweeted_by_users': []}
+        logger.info("Processing User into MongoDB: %s", user_data['id_str'])
 
-        self.user_collection.update_one({'id_str': user['id_str']},
-                                        {'$setOnInsert': user}, upsert=True)
+        self.store.add_user_document(user_id=user_data['id_str'])
 
+    @timed(STAGE_SECONDS, STAGE_HELP, stage="relationships")
     def set_relationship_mongodb(self, id_A, id_B, field_A, field_B) -> None:
         """
         Function to add users id into relationship lists in MongoDB
@@ -196,12 +159,9 @@ class TweetDataProcessor:
             field_B: string, relationship list field name in user id B
         Returns: None
         """
-        self.user_collection.update_one({'id_str': id_A},
-                                        {'$addToSet': {field_A: id_B}})
-
-        self.user_collection.update_one({'id_str': id_B},
-                                        {'$addToSet': {field_B: id_A}})
+        self.store.add_user_relationship(id_A=id_A, id_B=id_B, field_A=field_A, field_B=field_B)
 
+    @timed(STAGE_SECONDS, STAGE_HELP, stage="interactions")
     def set_relationship_neo4j(self, user_A, user_B, relationship, time, tweet_A, tweet_B) -> None:
         """
         Function to add users relationships into Neo4J
@@ -216,20 +176,8 @@ class TweetDataProcessor:
         Returns: None
         """
 
-        query = f"""MERGE (a:user {" { id_str: '" + user_A['id_str'] + "'}"} )
-                    ON CREATE SET a.screen_name = '{user_A['screen_name']}', a.tweet_list = ['{tweet_A}']
-                    ON MATCH SET a += {'{'} tweet_list : CASE WHEN '{tweet_A}' IN a.tweet_list THEN a.tweet_list ELSE a.tweet_list + '{tweet_A}' END  {'}'}
-                    WITH a
-                    MERGE (b:user {" { id_str: '" + user_B['id_str'] + "'}"} )
-                    ON CREATE SET b.screen_name = '{user_B['screen_name']}', b.tweet_list = ['{tweet_B}']
-                    ON MATCH SET b += {'{'} tweet_list : CASE WHEN '{tweet_B}' IN b.tweet_list THEN b.tweet_list ELSE b.tweet_list + '{tweet_B}' END {'}'}
-                    WITH a,b
-                    MERGE (a)-[r:{relationship}]->(b)
-                    ON CREATE SET r.count = 1, r.last_interaction = '{time}'
-                    ON MATCH SET r.count = r.count + 1, 
-                    r.last_interaction = CASE r.last_interaction WHEN > '{time}' THEN r.last_interaction ELSE '{time}' END
-        """
-        self.neo4j_connection.execute_query(query)
+        self.store.add_interaction(user_A=user_A, user_B=user_B, relationship=relationship, time=time,
+                                   tweet_A=tweet_A, tweet_B=tweet_B)
 
     def process_data(self, file_path: str) -> None:
         """
@@ -238,105 +186,187 @@ class TweetDataProcessor:
             file_path: Path to JSON file
         Returns: None
         """
-        with open(file_path, 'r') as file:
-            for line in file:
-                if line != '\n':
-
-                    data = json.loads(line)
-
-                    # Process User into MySQL
-                    self.process_user_mysql(tweet_data=data, user_data=data['user'])
-
-                    # Process User into MongoDB
-                    # self.process_user_mongodb(user_data=data['user'])
-
-                    data["is_retweet_status"] = False
-
-                    if data['in_reply_to_user_id_str'] is not None:
-                        # Process User into MySQL
-                        self.process_reply_user_mysql(data)
-
-                        # Process User into MongoDB
-                        # self.process_user_mongodb(user_data={'id_str': data['in_reply_to_user_id_str']})
-
-                        # Add user ids to relationship lists
-                        self.set_relationship_mongodb(id_A=data['user']['id_str'],
-                                                      id_B=data['in_reply_to_user_id_str'],
-                                                      field_A='reply_users',
-                                                      field_B='replied_by_users')
-
-                        # Add Relationship into Neo4J
-                        self.set_relationship_neo4j(user_A=data['user'],
-                                                    user_B={'id_str': data['in_reply_to_user_id_str'],
-                                                            'name': data['in_reply_to_screen_name'],
-                                                            'screen_name': data['in_reply_to_screen_name']},
-                                                    relationship='replied_to',
-                                                    time=self.parse_datetime(data['created_at']),
-                                                    tweet_A=data['id_str'],
-                                                    tweet_B=data['in_reply_to_status_id_str'])
-
-                    if 'retweeted_status' in data:
-
-                        try:
-                            # Process User into MySQL
-                            self.process_user_mysql(tweet_data=data['retweeted_status'],
-                                                    user_data=data['retweeted_status']['user'])
-
-                            # Process User into MongoDB
-                            # self.process_user_mongodb(user_data=data['retweeted_status']['user'])
-
-                            # Add user ids to relationship lists
-                            self.set_relationship_mongodb(id_A=data['user']['id_str'],
-                                                          id_B=data['retweeted_status']['user']['id_str'],
-                                                          field_A='retweeted_users',
-                                                          field_B='retweeted_by_users')
-
-                            # Add Relationship into Neo4J                        
-                            self.set_relationship_neo4j(user_A=data['user'],
-                                                        user_B=data['retweeted_status']['user'],
-                                                        relationship='retweeted',
-                                                        time=self.parse_datetime(data['created_at']),
-                                                        tweet_A=data['id_str'],
-                                                        tweet_B=data['retweeted_status']['id_str'])
-
-                            # Process Tweet
-                            self.process_tweet(tweet_data=data["retweeted_status"])
-                            data["is_retweet_status"] = True
-                            data["retweeted_status_id_str"] = data["retweeted_status"]["id_str"]
-                            data.pop("retweeted_status")
-
-                        except Exception:
-                            logger.exception(f"Error processing retweet")
-
-                    if 'quoted_status' in data:
-
-                        try:
-                            # Process User into MySQL
-                            self.process_user_mysql(tweet_data=data['quoted_status'],
-                                                    user_data=data['quoted_status']['user'])
-
-                            # Process User into MongoDB
-                            # self.process_user_mongodb(user_data=data['quoted_status']['user'])
-
-                            # Add user ids to relationship lists
-                            self.set_relationship_mongodb(id_A=data['user']['id_str'],
-                                                          id_B=data['quoted_status']['user']['id_str'],
-                                                          field_A='quoted_users',
-                                                          field_B='quoted_by_users')
-
-                            # Add Relationship into Neo4J
-                            self.set_relationship_neo4j(user_A=data['user'],
-                                                        user_B=data['quoted_status']['user'],
-                                                        relationship='quoted',
-                                                        time=self.parse_datetime(data['created_at']),
-                                                        tweet_A=data['id_str'],
-                                                        tweet_B=data['quoted_status']['id_str'])
-
-                            # Process Tweet
-                            self.process_tweet(tweet_data=data["quoted_status"])
-                            data.pop("quoted_status")
-
-                        except Exception:
-                            logger.exception(f"Error processing quoted tweet")
-
-                    self.process_tweet(tweet_data=data)
+        try:
+            with open(file_path, 'r') as file:
+                for line in file:
+                    if line != '\n':
+                        self.process_line(line)
+        finally:
+            self.flush()
+
+    def follow(self, path: str, from_end: bool = False, stop: threading.Event = None) -> None:
+        """
+        Function to ingest the tweets appended to a file, or to the rotating files of a directory, until stopped.
+        New lines are flushed every follow.flush_interval seconds, which bounds the time until they are
+        queryable, and the position up to which they were flushed is checkpointed to resume from.
+        Args:
+            path: File or directory of newline delimited tweets
+            from_end: Skip the tweets written before starting instead of resuming from the checkpoint
+            stop: Event to stop following, e.g. set by a signal handler
+        Returns: None
+        """
+        follow_config = config.follow_config
+        stop = stop or threading.Event()
+        tailer = FileTailer(path, from_end=from_end, position=None if from_end else load_checkpoint(path))
+        errors = registry.counter("ingest_errors_total", "Lines that could not be ingested in follow mode")
+        lag = registry.histogram("ingest_lag_seconds", "Time from reading a line to its tweet being flushed")
+        # Read time of the oldest line not flushed yet
+        first_read = None
+        last_flush = time.monotonic()
+        try:
+            while not stop.is_set():
+                lines = tailer.read_lines()
+                if lines and first_read is None:
+                    first_read = time.time()
+                for line in lines:
+                    try:
+                        self.process_line(line)
+                    except Exception:
+                        errors.inc()
+                        logger.exception("Error ingesting line")
+                if first_read is not None and time.monotonic() - last_flush >= follow_config["flush_interval"]:
+                    self.flush(full=False)
+                    save_checkpoint(path, tailer.position)
+                    lag.observe(time.time() - first_read)
+                    first_read, last_flush = None, time.monotonic()
+                if not lines:
+                    stop.wait(follow_config["poll_interval"])
+        finally:
+            self.flush()
+            save_checkpoint(path, tailer.position)
+            tailer.close()
+
+    def flush(self, full: bool = True) -> None:
+        """
+        Function to write buffered hashtags, rollups and (embedded) writes in bulk, then publish the keys they
+        changed to the caches of query processes
+        Args:
+            full: Also save what is costly to save, the trending hashtags and the embedded interaction graph.
+            Micro-flushes of follow mode pass False, these are then saved at most every
+            follow.trending_interval and embedded.graph_save_interval seconds.
+        Returns: None
+        """
+        with registry.timer(STAGE_SECONDS, STAGE_HELP, stage="flush"):
+            self.rollups.flush(self.store)
+            self.store.flush(full=full)
+        self.invalidation.flush()
+        if full or time.monotonic() - self.trending_saved >= config.follow_config["trending_interval"]:
+            self.trending_hashtags.save_trending_hashtags()
+            self.trending_saved = time.monotonic()
+        if self.last_created_at is not None:
+            created_at = datetime.strptime(self.last_created_at, '%a %b %d %H:%M:%S %z %Y')
+            self.event_lag.set(time.time() - created_at.timestamp())
+
+    def process_line(self, line: str) -> None:
+        """
+        Function to process one tweet
+        Args:
+            line: Tweet as JSON
+        Returns: None
+        """
+        start = time.perf_counter()
+        data = json.loads(line)
+        self.parse_seconds.observe(time.perf_counter() - start)
+        self.tweets_ingested.inc()
+        self.ingest_rate.mark()
+        self.last_created_at = data['created_at']
+
+        # Process User into MySQL
+        self.process_user_mysql(tweet_data=data, user_data=data['user'])
+
+        # Process User into MongoDB
+        # self.process_user_mongodb(user_data=data['user'])
+
+        data["is_retweet_status"] = False
+
+        if data['in_reply_to_user_id_str'] is not None:
+            # Process User into MySQL
+            self.process_reply_user_mysql(data)
+
+            # Process User into MongoDB
+            # self.process_user_mongodb(user_data={'id_str': data['in_reply_to_user_id_str']})
+
+            # Add user ids to relationship lists
+            self.set_relationship_mongodb(id_A=data['user']['id_str'],
+                                          id_B=data['in_reply_to_user_id_str'],
+                                          field_A='reply_users',
+                                          field_B='replied_by_users')
+
+            # Add Relationship into Neo4J
+            self.set_relationship_neo4j(user_A=data['user'],
+                                        user_B={'id_str': data['in_reply_to_user_id_str'],
+                                                'name': data['in_reply_to_screen_name'],
+                                                'screen_name': data['in_reply_to_screen_name']},
+                                        relationship='replied_to',
+                                        time=self.parse_datetime(data['created_at']),
+                                        tweet_A=data['id_str'],
+                                        tweet_B=data['in_reply_to_status_id_str'])
+
+        if 'retweeted_status' in data:
+
+            try:
+                # Process User into MySQL
+                self.process_user_mysql(tweet_data=data['retweeted_status'],
+                                        user_data=data['retweeted_status']['user'])
+
+                # Process User into MongoDB
+                # self.process_user_mongodb(user_data=data['retweeted_status']['user'])
+
+                # Add user ids to relationship lists
+                self.set_relationship_mongodb(id_A=data['user']['id_str'],
+                                              id_B=data['retweeted_status']['user']['id_str'],
+                                              field_A='retweeted_users',
+                                              field_B='retweeted_by_users')
+
+                # Add Relationship into Neo4J                        
+                self.set_relationship_neo4j(user_A=data['user'],
+                                            user_B=data['retweeted_status']['user'],
+                                            relationship='retweeted',
+                                            time=self.parse_datetime(data['created_at']),
+                                            tweet_A=data['id_str'],
+                                            tweet_B=data['retweeted_status']['id_str'])
+
+                # Process Tweet
+                self.process_tweet(tweet_data=data["retweeted_status"])
+                data["is_retweet_status"] = True
+                data["retweeted_status_id_str"] = data["retweeted_status"]["id_str"]
+                data.pop("retweeted_status")
+
+            except Exception:
+                logger.exception("Error processing retweet")
+
+        if 'quoted_status' in data:
+
+            try:
+                # Process User into MySQL
+                self.process_user_mysql(tweet_data=data['quoted_status'],
+                                        user_data=data['quoted_status']['user'])
+
+                # Process User into MongoDB
+                # self.process_user_mongodb(user_data=data['quoted_status']['user'])
+
+                # Add user ids to relationship lists
+                self.set_relationship_mongodb(id_A=data['user']['id_str'],
+                                              id_B=data['quoted_status']['user']['id_str'],
+                                              field_A='quoted_users',
+                                              field_B='quoted_by_users')
+
+                # Add Relationship into Neo4J
+                self.set_relationship_neo4j(user_A=data['user'],
+                                            user_B=data['quoted_status']['user'],
+                                            relationship='quoted',
+                                            time=self.parse_datetime(data['created_at']),
+                                            tweet_A=data['id_str'],
+                                            tweet_B=data['quoted_status']['id_str'])
+
+                # Process Tweet
+                self.process_tweet(tweet_data=data["quoted_status"])
+                data.pop("quoted_status")
+
+            except Exception:
+                logger.exception("Error processing quoted tweet")
+
+        self.process_tweet(tweet_data=data)
+
+        if self.rollups.pending >= config.rollup_config["flush_every"]:
+            self.flush(full=False)
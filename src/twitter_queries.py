@@ -1,49 +1,87 @@
-import logging.config
-from datetime import datetime, timedelta
-from typing import List, Dict
+from __future__ import annotations
 
-import neo4j
-import pandas as pd
-import pymongo
-import pytz
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 
+from src import config
 from src.cache import Cache
-from src.config import cache_config
-from src.connections import get_mysql_conn, get_mongodb_conn, get_neo4j_conn
+from src.hashtag_store import HashtagStore
+from src.invalidation import get_subscriber
+from src.lazy import lazy_import
+from src.log import get_logger
+from src.metrics import timed
+from src.rollups import COUNT_COLUMNS, HyperLogLog
+from src.store import get_store
 from src.trending_hashtags import TrendingHashtags
+from src.warmup import QUERIES, RELEVANT_USERS, AccessLog, Prefetcher
+
+logger = get_logger(__name__)
+
+# Imported on first use, they dominate the import time of this module
+pd = lazy_import("pandas")
+pymongo = lazy_import("pymongo")
+pytz = lazy_import("pytz")
+
+QUERY_SECONDS = "query_seconds"
+QUERY_HELP = "Time spent per TwitterQueries call, DataFrame iterators are timed until they are returned"
 
-logging.config.fileConfig('logging.conf')
-logger = logging.getLogger(__name__)
+USER_TWEET_COLUMNS = ['user_name', 'text', 'lang', 'is_retweet_status', 'is_quote_status',
+                      'reply_count', 'retweet_count', 'favorite_count', 'created_at']
 
 
 class TwitterQueries:
     def __init__(self):
-        self.mysql_connection = get_mysql_conn()
-        self.mongo_db = get_mongodb_conn(collection="tweet_data")
-        self.neo4j_connection = get_neo4j_conn()
-
-        self.tweet_cache = Cache(cache_path=cache_config["tweet_path"])
-        self.user_cache = Cache(cache_path=cache_config["user_path"])
-
-    def ensure_text_index(self):
-        if self.mongo_db is not None:
-            if 'text' not in self.mongo_db.index_information():
-                self.mongo_db.create_index([('text', pymongo.TEXT)], default_language='english')
-                logger.info("Text index created on the 'text' field.")
-            else:
-                logger.info("Text index already exists.")
+        self.store = get_store()
+
+        self.access_log = AccessLog()
+        self.tweet_cache = Cache(cache_path=config.cache_config["tweet_path"], topic="tweets",
+                                 access_log=self.access_log)
+        self.user_cache = Cache(cache_path=config.cache_config["user_path"], topic="users",
+                                access_log=self.access_log)
+
+        self.trending_hashtags = TrendingHashtags(read_only=True)
+        # Postings (tweet ids) of trending hashtags. These get new postings all the time, evicting them on every
+        # published change would leave them hardly ever served, they are refreshed every postings_ttl seconds.
+        self.postings_cache = Cache(cache_path=config.hashtag_config["postings_path"],
+                                    max_size=config.hashtag_config["max_size"], topic="hashtags",
+                                    access_log=self.access_log, ttl=config.hashtag_config["postings_ttl"],
+                                    invalidate=False)
+        self.prefetcher = Prefetcher(self, self.access_log)
+
+    def warm_up(self) -> None:
+        """
+        Function to fill the caches with the keys most accessed before the restart, in the background so that
+        queries can be served meanwhile. prefetcher.warmed is set once done.
+        """
+        self.prefetcher.warm_up()
+
+    def data_version(self) -> str:
+        """
+        Function to get a token that changes whenever query results may have changed, i.e. ingest published
+        changes, cached entries were invalidated or trending hashtags were saved
+        Returns: Version token, only comparable within the process
+        """
+        path = self.trending_hashtags.file_path
+        trending_mtime = os.path.getmtime(path) if os.path.isfile(path) else None
+        caches = (self.tweet_cache, self.user_cache, self.postings_cache)
+        return "-".join(map(str, (get_subscriber().version, *(cache.version for cache in caches), trending_mtime)))
 
+    def ensure_text_index(self) -> None:
+        """
+        Function to create the full text index of tweets, if missing
+        """
+        self.store.ensure_text_index()
+
+    @timed(QUERY_SECONDS, QUERY_HELP, query="get_user_data_by_username")
     def get_user_data_by_username(self, user_name: str, ret_df=False) -> Dict:
-        query = "SELECT * FROM users WHERE name LIKE CONCAT('%', %s, '%');"
-        with self.mysql_connection.cursor(dictionary=True) as cursor:
-            cursor.execute(query, (user_name,))
-            users_data = cursor.fetchall()
-            results = {}
-            for user in users_data:
-                self.user_cache.put(user["id_str"], user)
-                results[user["id_str"]] = user
-            return pd.DataFrame(results) if ret_df else results
+        results = {}
+        version = self.user_cache.version
+        for user in self._cache_rows(self.user_cache, self.store.find_users_by_name(user_name), version):
+            results[user["id_str"]] = user
+        return pd.DataFrame(results) if ret_df else results
 
+    @timed(QUERY_SECONDS, QUERY_HELP, query="get_user_data")
     def get_user_data(self, user_ids: List[str]) -> Dict:
         """
         Function to get user data by user_ids
@@ -51,53 +89,114 @@ class TwitterQueries:
             user_ids: User ids
         Returns: Dictionary with user_id as key and user data value
         """
+        return self.fetch_users(user_ids)
+
+    def fetch_users(self, user_ids: List[str]) -> Dict:
+        """
+        Function to get users from the user cache, fetching the missing ones in bulk
+        Args:
+            user_ids: User ids
+        Returns: Dictionary with user_id as key and user data value
+        """
         user_data = {}
-        cursor = None
+        missing = []
         for user_id in user_ids:
             cached_user_data = self.user_cache.get(user_id)
             if cached_user_data:
                 user_data[user_id] = cached_user_data
             else:
-                if cursor is None:
-                    cursor = self.mysql_connection.cursor(dictionary=True)
-                query = "SELECT * FROM users WHERE id_str = %s;"
-                cursor.execute(query, (user_id,))
-                user = cursor.fetchone()
-                if user:
-                    self.user_cache.put(user_id, user)
-                    user_data[user_id] = user
-        if cursor:
-            cursor.close()
-        return user_data
+                missing.append(user_id)
+        # Fetch cache misses in bulk instead of one round trip per user
+        version = self.user_cache.version
+        for user in self._cache_rows(self.user_cache, self.store.get_users(missing), version):
+            user_data[user["id_str"]] = user
+        return {user_id: user_data[user_id] for user_id in user_ids if user_id in user_data}
 
-    # Search tweets by username
-    def search_tweets_username(self, user_info, time_frame=None):
+    @staticmethod
+    def _cache_rows(cache: Cache, rows: Iterable[dict], version: Optional[int] = None) -> Iterator[dict]:
+        """
+        Function to cache the first rows of a result without letting a large result evict the whole cache
+        Args:
+            cache: Cache to put rows in
+            rows: Full rows keyed by id_str
+            version: Cache.version read before rows were read from the store, defaults to the version before the
+            first row is pulled, i.e. before a lazily paged result fetches its first page
+        Returns: Generator of the same rows
+        """
+        max_cached = config.cache_config["max_cached_per_query"]
+        if version is None:
+            version = cache.version
+        for i, row in enumerate(rows):
+            if i < max_cached:
+                cache.put(row["id_str"], row, version)
+            yield row
+
+    @staticmethod
+    def _frames(rows: Iterable[dict], chunksize: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Function to build DataFrames of at most chunksize rows
+        Args:
+            rows: Rows to be converted
+            chunksize: Number of rows per DataFrame
+            columns: Columns to keep, None to keep all
+        Returns: Generator of DataFrames
+        """
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+
+    def _to_df(self, rows: Iterable[dict], chunksize: Optional[int] = None,
+               columns: Optional[List[str]] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        """
+        Function to convert rows into a DataFrame, or into an iterator of DataFrames when chunksize is set
+        """
+        if chunksize:
+            return self._frames(rows, chunksize, columns)
+        frames = list(self._frames(rows, config.query_config["page_size"], columns))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def iter_tweets_username(self, user_info, time_frame=None, fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        Function to stream tweets of the given users
+        Args:
+            user_info: Dictionary with user_id as key
+            time_frame: One of 1day, 1week, 1month
+            fields: Fields to project, None for full documents (which are also cached)
+        Returns: Generator of tweets
+        """
         # Get the time limit from the utility function, ensuring it is timezone-aware
         time_limit = self.get_time_limit(time_frame) if time_frame else None
 
-        # Build the query with a time limit if specified
-        query = {"user": {"$in": list(user_info.keys())}}
-        if time_limit:
-            query["created_at"] = {"$gte": time_limit.isoformat()}  # Use isoformat for MongoDB compatibility
+        rows = self.store.iter_tweets_by_users(list(user_info.keys()), since=time_limit, fields=fields)
+        return self._cache_rows(self.tweet_cache, rows) if fields is None else rows
 
-        results = list(self.mongo_db.find(query))
-        if not results:
+    # Search tweets by username
+    @timed(QUERY_SECONDS, QUERY_HELP, query="search_tweets_username")
+    def search_tweets_username(self, user_info, time_frame=None, chunksize=None):
+        fields = [c for c in USER_TWEET_COLUMNS if c != 'user_name'] + ['user', 'id_str']
+
+        def post_process(results):
+            # Post-process results to add custom fields based on available data
+            for result in results:
+                result['is_retweet_status'] = True if result.get('is_retweet_status', False) else False
+                result['is_quote_status'] = True if result.get('is_quote_status', False) else False
+                result['user_name'] = user_info.get(result['user'], {}).get("name", "Unknown")
+                yield result
+
+        rows = post_process(self.iter_tweets_username(user_info, time_frame, fields=fields))
+        df = self._to_df(rows, chunksize, columns=USER_TWEET_COLUMNS)
+        if not chunksize and df.empty:
             logger.info("No tweets found.")
-            return pd.DataFrame()
-
-        # Post-process results to add custom fields based on available data
-        for result in results:
-            self.tweet_cache.put(result["id_str"], result)
-            result['is_retweet_status'] = True if result.get('is_retweet_status', False) else False
-            result['is_quote_status'] = True if result.get('is_quote_status', False) else False
-            result['user_name'] = user_info.get(result['user'], {}).get("name", "Unknown")
-
-        df = pd.DataFrame(results)
-        column_order = ['user_name', 'text', 'lang', 'is_retweet_status', 'is_quote_status',
-                        'reply_count', 'retweet_count', 'favorite_count', 'created_at']
-        df = df[column_order]
         return df
 
+    @timed(QUERY_SECONDS, QUERY_HELP, query="create_aggregated_username")
     def create_aggregated_username(self, search_name, sort_metric="created_at",
                                    sort_order=1):  # 1 for ascending, -1 for descending
         user_info = self.get_user_data_by_username(search_name)
@@ -123,22 +222,24 @@ class TwitterQueries:
                        'engagement': 'Total Engagement'}[sort_metric]
         return df.sort_values(by=[sort_column], ascending=(sort_order == 1))
 
-    # search and sort users based on followers count or last posted timestamp
-    def search_and_sort_users(self, search_term, sort_by='followers_count', order='desc'):
-        order_by = "DESC" if order == 'desc' else "ASC"
-        query = f"""
-        SELECT *
-        FROM users 
-        WHERE name LIKE CONCAT('%', %s, '%') 
-        ORDER BY {sort_by} {order_by};
+    def iter_users(self, search_term, sort_by='followers_count', order='desc',
+                   fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        Function to stream users whose name matches search_term
+        Args:
+            search_term: Term to be matched against the user name
+            sort_by: One of USER_SORT_COLUMNS
+            order: asc or desc
+            fields: Columns to select, None for full rows (which are also cached)
+        Returns: Generator of users
         """
-        with self.mysql_connection.cursor(dictionary=True) as cursor:
-            cursor.execute(query, (search_term,))
-            rows = cursor.fetchall()
-            for row in rows:
-                self.user_cache.put(row["id_str"], row)
-            df = pd.DataFrame(rows)
-            return df
+        return self.store.iter_users(search_term, sort_by, order, fields)
+
+    # search and sort users based on followers count or last posted timestamp
+    @timed(QUERY_SECONDS, QUERY_HELP, query="search_and_sort_users")
+    def search_and_sort_users(self, search_term, sort_by='followers_count', order='desc', chunksize=None):
+        rows = self._cache_rows(self.user_cache, self.iter_users(search_term, sort_by, order))
+        return self._to_df(rows, chunksize)
 
     def get_time_limit(self, time_frame):
         """ Calculate the starting date and time for a given time frame with timezone-aware datetime objects. """
@@ -154,131 +255,141 @@ class TwitterQueries:
             return None
 
     def fetch_tweet_ids_from_mysql(self, hashtag):
-        with self.mysql_connection.cursor() as cursor:
-            query = "SELECT tweet_id FROM hashtags WHERE hashtag LIKE %s"
-            cursor.execute(query, (hashtag,))
-            tweet_ids = [item[0] for item in cursor.fetchall()]
-            return tweet_ids
-
-    def search_tweets_by_hashtag(self, hashtag):
+        hashtag = HashtagStore.normalize(hashtag)
+        tweet_ids = self.postings_cache.get(hashtag)
+        if tweet_ids is None:
+            version = self.postings_cache.version
+            tweet_ids = self.store.hashtag_tweet_ids(hashtag)
+            if self.trending_hashtags.is_trending(hashtag):
+                self.postings_cache.put(hashtag, tweet_ids, version)
+        return tweet_ids
+
+    def iter_tweets_by_hashtag(self, hashtag, fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        Function to stream the tweets mentioning hashtag, newest first, fetching them a page of postings at a time
+        Args:
+            hashtag: Hashtag to be searched, with or without #
+            fields: Fields to project, None for full documents (which are also cached)
+        Returns: Generator of tweets
+        """
         tweet_ids = self.fetch_tweet_ids_from_mysql(hashtag)
-        if not tweet_ids:
-            logger.info("No tweet IDs found for hashtag:", hashtag)
-            return pd.DataFrame()  # Return an empty DataFrame if no IDs are found
-
-        tweets = self.fetch_tweets_from_mongodb(tweet_ids)  # Make sure to pass tweet_ids here, not query
-        if not tweets:
-            logger.info("No tweets found in MongoDB matching the tweet IDs from MySQL.")
-            return pd.DataFrame()
-
-        data = [{
-            'User ID': tweet.get('user', 'Unknown'),
-            'Tweet Text': tweet.get('text', ''),
-            'Retweet Count': tweet.get('retweet_count', 0),
-            'Favorite Count': tweet.get('favorite_count', 0),
-            'Reply Count': tweet.get('reply_count', 0),
-            'Timestamp': tweet.get('created_at', '')
-        } for tweet in tweets]
+        if fields is not None:
+            fields = list(dict.fromkeys(list(fields) + ['id_str']))
+
+        def pages():
+            page_size = config.query_config["page_size"]
+            for i in range(0, len(tweet_ids), page_size):
+                page = tweet_ids[i:i + page_size]
+                tweets = {tweet["id_str"]: tweet for tweet in self.store.get_tweets(page, fields=fields)}
+                yield from (tweets[tweet_id] for tweet_id in page if tweet_id in tweets)
+
+        rows = pages()
+        return self._cache_rows(self.tweet_cache, rows) if fields is None else rows
+
+    @timed(QUERY_SECONDS, QUERY_HELP, query="search_tweets_by_hashtag")
+    def search_tweets_by_hashtag(self, hashtag, chunksize=None):
+        fields = ['user', 'text', 'retweet_count', 'favorite_count', 'reply_count', 'created_at']
+
+        def to_rows(tweets):
+            for tweet in tweets:
+                yield {
+                    'User ID': tweet.get('user', 'Unknown'),
+                    'Tweet Text': tweet.get('text', ''),
+                    'Retweet Count': tweet.get('retweet_count', 0),
+                    'Favorite Count': tweet.get('favorite_count', 0),
+                    'Reply Count': tweet.get('reply_count', 0),
+                    'Timestamp': tweet.get('created_at', '')
+                }
 
-        return pd.DataFrame(data)
+        df = self._to_df(to_rows(self.iter_tweets_by_hashtag(hashtag, fields=fields)), chunksize)
+        if not chunksize and df.empty:
+            logger.info(f"No tweets found for hashtag: {hashtag}")
+        return df
 
+    @timed(QUERY_SECONDS, QUERY_HELP, query="fetch_tweets_from_mongodb")
     def fetch_tweets_from_mongodb(self, tweet_ids):
         # Check if tweet_ids list is empty to avoid MongoDB errors
         if not tweet_ids:
             logger.info("No tweet IDs provided to fetch from MongoDB.")
             return []
-        tweets = []
+        return self.fetch_tweets(tweet_ids)
+
+    def fetch_tweets(self, tweet_ids: List[str]) -> List[dict]:
+        """
+        Function to get tweets from the tweet cache, fetching the missing ones in bulk
+        Args:
+            tweet_ids: Tweet ids
+        Returns: Tweets found, in the order of tweet_ids
+        """
+        tweets = {}
+        missing = []
         for tweet_id in tweet_ids:
             cached_tweet = self.tweet_cache.get(tweet_id)
             if cached_tweet:
-                tweets.append(cached_tweet)
+                tweets[tweet_id] = cached_tweet
             else:
-                tweet_from_mongodb = self.mongo_db.find_one({"id_str": tweet_id})
-                if tweet_from_mongodb:
-                    # Update cache with fetched tweet
-                    self.tweet_cache.put(tweet_id, tweet_from_mongodb)
-                    tweets.append(tweet_from_mongodb)
-        return tweets
+                missing.append(tweet_id)
+        # Fetch cache misses in bulk instead of one round trip per tweet
+        version = self.tweet_cache.version
+        for tweet_from_mongodb in self._cache_rows(self.tweet_cache, self.store.get_tweets(missing), version):
+            tweets[tweet_from_mongodb["id_str"]] = tweet_from_mongodb
+        return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
 
     # Popular tweets based on engagement metrics(Top 10)
+    @timed(QUERY_SECONDS, QUERY_HELP, query="search_popular_tweets_based_on_engagement")
     def search_popular_tweets_based_on_engagement(self, time_frame=None):
         time_limit = self.get_time_limit(time_frame) if time_frame else None
-        pipeline = [
-            {
-                '$match': {"created_at": {"$gte": time_limit.isoformat()}} if time_limit else {}
-            },
-            {
-                '$project': {
-                    'text': 1,
-                    'user': 1,
-                    'quote_count': {'$ifNull': ['$quote_count', 0]},
-                    'reply_count': {'$ifNull': ['$reply_count', 0]},
-                    'retweet_count': {'$ifNull': ['$retweet_count', 0]},
-                    'favorite_count': {'$ifNull': ['$favorite_count', 0]},
-                    'total_engagement': {
-                        '$add': [
-                            '$quote_count', '$reply_count', '$retweet_count', '$favorite_count'
-                        ]
-                    }
-                }
-            },
-            {
-                '$sort': {'total_engagement': -1}
-            },
-            {
-                '$limit': 10
-            }
-        ]
-
         try:
-            results = list(self.mongo_db.aggregate(pipeline))
+            results = self.store.popular_tweets(since=time_limit, limit=10)
             if not results:
                 logger.info("No tweets found with high engagement.")
                 return pd.DataFrame()
 
             return pd.DataFrame(results)
         except pymongo.errors.OperationFailure:
-            logger.exception(f"Error fetching tweets based on engagement")
+            logger.exception("Error fetching tweets based on engagement")
 
-    def search_tweets_by_keyword(self, keyword, time_frame=None):
-        self.ensure_text_index()
+    def iter_tweets_by_keyword(self, keyword, time_frame=None, fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        Function to stream tweets matching keyword
+        Args:
+            keyword: Text to be searched
+            time_frame: One of 1day, 1week, 1month
+            fields: Fields to project, None for full documents (which are also cached)
+        Returns: Generator of tweets
+        """
         time_limit = self.get_time_limit(time_frame) if time_frame else None
+        rows = self.store.iter_tweets_by_keyword(keyword, since=time_limit, fields=fields)
+        return self._cache_rows(self.tweet_cache, rows) if fields is None else rows
 
-        query = {'$text': {'$search': keyword}}
-        if time_limit:
-            query['created_at'] = {'$gte': time_limit.isoformat()}
-        # Execute the query
-        results = list(self.mongo_db.find(query))
-        for tweet in results:
-            self.tweet_cache.put(tweet["id_str"], tweet)
-        if not results:
+    @timed(QUERY_SECONDS, QUERY_HELP, query="search_tweets_by_keyword")
+    def search_tweets_by_keyword(self, keyword, time_frame=None, fields=None, chunksize=None):
+        df = self._to_df(self.iter_tweets_by_keyword(keyword, time_frame, fields), chunksize)
+        if not chunksize and df.empty:
             logger.info(f"No tweets found containing the keyword '{keyword}' within the specified time frame.")
-            return pd.DataFrame()
-
-        # Create a DataFrame from the results
-        df = pd.DataFrame(results)
         return df
 
+    @timed(QUERY_SECONDS, QUERY_HELP, query="get_relevant_users_by_user_id")
     def get_relevant_users_by_user_id(self, user_id, limit=10, include_tweet=False):
-        text = ''
-        if include_tweet:
-            text = ', b.tweet_list as tweet_list'
-        query = f"""MATCH (a)-[]->(n:user {" { id_str: '" + user_id + "'}"} ) WHERE a.id_str <> "{user_id}"
-                WITH a MATCH (a)-[r]->(b) WHERE b.id_str <> "{user_id}"
-                RETURN b.screen_name as screen_name, b.id_str as id_str, SUM(SIZE(b.tweet_list)) as n_of_tweets, 
-                SUM(r.count) as n_of_interactions, MAX(r.last_interaction) as last_interaction_dt {text}
-                ORDER BY n_of_interactions DESC, last_interaction_dt DESC, n_of_tweets DESC
-                LIMIT {limit}
-                """
-        df_user = self.neo4j_connection.execute_query(query, result_transformer_=neo4j.Result.to_df)
+        self.access_log.record(QUERIES, (RELEVANT_USERS, user_id, limit))
+        # With include_tweet the caller fetches the tweets itself
+        prefetch = config.warmup_config["prefetch_related"] and not include_tweet
+        rows = self.store.relevant_users(user_id, limit=limit, include_tweet=include_tweet or prefetch)
+        if prefetch and rows:
+            # Their tweets are usually requested next, by get_relevant_tweets_by_user_id
+            self.prefetcher.submit(self.prefetcher.related_tweets, rows)
+        df_user = pd.DataFrame(rows)
         if df_user.shape[0] == 0:
             logger.info('No relevant users found.')
             return pd.DataFrame()
+        if not include_tweet and 'tweet_list' in df_user:
+            df_user = df_user.drop(columns=['tweet_list'])
         df_mysql = pd.DataFrame(self.get_user_data(df_user['id_str'].to_list()))
         df_user = df_user.merge(df_mysql.transpose().reset_index().drop(
             columns = ['index','screen_name']), on ='id_str')
         return df_user
 
+    @timed(QUERY_SECONDS, QUERY_HELP, query="get_relevant_tweets_by_user_id")
     def get_relevant_tweets_by_user_id(self, user_id, limit=10, user_limit=10):
         df_tweet = self.get_relevant_users_by_user_id(user_id, limit=user_limit, include_tweet=True)
         if df_tweet.shape[0] == 0:
@@ -291,7 +402,32 @@ class TwitterQueries:
                 logger.info('No relevant tweets found.')
             return res
 
-    @staticmethod
-    def get_trending_hashtags():
-        hashtags = TrendingHashtags()
-        return hashtags.get_top_hashtags()
+    @timed(QUERY_SECONDS, QUERY_HELP, query="get_rollup_counts")
+    def get_rollup_counts(self, time_frame=None, group_by=('hour',)) -> pd.DataFrame:
+        """
+        Function to get tweet counts from the rollups maintained at ingest time
+        Args:
+            time_frame: One of 1day, 1week, 1month
+            group_by: Any of hour, lang, tweet_type
+        Returns: DataFrame with tweets, with_urls, with_hashtags and with_geo counts, and an estimate of
+        distinct_users when not grouping by lang or tweet_type
+        """
+        time_limit = self.get_time_limit(time_frame) if time_frame else None
+        since = time_limit.strftime('%Y-%m-%d %H:00:00') if time_limit else None
+        rows, users = self.store.query_rollups(since=since, group_by=tuple(group_by))
+        df = pd.DataFrame(rows, columns=list(group_by) + COUNT_COLUMNS)
+        df[COUNT_COLUMNS] = df[COUNT_COLUMNS].fillna(0).astype(int)
+        if users is not None:
+            if 'hour' in group_by:
+                users_by_hour = pd.Series({pd.Timestamp(hour): hll.count() for hour, hll in users.items()}, dtype=int)
+                df['distinct_users'] = pd.to_datetime(df['hour']).map(users_by_hour).fillna(0).astype(int)
+            else:
+                total = HyperLogLog()
+                for hll in users.values():
+                    total.merge(hll)
+                df['distinct_users'] = total.count()
+        return df
+
+    @timed(QUERY_SECONDS, QUERY_HELP, query="get_trending_hashtags")
+    def get_trending_hashtags(self):
+        return self.trending_hashtags.get_top_hashtags()
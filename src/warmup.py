@@ -0,0 +1,226 @@
+import os
+import pickle
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from itertools import chain
+from typing import Callable, Dict, Hashable, List
+
+from src import config
+from src.log import get_logger
+from src.metrics import registry
+from src.scheduler import add_interval_job
+
+logger = get_logger(__name__)
+
+# Cache lookups are recorded under the topic of the cache, queries under QUERIES
+QUERIES = "queries"
+RELEVANT_USERS = "relevant_users"
+
+
+class AccessLog:
+    """
+    Access counts of cache keys and query signatures, merged into a pickled dictionary of Counters shared by
+    every query process. When a Counter outgrows warmup.max_keys only the hottest keys are kept and their
+    counts are halved, so keys that are no longer read age out.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.warmup_config["path"]
+        # Accesses since the last save, by topic
+        self.pending: Dict[str, Counter] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.job = None
+
+    def record(self, topic: str, key: Hashable) -> None:
+        """
+        Function to count an access
+        Args:
+            topic: tweets, users, hashtags or QUERIES
+            key: Cache key or query signature
+        """
+        if getattr(self.local, "paused", False):
+            return
+        with self.lock:
+            if topic not in self.pending:
+                self.pending[topic] = Counter()
+            self.pending[topic][key] += 1
+            if self.job is None:
+                self.job = add_interval_job(self.save_to_disk, seconds=config.warmup_config["save_to_disk_interval"])
+
+    @contextmanager
+    def paused(self):
+        """
+        Context manager ignoring the accesses of the current thread, e.g. those made by prefetching
+        """
+        self.local.paused = True
+        try:
+            yield
+        finally:
+            self.local.paused = False
+
+    def load(self) -> Dict[str, Counter]:
+        """
+        Function to read the access counts saved by every process
+        Returns: Counters by topic
+        """
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as fp:
+                return pickle.load(fp)
+        except (EOFError, pickle.UnpicklingError):
+            logger.warning(f"Ignoring unreadable access log {self.path}")
+            return {}
+
+    def save_to_disk(self) -> None:
+        """
+        Function to merge the accesses since the last save into the file on disk
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        max_keys = config.warmup_config["max_keys"]
+        counts = self.load()
+        for topic, counter in pending.items():
+            merged = counts.setdefault(topic, Counter())
+            merged.update(counter)
+            if len(merged) > max_keys:
+                counts[topic] = Counter({key: count // 2 for key, count in merged.most_common(max_keys)
+                                         if count > 1})
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump(counts, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Saved access log to {self.path}")
+
+    def hottest(self, counts: Dict[str, Counter], topic: str, n: int) -> List[Hashable]:
+        """
+        Function to get the most accessed keys of a topic
+        Args:
+            counts: Counters returned by load
+            topic: tweets, users, hashtags or QUERIES
+            n: Number of keys
+        Returns: Keys, hottest first
+        """
+        return [key for key, _ in counts.get(topic, Counter()).most_common(n)]
+
+
+class Prefetcher:
+    """
+    Background thread filling the caches of a TwitterQueries instance, with the hottest keys of the access log
+    at startup and with data that is likely to be requested next while serving queries.
+    """
+
+    def __init__(self, queries, access_log: AccessLog):
+        """
+        Args:
+            queries: TwitterQueries whose caches are filled
+            access_log: Access log of queries, accesses made by prefetching are not recorded
+        """
+        self.queries = queries
+        self.access_log = access_log
+        self.tasks = queue.Queue(maxsize=config.warmup_config["queue_size"])
+        self.thread = None
+        self.lock = threading.Lock()
+        # Set once the startup warm-up finished
+        self.warmed = threading.Event()
+        self._prefetched = {topic: registry.counter("prefetched_total", "Keys looked up ahead of a query",
+                                                    topic=topic)
+                            for topic in ("tweets", "users", "hashtags")}
+        self._dropped = registry.counter("prefetch_dropped_total", "Prefetch tasks dropped as the queue was full")
+
+    def submit(self, func: Callable, *args) -> bool:
+        """
+        Function to run func in the background, unless too many tasks are already waiting
+        Returns: Boolean flag indicating whether the task was queued
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+                self.thread.start()
+        try:
+            self.tasks.put_nowait((func, args))
+            return True
+        except queue.Full:
+            self._dropped.inc()
+            return False
+
+    def _run(self) -> None:
+        while True:
+            func, args = self.tasks.get()
+            try:
+                with self.access_log.paused():
+                    func(*args)
+            except Exception:
+                logger.exception(f"Error prefetching with {func.__name__}")
+
+    def warm_up(self) -> None:
+        """
+        Function to start warming up the caches in the background, warmed is set once done
+        """
+        if not self.submit(self._warm_up):
+            self.warmed.set()
+
+    def _warm_up(self) -> None:
+        start = time.perf_counter()
+        warmup_config = config.warmup_config
+        counts = self.access_log.load()
+        try:
+            self.users(self.access_log.hottest(counts, "users", warmup_config["users"]))
+            self.tweets(self.access_log.hottest(counts, "tweets", warmup_config["tweets"]))
+
+            trending = [hashtag for hashtag, _ in self.queries.trending_hashtags.get_top_hashtags()]
+            hot = self.access_log.hottest(counts, "hashtags", warmup_config["hashtags"])
+            for hashtag in dict.fromkeys(trending[:warmup_config["hashtags"]] + hot):
+                self.hashtag(hashtag)
+
+            for signature in self.access_log.hottest(counts, QUERIES, warmup_config["queries"]):
+                if signature[0] == RELEVANT_USERS:
+                    self.relevant_users(*signature[1:])
+        finally:
+            self.warmed.set()
+        logger.info(f"Warmed up caches in {time.perf_counter() - start:.1f}s")
+
+    def users(self, user_ids: List[str]) -> None:
+        """
+        Function to fetch users into the user cache
+        """
+        if user_ids:
+            self._prefetched["users"].inc(len(self.queries.fetch_users(user_ids)))
+
+    def tweets(self, tweet_ids: List[str]) -> None:
+        """
+        Function to fetch tweets into the tweet cache
+        """
+        if tweet_ids:
+            self._prefetched["tweets"].inc(len(self.queries.fetch_tweets(tweet_ids)))
+
+    def hashtag(self, hashtag: str) -> None:
+        """
+        Function to fetch the postings of a hashtag and its first tweets into the caches
+        """
+        tweet_ids = self.queries.fetch_tweet_ids_from_mysql(hashtag)
+        self._prefetched["hashtags"].inc()
+        self.tweets(tweet_ids[:config.cache_config["max_cached_per_query"]])
+
+    def relevant_users(self, user_id: str, limit: int = 10) -> None:
+        """
+        Function to fetch the relevant users of user_id and their tweets into the caches
+        """
+        rows = self.queries.store.relevant_users(user_id, limit=limit, include_tweet=True)
+        self.users([row['id_str'] for row in rows])
+        self.related_tweets(rows)
+
+    def related_tweets(self, rows: List[dict]) -> None:
+        """
+        Function to fetch the tweets of relevant users, the ones get_relevant_tweets_by_user_id returns
+        Args:
+            rows: Relevant users with tweet_list
+        """
+        tweet_ids = list(chain.from_iterable(row['tweet_list'] for row in rows))
+        self.tweets(tweet_ids[:config.cache_config["max_cached_per_query"]])
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from src import config
+from src.follow import FileTailer
+
+
+@pytest.fixture(autouse=True)
+def no_rotate_wait(monkeypatch):
+    monkeypatch.setitem(config.follow_config, "rotate_wait", 0)
+    monkeypatch.setitem(config.follow_config, "pattern", "*.log")
+
+
+def append(path, text):
+    with open(path, 'a') as fp:
+        fp.write(text)
+
+
+def test_rotation_of_a_file(tmp_path):
+    path = str(tmp_path / "tweets.log")
+    append(path, "1\n2\n")
+    tailer = FileTailer(path)
+    assert tailer.read_lines() == ["1", "2"]
+
+    # Appended after the rename, before the next read
+    os.rename(path, path + ".1")
+    append(path + ".1", "3\n")
+    assert tailer.read_lines() == ["3"]
+    # Rotated away, its successor is not created yet
+    assert tailer.read_lines() == []
+    append(path, "4\n")
+    assert tailer.read_lines() == []
+    assert tailer.read_lines() == ["4"]
+    tailer.close()
+
+
+def test_rotation_in_a_directory(tmp_path):
+    first, second = str(tmp_path / "a.log"), str(tmp_path / "b.log")
+    append(first, "1\n")
+    append(str(tmp_path / "ignored.txt"), "x\n")
+    tailer = FileTailer(str(tmp_path))
+    assert tailer.read_lines() == ["1"]
+
+    append(second, "3\n")
+    os.utime(second, (os.stat(first).st_mtime + 1,) * 2)
+    append(first, "2")
+    # The trailing line of the rotated file is complete once it is left unchanged
+    assert tailer.read_lines() == []
+    assert tailer.read_lines() == ["2"]
+    assert tailer.read_lines() == ["3"]
+    assert tailer.read_lines() == []
+    tailer.close()
+
+
+def test_copytruncate_followed_by_appends(tmp_path):
+    path = str(tmp_path / "tweets.log")
+    append(path, "first\nsecond\n")
+    tailer = FileTailer(path)
+    assert tailer.read_lines() == ["first", "second"]
+
+    # Already larger than the offset when read again
+    with open(path, 'w') as fp:
+        fp.write("third line\nfourth line\n")
+    assert tailer.read_lines() == ["third line", "fourth line"]
+    tailer.close()
+
+
+def test_partial_line_is_held_until_complete(tmp_path, monkeypatch):
+    path = str(tmp_path / "tweets.log")
+    append(path, "1\n2")
+    tailer = FileTailer(path)
+    assert tailer.read_lines() == ["1"]
+    assert tailer.read_lines() == []
+    append(path, "2\n")
+    assert tailer.read_lines() == ["22"]
+
+    # Rotated away while incomplete, returned once its file is left unchanged for rotate_wait
+    monkeypatch.setitem(config.follow_config, "rotate_wait", 3600)
+    append(path, "3")
+    os.rename(path, path + ".1")
+    append(path, "4\n")
+    assert tailer.read_lines() == []
+    assert tailer.read_lines() == []
+    monkeypatch.setitem(config.follow_config, "rotate_wait", 0)
+    assert tailer.read_lines() == ["3"]
+    assert tailer.read_lines() == ["4"]
+    tailer.close()
+
+
+def test_resume_from_position(tmp_path):
+    path = str(tmp_path / "tweets.log")
+    append(path, "1\n2\n3")
+    tailer = FileTailer(path)
+    assert tailer.read_lines(max_bytes=2) == ["1"]
+    position = tailer.position
+    tailer.close()
+
+    tailer = FileTailer(path, position=position)
+    assert tailer.read_lines() == ["2"]
+    tailer.close()
+
+    # A file that reused the inode of the checkpointed one is read from its start
+    os.remove(path)
+    append(path, "other\n")
+    tailer = FileTailer(path, position=position)
+    assert tailer.read_lines() == ["other"]
+    tailer.close()
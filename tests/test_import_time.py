@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.import_time import BUDGET_MS, MODULES, measure
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_within_budget(module):
+    # The fastest of three fresh interpreters, the first one may pay for a cold file cache
+    runs = [measure(module) for _ in range(3)]
+
+    assert runs[0][1] == [], f"{module} imports heavy dependencies eagerly"
+    assert 0 < min(ms for ms, _ in runs) <= BUDGET_MS
@@ -0,0 +1,96 @@
+import pytest
+
+from src import config
+from src.invalidation import InvalidationLog, InvalidationSubscriber
+
+
+class FakeCache:
+    def __init__(self):
+        self.evicted = []
+
+    def evict(self, keys):
+        self.evicted.extend(keys)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "invalidation.log")
+
+
+def test_replay_evicts_keys_published_since_the_position(path):
+    log = InvalidationLog(path)
+    subscriber = InvalidationSubscriber(path)
+    # No log yet, every event written later is replayed
+    before = subscriber.position
+    log.publish("tweets", ["1"])
+    log.flush()
+    subscriber.poll()
+    middle = subscriber.position
+    log.publish("tweets", ["2"])
+    log.publish("users", ["1"])
+    log.flush()
+
+    data = {"1": "a", "2": "b", "3": "c"}
+    assert subscriber.replay(middle, data, "tweets")
+    assert data == {"1": "a", "3": "c"}
+
+    assert subscriber.replay(before, data, "tweets")
+    assert data == {"3": "c"}
+
+
+def test_replay_reads_the_rotated_log(path, monkeypatch):
+    log = InvalidationLog(path)
+    subscriber = InvalidationSubscriber(path)
+    log.publish("tweets", ["1"])
+    log.flush()
+    subscriber.poll()
+    position = subscriber.position
+    log.publish("tweets", ["2"])
+    # Rotated once this event is written, the next one alone is smaller
+    monkeypatch.setitem(config.invalidation_config, "max_bytes", position[2] + 1)
+    log.flush()
+    log.publish("tweets", ["3"])
+    log.flush()
+
+    data = {"1": "a", "2": "b", "3": "c"}
+    assert subscriber.replay(position, data, "tweets")
+    assert data == {"1": "a"}
+
+
+def test_replay_fails_once_the_position_was_rotated_away(path, monkeypatch):
+    log = InvalidationLog(path)
+    subscriber = InvalidationSubscriber(path)
+    log.publish("tweets", ["1"])
+    log.flush()
+    subscriber.poll()
+    position = subscriber.position
+    # The process that saved the position exited
+    subscriber.fp.close()
+    # Rotated twice, the file the position points into is gone
+    monkeypatch.setitem(config.invalidation_config, "max_bytes", 1)
+    for key in ["2", "3"]:
+        log.publish("tweets", [key])
+        log.flush()
+    # A new log, which may reuse its inode
+    monkeypatch.setitem(config.invalidation_config, "max_bytes", 1 << 20)
+    log.publish("tweets", ["4"])
+    log.flush()
+
+    assert not InvalidationSubscriber(path).replay(position, {"4": "d"}, "tweets")
+
+
+def test_poll_evicts_published_keys_from_subscribed_caches(path):
+    log = InvalidationLog(path)
+    subscriber = InvalidationSubscriber(path)
+    tweets, users = FakeCache(), FakeCache()
+    subscriber.caches["tweets"].add(tweets)
+    subscriber.caches["users"].add(users)
+
+    log.publish("tweets", ["1", "2"])
+    log.publish("users", ["7"])
+    log.flush()
+    subscriber.poll()
+
+    assert sorted(tweets.evicted) == ["1", "2"]
+    assert users.evicted == ["7"]
+    assert subscriber.version == 1
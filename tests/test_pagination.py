@@ -0,0 +1,44 @@
+import pytest
+
+from src import config
+from src.embedded_store import EmbeddedStore
+
+
+def user(id_str: str, name: str, followers_count) -> dict:
+    return {"id_str": id_str, "name": name, "screen_name": name, "protected": False, "verified": False,
+            "followers_count": followers_count, "friends_count": 0, "listed_count": 0, "favourites_count": 0,
+            "statuses_count": 0, "created_at": "Mon Jan 01 00:00:00 +0000 2024"}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Pages of two rows, so that ties and NULLs straddle page boundaries
+    monkeypatch.setitem(config.query_config, "page_size", 2)
+    store = EmbeddedStore(path=str(tmp_path))
+    followers = [5, None, 3, 5, 0, 5, None, 7, 3]
+    for i, count in enumerate(followers):
+        store.upsert_user(user(str(100 + i), f"bob{i}", count), "2024-01-01 00:00:00")
+    store.upsert_user(user("999", "alice", 10), "2024-01-01 00:00:00")
+    store.flush()
+    return store
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_iter_users_pages_in_sort_order(store, order):
+    rows = list(store.iter_users("bob", sort_by="followers_count", order=order))
+
+    keys = [(row["followers_count"] or 0, row["id_str"]) for row in rows]
+    assert keys == sorted(keys, reverse=order == "desc")
+    # Every matching user exactly once, across page boundaries
+    assert sorted(row["id_str"] for row in rows) == [str(100 + i) for i in range(9)]
+
+
+def test_iter_tweets_by_users_pages_every_tweet_once(store):
+    for i in range(7):
+        store.insert_tweet({"id_str": str(i), "user": "100" if i % 2 else "101", "text": f"tweet {i}",
+                            "created_at": "Mon Jan 01 00:00:00 +0000 2024"})
+    store.flush()
+
+    rows = list(store.iter_tweets_by_users(["100", "101"], fields=["id_str"]))
+
+    assert [row["id_str"] for row in rows] == [str(i) for i in range(7)]
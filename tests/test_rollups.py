@@ -0,0 +1,44 @@
+import pytest
+
+from src.rollups import HyperLogLog, TweetRollups
+
+
+@pytest.mark.parametrize("n", [100, 5000, 200000])
+def test_hyperloglog_estimates_distinct_values(n):
+    hll = HyperLogLog(precision=12)
+    for i in range(n):
+        hll.add(f"user{i}")
+        # Repeated values are not counted again
+        hll.add(f"user{i}")
+
+    # Standard error is 1.04 / sqrt(4096), about 1.6%, allow three of them
+    assert abs(hll.count() - n) <= 0.05 * n
+
+
+def test_hyperloglog_merge_counts_the_union():
+    a, b = HyperLogLog(precision=12), HyperLogLog(precision=12)
+    for i in range(30000):
+        a.add(f"user{i}")
+    for i in range(20000, 50000):
+        b.add(f"user{i}")
+
+    a.merge(HyperLogLog.from_bytes(b.to_bytes()))
+
+    assert abs(a.count() - 50000) <= 0.05 * 50000
+
+
+def test_hyperloglog_merge_rejects_other_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=12).merge(HyperLogLog(precision=10))
+
+
+def test_rollups_count_tweets_by_hour_lang_and_type():
+    rollups = TweetRollups()
+    rollups.add({"created_at": "Mon Jan 01 10:15:00 +0000 2024", "lang": "en", "user": "1",
+                 "entities": {"hashtags": [{"text": "a"}]}})
+    rollups.add({"created_at": "Mon Jan 01 10:45:00 +0000 2024", "lang": "en", "user": "2",
+                 "is_retweet_status": True})
+
+    assert rollups.counts[("2024-01-01 10:00:00", "en", "tweet")] == [1, 0, 1, 0]
+    assert rollups.counts[("2024-01-01 10:00:00", "en", "retweet")] == [1, 0, 0, 0]
+    assert rollups.users["2024-01-01 10:00:00"].count() == 2